@@ -1,14 +1,18 @@
+import time
+
+# Measured from here: imports, configuration and blueprints
+_startup_began = time.monotonic()
+
 import os
 import stat
 import sys
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, g
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from dotenv import load_dotenv
 from datetime import timedelta
 import json
 import uuid
-import traceback
 from src.services.openai_service import generate_manim_code
 from src.services.manim_service import render_video
 from src.models.user import User
@@ -16,15 +20,28 @@ from src.models.video import Video
 from src.api.auth import auth_bp
 from src.api.videos import videos_bp
 from src.utils.db import init_db
+from src.utils.storage import get_video_dir
+from src.services.janitor_service import start_janitor
+from src.cli import register_commands
+from src.services.template_service import get_template_stats
+from src.services.prompt_index import get_prompt_index
+from src.services.model_router import get_model_router
+from src.services.health_service import check_readiness
+from src.utils.metrics import gauge, histogram, render_prometheus, start_metrics_flusher
+from src.utils.log import setup_logging, get_logger, clear_log_context, set_log_context
 
 # Load environment variables
 load_dotenv()
 
+# Before the app is created, so Flask's logger also goes through the log queue
+setup_logging()
+logger = get_logger(__name__)
+
 # Helper function to set directory permissions
 def set_directory_permissions(path):
     """Set directory permissions to be writable by all users (for Docker environments)"""
     try:
-        print(f"Creating directory with permissions: {path}")
+        logger.debug(f"Creating directory with permissions: {path}")
         # First create the directory if it doesn't exist
         os.makedirs(path, exist_ok=True)
         
@@ -33,28 +50,26 @@ def set_directory_permissions(path):
         
         # Verify permissions were set correctly
         mode = os.stat(path).st_mode
-        print(f"Directory {path} permissions: {mode & 0o777:o}")
+        logger.debug(f"Directory {path} permissions: {mode & 0o777:o}")
         return True
     except Exception as e:
-        print(f"ERROR: Could not set permissions on directory {path}: {str(e)}")
-        print(traceback.format_exc())
+        logger.error(f"Could not set permissions on directory {path}: {str(e)}", exc_info=True)
         return False
 
 # Helper function to set file permissions
 def set_file_permissions(path):
     """Set file permissions to be readable/writable by all users"""
     try:
-        print(f"Setting file permissions: {path}")
+        logger.debug(f"Setting file permissions: {path}")
         # Set permissions (0666 = rw-rw-rw-)
         os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IROTH | stat.S_IWOTH)
         
         # Verify permissions were set correctly
         mode = os.stat(path).st_mode
-        print(f"File {path} permissions: {mode & 0o777:o}")
+        logger.debug(f"File {path} permissions: {mode & 0o777:o}")
         return True
     except Exception as e:
-        print(f"ERROR: Could not set permissions on file {path}: {str(e)}")
-        print(traceback.format_exc())
+        logger.error(f"Could not set permissions on file {path}: {str(e)}", exc_info=True)
         return False
 
 app = Flask(__name__)
@@ -72,18 +87,57 @@ app.mongo_db = init_db(app)
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(videos_bp, url_prefix='/api/videos')
 
+# Register maintenance commands (the janitor is started per server process:
+# below for the development server, in gunicorn.conf.py for production)
+register_commands(app)
+
+HTTP_REQUEST_DURATION = histogram("http_request_duration_seconds", "API request latency by endpoint and status",
+                                  ["method", "endpoint", "status"])
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.monotonic()
+    # Server threads are reused across requests
+    clear_log_context()
+    if request.view_args and "video_id" in request.view_args:
+        set_log_context(video_id=request.view_args["video_id"])
+
+@app.after_request
+def observe_request_duration(response):
+    # Label by route (not path) so video IDs don't create a series each
+    started_at = g.get("request_started_at")
+    if started_at is not None:
+        HTTP_REQUEST_DURATION.observe(time.monotonic() - started_at, method=request.method,
+                                      endpoint=request.endpoint or "unmatched", status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics of all worker processes"""
+    return app.response_class(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/healthz')
+def liveness_check():
+    """Liveness probe: the process serves requests (no I/O, no dependency checks)"""
+    return jsonify({"status": "ok"}), 200
+
+@app.route('/readyz')
+def readiness_check():
+    """Readiness probe: MongoDB, storage and OpenAI configuration (results cached per worker)"""
+    ready, checks = check_readiness()
+    return jsonify({"status": "ready" if ready else "not ready", "checks": checks}), 200 if ready else 503
+
 @app.route('/')
 def health_check():
-    # Test directory permissions as part of health check
-    videos_dir = os.path.join(os.getcwd(), "videos")
-    permissions_ok = set_directory_permissions(videos_dir)
-    
     return jsonify({
         "status": "healthy", 
         "message": "Manim AI Video Generator API is running!",
-        "permissions_ok": permissions_ok,
-        "videos_dir": videos_dir,
-        "current_working_dir": os.getcwd()
+        # Code generation served without calling OpenAI (per worker process)
+        "codegen_cache": {
+            "templates": get_template_stats(),
+            "prompt_index": get_prompt_index().stats()
+        },
+        "codegen_models": get_model_router().stats()
     }), 200
 
 @app.route('/api/generate', methods=['POST'])
@@ -108,15 +162,15 @@ def generate_video():
         video_id = str(uuid.uuid4())
         
         # Create a directory for this video with proper permissions
-        video_dir = f"videos/{video_id}"
-        absolute_video_dir = os.path.join(os.getcwd(), video_dir)
+        absolute_video_dir = get_video_dir(video_id)
         
         # Print the absolute path for debugging
-        print(f"Creating video directory: {absolute_video_dir}")
+        logger.debug(f"Creating video directory: {absolute_video_dir}")
         
-        # Ensure the parent videos directory exists with correct permissions
+        # Ensure the parent (shard) directories exist with correct permissions
         parent_dir = os.path.dirname(absolute_video_dir)
         if not os.path.exists(parent_dir):
+            set_directory_permissions(os.path.dirname(parent_dir))
             set_directory_permissions(parent_dir)
         
         # Create and set permissions for the video directory
@@ -126,7 +180,7 @@ def generate_video():
         try:
             # Save the manim code to a Python file
             code_file_path = f"{absolute_video_dir}/animation.py"
-            print(f"Writing code to file: {code_file_path}")
+            logger.debug(f"Writing code to file: {code_file_path}")
             
             with open(code_file_path, "w") as f:
                 f.write(manim_code)
@@ -157,35 +211,29 @@ def generate_video():
             }), 200
             
         except IOError as e:
-            print(f"IOError while writing file: {str(e)}")
-            print(traceback.format_exc())
+            logger.error(f"IOError while writing file: {str(e)}", exc_info=True)
             return jsonify({"error": f"File operation error: {str(e)}"}), 500
             
     except Exception as e:
         error_msg = f"Error generating video: {str(e)}"
-        print(error_msg)
-        print(traceback.format_exc())
+        logger.error(error_msg, exc_info=True)
         return jsonify({"error": error_msg}), 500
 
+# Startup is import-only: services (OpenAI, S3, MongoDB connections) are set
+# up on first use and nothing touches the videos volume. With preload_app the
+# value is measured in the master and inherited by every worker, so workers
+# are combined with max rather than summed.
+STARTUP_DURATION = gauge("app_startup_seconds", "Time taken to import and configure the app", multiprocess_mode="max")
+STARTUP_DURATION.set(round(time.monotonic() - _startup_began, 4))
+logger.info(f"App initialized in {time.monotonic() - _startup_began:.3f}s")
+
 if __name__ == '__main__':
-    print(f"Starting Manim AI Video Generator API")
-    print(f"Current working directory: {os.getcwd()}")
-    print(f"Python version: {sys.version}")
+    logger.info("Starting Manim AI Video Generator API",
+                extra={"cwd": os.getcwd(), "python_version": sys.version})
     
-    # Make sure videos directory exists with proper permissions
-    videos_dir = os.path.join(os.getcwd(), "videos")
-    set_directory_permissions(videos_dir)
-    print(f"Videos directory: {videos_dir}")
-    
-    try:
-        # Create a test file to verify write permissions
-        test_file = os.path.join(videos_dir, "test-permissions.txt")
-        with open(test_file, "w") as f:
-            f.write("Permission test")
-        set_file_permissions(test_file)
-        print("Successfully created test file with correct permissions")
-    except Exception as e:
-        print(f"Warning: Could not create test file: {str(e)}")
+    # Video directories are created when a video is stored (see get_video_dir)
+    start_janitor(app)
+    start_metrics_flusher()
     
-    # Run the app
+    # Run the development server (production uses gunicorn, see gunicorn.conf.py)
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=os.environ.get("DEBUG", "False").lower() == "true")
\ No newline at end of file
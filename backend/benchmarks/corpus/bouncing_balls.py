@@ -0,0 +1,16 @@
+from manim import *
+
+
+class BouncingBalls(Scene):
+    def construct(self):
+        floor = Line(LEFT * 6, RIGHT * 6).shift(DOWN * 3)
+        balls = VGroup(*[
+            Circle(radius=0.3, color=color, fill_opacity=1).shift(LEFT * 4 + RIGHT * 2 * i + UP * 2)
+            for i, color in enumerate([RED, ORANGE, YELLOW, GREEN, BLUE])
+        ])
+        self.add(floor)
+        self.play(FadeIn(balls))
+        for _ in range(3):
+            self.play(balls.animate.shift(DOWN * 4.7), run_time=0.6, rate_func=rate_functions.ease_in_quad)
+            self.play(balls.animate.shift(UP * 4.7), run_time=0.6, rate_func=rate_functions.ease_out_quad)
+        self.wait(0.5)
@@ -0,0 +1,11 @@
+from manim import *
+
+
+class CircleToSquare(Scene):
+    def construct(self):
+        circle = Circle(radius=1.5, color=BLUE)
+        square = Square(side_length=3, color=GREEN)
+        self.play(Create(circle))
+        self.play(Transform(circle, square))
+        self.play(Rotate(circle, angle=PI / 2))
+        self.play(FadeOut(circle))
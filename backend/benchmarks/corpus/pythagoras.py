@@ -0,0 +1,11 @@
+from manim import *
+
+
+class Pythagoras(Scene):
+    def construct(self):
+        triangle = Polygon(ORIGIN, RIGHT * 3, UP * 2, color=WHITE)
+        equation = MathTex("a^2", "+", "b^2", "=", "c^2").to_edge(UP)
+        self.play(Create(triangle))
+        self.play(Write(equation))
+        self.play(Indicate(equation[4]))
+        self.wait(0.5)
@@ -0,0 +1,13 @@
+from manim import *
+
+
+class SineWave(Scene):
+    def construct(self):
+        axes = Axes(x_range=[-4, 4, 1], y_range=[-1.5, 1.5, 0.5], x_length=10, y_length=4)
+        graph = axes.plot(lambda x: np.sin(x), color=YELLOW)
+        dot = Dot(axes.c2p(-4, np.sin(-4)), color=RED)
+        self.play(Create(axes))
+        self.play(Create(graph), run_time=2)
+        self.add(dot)
+        self.play(MoveAlongPath(dot, graph), run_time=3, rate_func=linear)
+        self.wait(0.5)
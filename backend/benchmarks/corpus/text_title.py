@@ -0,0 +1,11 @@
+from manim import *
+
+
+class TextTitle(Scene):
+    def construct(self):
+        title = Text("Gradient Descent", font_size=64)
+        subtitle = Text("one step at a time", font_size=32).next_to(title, DOWN)
+        self.play(Write(title))
+        self.play(FadeIn(subtitle, shift=UP))
+        self.wait(0.5)
+        self.play(FadeOut(title), FadeOut(subtitle))
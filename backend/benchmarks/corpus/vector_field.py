@@ -0,0 +1,14 @@
+from manim import *
+
+
+class RotatingVectors(Scene):
+    def construct(self):
+        plane = NumberPlane()
+        vectors = VGroup(*[
+            Arrow(ORIGIN, np.array([np.cos(angle), np.sin(angle), 0]) * 2, buff=0, color=BLUE)
+            for angle in np.linspace(0, TAU, 8, endpoint=False)
+        ])
+        self.play(Create(plane), run_time=1)
+        self.play(GrowFromCenter(vectors))
+        self.play(Rotate(vectors, angle=PI, about_point=ORIGIN), run_time=2)
+        self.wait(0.5)
@@ -0,0 +1,149 @@
+"""
+OpenAI-compatible stub serving recorded completions from the scene corpus
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1. Every
+chat completion request is answered with the corpus scene whose prompt
+appears in the user message (falling back to a stable pick by hash), after
+a configurable latency.
+
+    python -m benchmarks.openai_stub --port 8089 --latency 1.5 --jitter 0.5
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """
+    Load the benchmark scenes
+
+    Returns:
+        list: {"prompt", "scene", "code"} for every scene of the corpus
+    """
+    with open(os.path.join(corpus_dir, "prompts.json")) as f:
+        entries = json.load(f)
+
+    for entry in entries:
+        with open(os.path.join(corpus_dir, entry["scene"])) as f:
+            entry["code"] = f.read()
+
+    return entries
+
+
+class OpenAIStub:
+    """Threaded HTTP server answering /v1/chat/completions from the corpus"""
+
+    def __init__(self, corpus, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def pick_scene(self, user_message):
+        """The scene whose prompt is part of the message, or a stable pick by hash"""
+        for entry in self.corpus:
+            if entry["prompt"] in user_message:
+                return entry
+        digest = int(hashlib.sha256(user_message.encode()).hexdigest(), 16)
+        return self.corpus[digest % len(self.corpus)]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                with stub._lock:
+                    stub.requests += 1
+
+                payload = json.loads(body or b"{}")
+                delay = max(0.0, stub.latency + random.uniform(-stub.jitter, stub.jitter))
+                time.sleep(delay)
+
+                if stub.error_rate and random.random() < stub.error_rate:
+                    self._reply(503, {"error": {"message": "Simulated overload", "type": "server_error"}})
+                    return
+
+                user_message = next((message["content"] for message in payload.get("messages", [])
+                                     if message.get("role") == "user"), "")
+                entry = stub.pick_scene(user_message)
+                choices = [{
+                    "index": index,
+                    "message": {"role": "assistant", "content": f"```python\n{entry['code']}```"},
+                    "finish_reason": "stop"
+                } for index in range(max(1, int(payload.get("n", 1))))]
+
+                self._reply(200, {
+                    "id": f"chatcmpl-{os.urandom(6).hex()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "stub"),
+                    "choices": choices,
+                    "usage": {"prompt_tokens": len(user_message.split()), "completion_tokens": len(entry["code"].split())}
+                })
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="openai-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    args = parser.parse_args()
+
+    stub = OpenAIStub(load_corpus(), args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"OpenAI stub listening on {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
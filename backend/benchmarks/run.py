@@ -0,0 +1,414 @@
+"""
+Offline end-to-end benchmark of the video generation pipeline
+
+Runs the Flask app in-process against the OpenAI stub, the S3 stub and
+mongomock (or a real MongoDB with --mongodb-uri), with real CPU-only manim
+renders of the scene corpus. For every concurrency level, virtual users
+generate videos through POST /api/videos/generate, poll GET /api/videos/<id>
+until the final quality is published and fetch GET /api/videos/<id>/file.
+
+Reports throughput, p50/p95/p99 latency per endpoint and per pipeline stage
+(from the timings recorded on each video) and peak RSS of the server and its
+manim processes, and saves everything as JSON for comparison across commits.
+
+    cd backend
+    python -m benchmarks.run --concurrency 1,2,4 --llm-latency 1.5
+    python -m benchmarks.run --compare benchmarks/results/<previous>.json
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import socket
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.openai_stub import OpenAIStub, load_corpus
+from benchmarks.s3_stub import S3Stub
+
+BUCKET = "benchmark"
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    """Count, mean and p50/p95/p99 of a list of seconds"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4)
+    }
+
+
+class RssSampler:
+    """Samples the resident memory of this process and its descendants (manim renders)"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _rss_bytes(pid):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    @staticmethod
+    def _descendants(root_pid):
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces, the parent PID follows it
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+
+        pids, pending = [], [root_pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, []))
+        return pids
+
+    def sample(self):
+        if os.path.isdir("/proc"):
+            total = sum(self._rss_bytes(pid) for pid in self._descendants(os.getpid()))
+        else:
+            # Without procfs only the peak of this process is known (kilobytes on Linux, bytes on macOS)
+            scale = 1 if sys.platform == "darwin" else 1024
+            total = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        self.peak_bytes = max(self.peak_bytes, total)
+
+    def __enter__(self):
+        def loop():
+            while not self._stop.wait(self.interval):
+                self.sample()
+
+        self.sample()
+        self._thread = threading.Thread(target=loop, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def configure_environment(args, openai_stub, s3_stub, workdir):
+    """Point the app at the stubs and a scratch working directory (before it is imported)"""
+    os.environ.update({
+        "OPENAI_API_KEY": "bench-openai-key",
+        "OPENAI_BASE_URL": openai_stub.base_url,
+        "CLOUDFLARE_R2_ENDPOINT": s3_stub.endpoint_url,
+        "CLOUDFLARE_R2_BUCKET_NAME": BUCKET,
+        "CLOUDFLARE_R2_ACCESS_KEY_ID": "bench-access-key",
+        "CLOUDFLARE_R2_SECRET_ACCESS_KEY": "bench-secret-key",
+        "CLOUDFLARE_R2_PUBLIC_URL": s3_stub.public_url(BUCKET),
+        "AWS_DEFAULT_REGION": "auto",
+        "VIDEOS_DIR": os.path.join(workdir, "videos"),
+        "RENDER_SCRATCH_DIR": os.path.join(workdir, "scratch"),
+        "RENDER_CACHE_DIR": os.path.join(workdir, "render_cache"),
+        "RENDER_CACHE_ENABLED": "false" if args.cold else "true",
+        # Measure the full pipeline unless the code generation caches are asked for
+        "TEMPLATES_ENABLED": "true" if args.codegen_cache else "false",
+        "PROMPT_INDEX_ENABLED": "true" if args.codegen_cache else "false",
+        "TRACE_EXPORT": "",
+        "JWT_SECRET_KEY": "bench-jwt-secret"
+    })
+    os.environ.pop("METRICS_DIR", None)
+    if args.mongodb_uri:
+        os.environ["MONGODB_URI"] = args.mongodb_uri
+
+
+def start_server(flask_app):
+    """Serve the app on a free local port with werkzeug's threaded server"""
+    from werkzeug.serving import make_server
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = make_server("127.0.0.1", port, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def create_users(flask_app, count, tier):
+    """Create benchmark users and return their access tokens"""
+    from flask_jwt_extended import create_access_token
+    from src.models.user import User
+
+    tokens = []
+    with flask_app.app_context():
+        for index in range(count):
+            user = User(email=f"bench-{os.urandom(4).hex()}-{index}@example.com", password="benchmark",
+                        name=f"Benchmark {index}", subscription_tier=tier)
+            user.save()
+            tokens.append(create_access_token(identity=user.id))
+    return tokens
+
+
+def run_job(session, base_url, token, prompt, args, latencies, lock):
+    """Generate one video like a client would and record the latency of every call"""
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def timed(endpoint, method, url, **kwargs):
+        started = time.monotonic()
+        response = session.request(method, url, headers=headers, timeout=args.timeout, **kwargs)
+        with lock:
+            latencies.setdefault(endpoint, []).append(time.monotonic() - started)
+        return response
+
+    started = time.monotonic()
+    response = timed("POST /api/videos/generate", "POST", f"{base_url}/api/videos/generate", json={"prompt": prompt})
+    video_id = (response.json() or {}).get("video_id") if response.headers.get("Content-Type", "").startswith("application/json") else None
+    if not video_id:
+        return {"status": "error", "http_status": response.status_code}
+
+    status = (response.json() or {}).get("status")
+    deadline = started + args.timeout
+    while status not in FINAL_STATUSES and time.monotonic() < deadline:
+        time.sleep(args.poll_interval)
+        status = timed("GET /api/videos/<id>", "GET", f"{base_url}/api/videos/{video_id}").json().get("status")
+
+    # Background work (final render, HLS packaging) is part of the time to a finished video
+    time_to_final = time.monotonic() - started
+    if status == "completed":
+        timed("GET /api/videos/<id>/file", "GET", f"{base_url}/api/videos/{video_id}/file", allow_redirects=False)
+
+    return {"status": status or "timeout", "video_id": video_id, "time_to_final": time_to_final}
+
+
+def run_level(flask_app, base_url, tokens, corpus, concurrency, args):
+    """Run one concurrency level and return its report"""
+    import requests
+    from src.utils.background import active_background_jobs
+
+    jobs = queue.Queue()
+    total = args.requests or max(len(corpus), 2 * concurrency)
+    for index in range(total):
+        jobs.put(corpus[index % len(corpus)]["prompt"])
+
+    latencies, results, lock = {}, [], threading.Lock()
+
+    def virtual_user(token):
+        session = requests.Session()
+        while True:
+            try:
+                prompt = jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = run_job(session, base_url, token, prompt, args, latencies, lock)
+            except Exception as e:
+                result = {"status": "error", "error": str(e)}
+            with lock:
+                results.append(result)
+
+    started = time.monotonic()
+    with RssSampler() as rss:
+        users = [threading.Thread(target=virtual_user, args=(tokens[index],)) for index in range(concurrency)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        # Let the HLS packaging started after the last videos finish too
+        while active_background_jobs() and time.monotonic() - started < args.timeout:
+            time.sleep(0.2)
+    wall_seconds = time.monotonic() - started
+
+    completed = [result for result in results if result["status"] == "completed"]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "statuses": {status: sum(1 for result in results if result["status"] == status)
+                     for status in sorted({result["status"] for result in results})},
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_minute": round(len(completed) / wall_seconds * 60, 3) if wall_seconds else None,
+        "latency": {endpoint: summarize(values) for endpoint, values in sorted(latencies.items())},
+        "time_to_final": summarize([result["time_to_final"] for result in completed]),
+        "stages": stage_report(flask_app, [result["video_id"] for result in results if result.get("video_id")]),
+        "peak_rss_mb": round(rss.peak_bytes / 2 ** 20, 1)
+    }
+
+
+def stage_report(flask_app, video_ids):
+    """p50/p95/p99 seconds per pipeline and stage, from the timings recorded on the videos"""
+    samples = {}
+    with flask_app.app_context():
+        for video_data in flask_app.mongo_db.videos.find({"_id": {"$in": video_ids}}, {"timings": 1}):
+            for pipeline, timings in (video_data.get("timings") or {}).items():
+                for stage, seconds in timings.items():
+                    samples.setdefault(pipeline, {}).setdefault(stage, []).append(seconds)
+
+    return {pipeline: {stage: summarize(values) for stage, values in sorted(stages.items())}
+            for pipeline, stages in sorted(samples.items())}
+
+
+def git_revision():
+    """Commit of the tree being benchmarked, and whether it has local changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_report(report, baseline=None):
+    """Print the main figures of a report, with the change against a baseline report"""
+    baseline_levels = {level["concurrency"]: level for level in (baseline or {}).get("levels", [])}
+
+    def change(value, previous):
+        if previous in (None, 0) or value is None:
+            return ""
+        return f" ({(value - previous) / previous * 100:+.0f}%)"
+
+    for level in report["levels"]:
+        previous = baseline_levels.get(level["concurrency"], {})
+        print(f"\nconcurrency {level['concurrency']}: {level['completed']}/{level['requests']} completed "
+              f"in {level['wall_seconds']:.1f}s, {level['throughput_per_minute']} videos/min"
+              f"{change(level['throughput_per_minute'], previous.get('throughput_per_minute'))}, "
+              f"peak RSS {level['peak_rss_mb']} MB{change(level['peak_rss_mb'], previous.get('peak_rss_mb'))}")
+
+        rows = dict(level["latency"])
+        rows["time to final video"] = level["time_to_final"]
+        previous_rows = dict(previous.get("latency", {}))
+        previous_rows["time to final video"] = previous.get("time_to_final", {})
+        for pipeline, stages in level["stages"].items():
+            for stage, summary in stages.items():
+                rows[f"{pipeline}.{stage}"] = summary
+                previous_rows[f"{pipeline}.{stage}"] = previous.get("stages", {}).get(pipeline, {}).get(stage, {})
+
+        for name, summary in rows.items():
+            if not summary.get("count"):
+                continue
+            before = previous_rows.get(name, {})
+            print(f"  {name:<34} n={summary['count']:<4} p50 {summary['p50']:>8.3f}s"
+                  f"{change(summary['p50'], before.get('p50')):<7} p95 {summary['p95']:>8.3f}s"
+                  f"{change(summary['p95'], before.get('p95')):<7} p99 {summary['p99']:>8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=0,
+                        help="Videos per level (default: the corpus size or twice the concurrency)")
+    parser.add_argument("--tier", default="free", choices=["free", "basic", "premium"])
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds per stub completion")
+    parser.add_argument("--llm-jitter", type=float, default=0.25)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="Seconds added to every stub upload")
+    parser.add_argument("--mongodb-uri", help="Use a real MongoDB (e.g. a local mongod) instead of mongomock")
+    parser.add_argument("--cold", action="store_true", help="Disable the shared partial movie cache")
+    parser.add_argument("--codegen-cache", action="store_true",
+                        help="Keep the template library and prompt index enabled")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds allowed per video")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    args = parser.parse_args()
+
+    if not shutil.which("manim"):
+        parser.error("manim is not installed (the benchmark renders the corpus with the real CLI)")
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    corpus = load_corpus()
+    workdir = tempfile.mkdtemp(prefix="manim-benchmark-")
+    openai_stub = OpenAIStub(corpus, latency=args.llm_latency, jitter=args.llm_jitter,
+                             error_rate=args.llm_error_rate).start()
+    s3_stub = S3Stub(os.path.join(workdir, "s3"), latency=args.s3_latency).start()
+    configure_environment(args, openai_stub, s3_stub, workdir)
+
+    startup_started = time.monotonic()
+    import app as app_module
+    flask_app = app_module.app
+    if not args.mongodb_uri:
+        import mongomock
+        flask_app.mongo_db = mongomock.MongoClient().db
+    startup_seconds = time.monotonic() - startup_started
+
+    server, base_url = start_server(flask_app)
+    tokens = create_users(flask_app, max(levels), args.tier)
+
+    commit, dirty = git_revision()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "startup_seconds": round(startup_seconds, 3),
+        "levels": []
+    }
+
+    try:
+        for concurrency in levels:
+            print(f"Running concurrency {concurrency}...")
+            report["levels"].append(run_level(flask_app, base_url, tokens, corpus, concurrency, args))
+    finally:
+        server.shutdown()
+        openai_stub.stop()
+        s3_stub.stop()
+        report["openai_requests"] = openai_stub.requests
+        report["s3_bytes_uploaded"] = s3_stub.bytes_received
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report["baseline"] = {"file": args.compare, "commit": baseline.get("commit")}
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{commit or 'unknown'}{'-dirty' if dirty else ''}-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Minimal S3-compatible stand-in for R2, storing objects in a local directory
+
+Implements what s3_service uses (PutObject, HeadObject, GetObject,
+DeleteObject, ListObjectsV2, DeleteObjects) with path-style addressing and
+no authentication. GET requests also serve as the public URL of the bucket.
+
+    python -m benchmarks.s3_stub --port 9000 --root /tmp/s3-stub
+"""
+import os
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+import mimetypes
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def _decode_aws_chunked(data):
+    """Strip the chunk framing of an aws-chunked body (used by newer botocore for checksums)"""
+    decoded = bytearray()
+    position = 0
+    while True:
+        line_end = data.index(b"\r\n", position)
+        size = int(data[position:line_end].split(b";", 1)[0], 16)
+        if size == 0:
+            return bytes(decoded)
+        start = line_end + 2
+        decoded += data[start:start + size]
+        position = start + size + 2
+
+
+class S3Stub:
+    """Threaded HTTP server keeping buckets as directories under root"""
+
+    def __init__(self, root=None, host="127.0.0.1", port=0, latency=0.0):
+        self.root = root or tempfile.mkdtemp(prefix="s3-stub-")
+        self.latency = latency
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def public_url(self, bucket):
+        return f"{self.endpoint_url}/{bucket}"
+
+    def _path(self, bucket, key=""):
+        path = os.path.realpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.realpath(self.root) + os.sep):
+            raise ValueError("Key escapes the stub root")
+        return path
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _target(self):
+                parts = urlsplit(self.path)
+                bucket, _, key = parts.path.lstrip("/").partition("/")
+                return unquote(bucket), unquote(key), parse_qs(parts.query, keep_blank_values=True)
+
+            def _body(self):
+                if "chunked" in self.headers.get("Transfer-Encoding", ""):
+                    data = bytearray()
+                    while True:
+                        size = int(self.rfile.readline().split(b";", 1)[0], 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        data += self.rfile.read(size)
+                        self.rfile.readline()
+                    data = bytes(data)
+                else:
+                    data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+                    data = _decode_aws_chunked(data)
+                return data
+
+            def _reply(self, status, body=b"", content_type="application/xml", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _not_found(self, key):
+                body = f"<Error><Code>NoSuchKey</Code><Key>{escape(key)}</Key></Error>".encode()
+                self._reply(404, body)
+
+            def do_PUT(self):
+                bucket, key, _ = self._target()
+                data = self._body()
+                if stub.latency:
+                    time.sleep(stub.latency)
+                path = stub._path(bucket, key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+                with stub._lock:
+                    stub.bytes_received += len(data)
+                self._reply(200, headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+
+            def do_GET(self):
+                bucket, key, query = self._target()
+                if not key and "list-type" in query:
+                    self._list(bucket, query)
+                    return
+                path = stub._path(bucket, key)
+                if not os.path.isfile(path):
+                    self._not_found(key)
+                    return
+                with open(path, "rb") as f:
+                    data = f.read()
+                content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+                self._reply(200, data, content_type)
+
+            def do_HEAD(self):
+                bucket, key, _ = self._target()
+                path = stub._path(bucket, key)
+                if not os.path.isfile(path):
+                    self._reply(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(os.path.getsize(path)))
+                self.end_headers()
+
+            def do_DELETE(self):
+                bucket, key, _ = self._target()
+                try:
+                    os.remove(stub._path(bucket, key))
+                except FileNotFoundError:
+                    pass
+                self._reply(204)
+
+            def do_POST(self):
+                bucket, _, query = self._target()
+                if "delete" not in query:
+                    self._reply(400, b"<Error><Code>NotImplemented</Code></Error>")
+                    return
+                document = ElementTree.fromstring(self._body())
+                deleted = []
+                for element in document.iter():
+                    if element.tag.endswith("Key"):
+                        try:
+                            os.remove(stub._path(bucket, element.text))
+                        except FileNotFoundError:
+                            pass
+                        deleted.append(f"<Deleted><Key>{escape(element.text)}</Key></Deleted>")
+                self._reply(200, f"<DeleteResult>{''.join(deleted)}</DeleteResult>".encode())
+
+            def _list(self, bucket, query):
+                prefix = query.get("prefix", [""])[0]
+                bucket_dir = stub._path(bucket)
+                contents = []
+                for dirpath, _, filenames in os.walk(bucket_dir):
+                    for filename in filenames:
+                        path = os.path.join(dirpath, filename)
+                        key = os.path.relpath(path, bucket_dir).replace(os.sep, "/")
+                        if key.startswith(prefix):
+                            contents.append(f"<Contents><Key>{escape(key)}</Key>"
+                                            f"<Size>{os.path.getsize(path)}</Size></Contents>")
+                body = (f"<ListBucketResult><Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+                        f"<KeyCount>{len(contents)}</KeyCount><IsTruncated>false</IsTruncated>"
+                        f"{''.join(sorted(contents))}</ListBucketResult>")
+                self._reply(200, body.encode())
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="s3-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--root", help="Directory holding the buckets (default: a temporary directory)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every upload")
+    args = parser.parse_args()
+
+    stub = S3Stub(args.root, args.host, args.port, args.latency)
+    print(f"S3 stub listening on {stub.endpoint_url}, storing objects in {stub.root}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
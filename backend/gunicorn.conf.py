@@ -0,0 +1,119 @@
+"""
+Gunicorn configuration for production (gunicorn --config gunicorn.conf.py wsgi:app)
+
+Every setting can be overridden with the environment variable next to it.
+"""
+import os
+import glob
+import time
+import signal
+import tempfile
+
+cpu_count = os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Requests mostly wait on OpenAI, manim subprocesses and long polls, so each
+# worker serves many of them on threads. gthread needs no extra dependency;
+# an async worker class (e.g. gevent) can be used where it is installed.
+workers = int(os.environ.get("GUNICORN_WORKERS", max(2, cpu_count)))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+
+# Render slots are per process: share the CPUs between the workers instead of
+# letting every worker start one manim process per CPU
+os.environ.setdefault("MAX_CONCURRENT_RENDERS", str(max(1, cpu_count // workers)))
+
+# Every worker publishes its metrics here so /metrics reports all of them
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "manim-metrics"))
+
+# Import the app (templates, config, blueprints) once in the master and fork
+# it; database connections are only opened in the workers, on first use
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Heartbeat timeout of a silent worker; synchronous /generate requests run on
+# threads and are not limited by it
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = 5
+
+# On shutdown, workers stop accepting requests and get this long to finish
+# in-flight requests and background render jobs before they are killed
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 600))
+
+# Part of the graceful timeout kept to cancel the renders still running at the
+# end of the drain and mark their videos as failed before the worker is killed
+drain_margin = int(os.environ.get("GUNICORN_DRAIN_MARGIN", 15))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    """Drop the metrics snapshots of a previous run"""
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "metrics-*.json*")):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    """Start the per-process background threads, which don't survive the fork"""
+    from app import app
+    from src.services.janitor_service import start_janitor
+    from src.utils.metrics import start_metrics_flusher
+    from src.utils.log import setup_logging
+
+    # The log writer thread of the master is not running in the worker
+    setup_logging()
+    start_janitor(app)
+    start_metrics_flusher()
+
+
+def post_worker_init(worker):
+    """Record when the worker is told to shut down: the graceful timeout runs from there"""
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        _shutdown_requested(worker)
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_int(worker):
+    """SIGINT/SIGQUIT: the master kills the worker right away, so there is nothing to drain"""
+    worker.shutdown_requested_at = time.monotonic() - graceful_timeout
+
+
+def _shutdown_requested(worker):
+    if getattr(worker, "shutdown_requested_at", None) is None:
+        worker.shutdown_requested_at = time.monotonic()
+
+
+def worker_exit(server, worker):
+    """Drain background render jobs before the worker process exits"""
+    from app import app
+    from src.models.video import Video
+    from src.models.video_code import VideoCode
+    from src.services.manim_service import cancel_all_renders
+    from src.utils.background import active_background_jobs
+
+    # In-flight requests were drained first; the master kills the worker
+    # graceful_timeout seconds after the shutdown signal, whatever it is doing
+    _shutdown_requested(worker)
+    deadline = worker.shutdown_requested_at + max(graceful_timeout - drain_margin, 0)
+    while active_background_jobs() and time.monotonic() < deadline:
+        server.log.info(f"Worker {worker.pid} waiting for {active_background_jobs()} background jobs")
+        time.sleep(min(2, max(deadline - time.monotonic(), 0)))
+
+    if not active_background_jobs():
+        return
+
+    server.log.warning(f"Worker {worker.pid} exiting with {active_background_jobs()} background jobs still running")
+    video_ids = cancel_all_renders()
+    if not video_ids:
+        return
+    with app.app_context():
+        failed_ids = Video.fail_interrupted(video_ids)
+        for video_id in failed_ids:
+            VideoCode.record_render_error(video_id, "The server shut down before the render finished")
+    server.log.warning(f"Worker {worker.pid} marked {len(failed_ids)} interrupted videos as failed")
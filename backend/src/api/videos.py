@@ -1,14 +1,163 @@
 import os
-from flask import Blueprint, request, jsonify, send_file, current_app, redirect
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import zipfile
+import threading
+from datetime import datetime
+from flask import Blueprint, request, jsonify, send_file, current_app, redirect, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.video import Video
+from src.models.video_code import VideoCode
 from src.models.user import User
 from src.services.openai_service import generate_manim_code
-from src.services.manim_service import render_video
+from src.services.manim_service import (
+    render_video, cancel_render, check_manim_code, validate_manim_code, RenderCancelled,
+    RENDER_SCRATCH_DIR, SCRATCH_PREFIX
+)
 from src.services.s3_service import get_s3_service
+from src.services.ffmpeg_service import generate_thumbnails, package_hls
+from src.services.prompt_index import index_rendered_video, get_prompt_index
+from src.utils.tiers import get_tier_settings
+from src.utils.background import run_in_background
+from src.utils.tracing import traced, span, set_trace_attribute
+from src.utils.log import get_logger, set_log_context
+from src.utils.response_cache import get_response_cache
+from src.utils.zip_stream import stream_zip, read_file_chunks
+from src.utils.storage import get_video_dir, find_video_dir
+from src.services.janitor_service import delete_intermediates
 
 videos_bp = Blueprint('videos', __name__)
 
+logger = get_logger(__name__)
+
+# Maximum size of user-edited manim code
+MAX_CODE_LENGTH = 100000
+
+# Maximum number of videos per bulk status request
+STATUS_MAX_IDS = int(os.environ.get("STATUS_MAX_IDS", 100))
+
+# Long polls of /status: maximum hold time, how often other worker processes'
+# updates are picked up, and how many requests may be held at once per process
+# (each holds a server thread; beyond that, requests are answered right away)
+LONG_POLL_MAX_SECONDS = float(os.environ.get("LONG_POLL_MAX_SECONDS", 30))
+LONG_POLL_INTERVAL = float(os.environ.get("LONG_POLL_INTERVAL", 2))
+LONG_POLL_MAX_WAITERS = int(os.environ.get("LONG_POLL_MAX_WAITERS", 8))
+_long_poll_slots = threading.BoundedSemaphore(LONG_POLL_MAX_WAITERS)
+
+# Bulk export: maximum videos per archive and size of the streamed chunks
+EXPORT_MAX_VIDEOS = int(os.environ.get("EXPORT_MAX_VIDEOS", 500))
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 1024 * 1024))
+
+# Metadata and code responses carry an ETag derived from the video's version:
+# clients revalidate them, except URLs pinned to the current version of a
+# completed video (?version=N), which never change
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+PINNED_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# Content types of the files of an HLS packaging
+HLS_CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t"
+}
+
+
+def _video_etag(kind, video_id, version):
+    return f"{kind}-{video_id}-{version}"
+
+
+def _send_cached_response(entry):
+    """Send a serialized response with its validators (304 if the client's copy matches)"""
+    response = current_app.response_class(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    response.last_modified = entry["last_modified"]
+    pinned = entry["status"] == "completed" and request.args.get("version") == str(entry["version"])
+    response.headers["Cache-Control"] = PINNED_CACHE_CONTROL if pinned else REVALIDATE_CACHE_CONTROL
+    
+    return response.make_conditional(request)
+
+
+def _conditional_video_response(kind, video_id, render):
+    """
+    Serve a representation of a video conditionally
+    
+    Clients holding the current version get a 304 from a projected version
+    lookup, without loading the document. Responses of completed videos are
+    kept serialized in the process' response cache, so repeat views skip
+    MongoDB (for RESPONSE_CACHE_TTL) and JSON encoding.
+    
+    Args:
+        kind (str): Name of the representation, part of the ETag and cache key
+        video_id (str): ID of the video
+        render (callable): Called with the Video, returns (payload, status code)
+        
+    Returns:
+        Response: The response
+    """
+    user_id = get_jwt_identity()
+    cache = get_response_cache()
+    key = (kind, video_id)
+    
+    entry = cache.get(key)
+    if entry is None:
+        state = Video.find_version(video_id)
+        if not state:
+            return jsonify({"error": "Video not found"}), 404
+        if state["user_id"] != user_id:
+            return jsonify({"error": "You don't have permission to access this video"}), 403
+        
+        etag = _video_etag(kind, video_id, state["version"])
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+            return response
+        
+        entry = cache.revalidate(key, state["version"])
+    
+    if entry is not None:
+        if entry["user_id"] != user_id:
+            return jsonify({"error": "You don't have permission to access this video"}), 403
+        return _send_cached_response(entry)
+    
+    video = Video.find_by_id(video_id)
+    if not video:
+        return jsonify({"error": "Video not found"}), 404
+    
+    payload, status = render(video)
+    if status != 200:
+        return jsonify(payload), status
+    
+    entry = {
+        "body": current_app.json.dumps(payload) + "\n",
+        "etag": _video_etag(kind, video.id, video.version),
+        "last_modified": video.updated_at,
+        "user_id": video.user_id,
+        "version": video.version,
+        "status": video.status
+    }
+    # Videos still rendering change too often to be worth caching
+    if video.status == "completed":
+        cache.put(key, entry)
+    
+    return _send_cached_response(entry)
+
+
+def _record_timings(trace):
+    """Store the stage timings of a finished pipeline run on its video"""
+    video_id = trace.attributes.get("video_id")
+    if video_id:
+        Video.record_timings(video_id, trace.name, trace.stage_timings())
+
+
+def _page_etag(versions):
+    """ETag of a page of videos from the (ID, version) of each of them"""
+    encoded = json.dumps(versions)
+    return "videos-" + hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
 @videos_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_videos():
@@ -22,38 +171,186 @@ def get_videos():
     # Calculate skip
     skip = (page - 1) * per_page
     
+    # The page is unchanged if the same videos are at the same versions
+    versions = Video.find_versions_by_user_id(user_id, limit=per_page, skip=skip)
+    if request.if_none_match.contains(_page_etag(versions)):
+        response = current_app.response_class(status=304)
+        response.set_etag(_page_etag(versions))
+        response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return response
+    
     # Get videos for user
     videos = Video.find_by_user_id(user_id, limit=per_page, skip=skip)
     
     # Convert videos to dict
     videos_dict = [video.to_dict() for video in videos]
     
-    return jsonify(videos_dict), 200
+    response = jsonify(videos_dict)
+    response.set_etag(_page_etag([(video.id, video.version) for video in videos]))
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return response
 
 
-@videos_bp.route('/<video_id>', methods=['GET'])
+def _status_fingerprint(statuses):
+    """Short hash of the status fields of a set of videos, changing with any of them"""
+    encoded = json.dumps(statuses, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+@videos_bp.route('/status', methods=['GET'])
 @jwt_required()
-def get_video(video_id):
-    """Get a specific video"""
+def get_video_statuses():
+    """
+    Get the status of several videos in one request
+    
+    Query parameters:
+        ids: Comma-separated video IDs
+        wait: Seconds to hold the request until one of the videos changes
+              (long poll, at most LONG_POLL_MAX_SECONDS)
+        since: Fingerprint of a previous response; a long poll returns as soon
+               as the videos no longer match it (defaults to their current state)
+    """
     user_id = get_jwt_identity()
     
-    # Get video by ID
-    video = Video.find_by_id(video_id)
+    video_ids = list(dict.fromkeys(video_id for video_id in request.args.get('ids', '').split(',') if video_id))
+    if not video_ids:
+        return jsonify({"error": "Missing ids"}), 400
+    if len(video_ids) > STATUS_MAX_IDS:
+        return jsonify({"error": f"At most {STATUS_MAX_IDS} ids per request"}), 400
     
-    if not video:
-        return jsonify({"error": "Video not found"}), 404
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), LONG_POLL_MAX_SECONDS)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
     
-    # Check if video belongs to user
-    if video.user_id != user_id:
-        return jsonify({"error": "You don't have permission to access this video"}), 403
+    # Count updates before querying, so one landing in between isn't missed
+    seen = Video.change_count()
+    statuses = Video.find_statuses(user_id, video_ids)
+    fingerprint = _status_fingerprint(statuses)
+    baseline = request.args.get('since') or fingerprint
+    
+    if wait and fingerprint == baseline and _long_poll_slots.acquire(blocking=False):
+        try:
+            deadline = time.monotonic() + wait
+            while fingerprint == baseline:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Woken early by updates of this process; updates of other
+                # workers are seen at the next re-query
+                Video.wait_for_change(seen, min(remaining, LONG_POLL_INTERVAL))
+                seen = Video.change_count()
+                statuses = Video.find_statuses(user_id, video_ids)
+                fingerprint = _status_fingerprint(statuses)
+        finally:
+            _long_poll_slots.release()
+    
+    return jsonify({
+        "videos": statuses,
+        "missing": [video_id for video_id in video_ids if video_id not in statuses],
+        "fingerprint": fingerprint
+    }), 200
+
+
+def _open_export_video(video):
+    """
+    Open the final video file, from the local copy or the bucket
+    
+    Returns:
+        generator: Chunks of the file, or None if it is stored nowhere
+    """
+    if video.video_path and os.path.isfile(video.video_path):
+        return read_file_chunks(video.video_path, EXPORT_CHUNK_SIZE)
     
-    return jsonify(video.to_dict()), 200
+    s3_service = get_s3_service()
+    key = (s3_service.key_for_hash(video.content_hash) if video.content_hash
+           else s3_service.key_from_url(video.s3_video_url))
+    if not key:
+        return None
+    
+    return s3_service.iter_object(key, EXPORT_CHUNK_SIZE)
+
+
+def _export_entries(videos):
+    """
+    Zip members of an export: <video_id>/video.mp4 (stored as is, mp4 doesn't
+    compress) and <video_id>/animation.py per video, then a videos.json manifest
+    """
+    manifest = []
+    for video in videos:
+        created_at = video.created_at or datetime.utcnow()
+        date_time = max(created_at, datetime(1980, 1, 1)).timetuple()[:6]
+        item = {
+            "id": video.id,
+            "prompt": video.prompt,
+            "created_at": created_at.isoformat(),
+            "quality": video.quality,
+            "files": []
+        }
+        
+        try:
+            chunks = _open_export_video(video)
+        except Exception as e:
+            logger.warning(f"Could not export the video file of {video.id}: {str(e)}")
+            chunks = None
+        if chunks is not None:
+            info = zipfile.ZipInfo(f"{video.id}/video.mp4", date_time)
+            info.compress_type = zipfile.ZIP_STORED
+            yield info, chunks
+            item["files"].append("video.mp4")
+        
+        code = video.load_code()
+        if code:
+            info = zipfile.ZipInfo(f"{video.id}/animation.py", date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            yield info, code
+            item["files"].append("animation.py")
+        
+        manifest.append(item)
+    
+    info = zipfile.ZipInfo("videos.json", datetime.utcnow().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    yield info, json.dumps(manifest, indent=2)
+
+
+@videos_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_videos():
+    """
+    Download completed videos and their code as a zip archive
+    
+    The archive is streamed as it is built, one file at a time, straight from
+    the local files or the bucket: no temporary file and constant memory.
+    
+    Query parameters:
+        ids: Comma-separated video IDs (default: all completed videos, newest first)
+    """
+    user_id = get_jwt_identity()
+    
+    video_ids = [video_id for video_id in request.args.get('ids', '').split(',') if video_id] or None
+    if video_ids and len(video_ids) > EXPORT_MAX_VIDEOS:
+        return jsonify({"error": f"At most {EXPORT_MAX_VIDEOS} videos per export"}), 400
+    
+    videos = Video.iter_by_user_id(user_id, video_ids=video_ids, limit=EXPORT_MAX_VIDEOS)
+    archive = stream_zip(_export_entries(videos), EXPORT_CHUNK_SIZE)
+    
+    response = current_app.response_class(stream_with_context(archive), mimetype="application/zip")
+    response.headers["Content-Disposition"] = 'attachment; filename="manim-videos.zip"'
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
+
+
+@videos_bp.route('/<video_id>', methods=['GET'])
+@jwt_required()
+def get_video(video_id):
+    """Get a specific video (conditional GET, see _conditional_video_response)"""
+    return _conditional_video_response("video", video_id, lambda video: (video.to_dict(), 200))
 
 
 @videos_bp.route('/<video_id>/file', methods=['GET'])
 @jwt_required()
 def get_video_file(video_id):
-    """Get the video file"""
+    """Get the video file (the HLS master playlist with ?format=hls or an HLS Accept header)"""
     user_id = get_jwt_identity()
     
     # Get video by ID
@@ -66,11 +363,23 @@ def get_video_file(video_id):
     if video.user_id != user_id:
         return jsonify({"error": "You don't have permission to access this video"}), 403
     
+    # Adaptive streaming clients get the HLS playlist once it is packaged
+    wants_hls = request.args.get('format') == 'hls' or 'mpegurl' in request.headers.get('Accept', '').lower()
+    if wants_hls and video.hls_url:
+        return redirect(video.hls_url)
+    
     # If the video has an S3 URL, redirect to that URL
     if video.s3_video_url:
         current_app.logger.info(f"Redirecting to S3 URL: {video.s3_video_url}")
         return redirect(video.s3_video_url)
     
+    # While the final quality is rendering, serve the preview
+    if not video.video_path and video.preview_path:
+        if video.preview_url:
+            return redirect(video.preview_url)
+        if os.path.exists(video.preview_path):
+            return send_file(video.preview_path, mimetype='video/mp4')
+    
     # If no S3 URL is available, fall back to local file serving
     # Add debug logging
     current_app.logger.info(f"No S3 URL available, serving local file. Path: {video.video_path}")
@@ -84,12 +393,11 @@ def get_video_file(video_id):
         video_file_path = video.video_path
         current_app.logger.info(f"Found video at original path: {video_file_path}")
     else:
-        # 2. Check if the path is relative to the videos directory
-        base_videos_dir = os.path.join(os.getcwd(), "videos")
-        video_id_dir = os.path.join(base_videos_dir, video.id)
+        # 2. Check the video's directory (sharded or legacy layout)
+        video_id_dir = find_video_dir(video.id)
         
         # Try to find any MP4 file in the video's directory
-        if os.path.exists(video_id_dir):
+        if video_id_dir:
             current_app.logger.info(f"Looking for MP4 files in: {video_id_dir}")
             for root, _, files in os.walk(video_id_dir):
                 for file in files:
@@ -101,7 +409,7 @@ def get_video_file(video_id):
                     break
                     
         # 3. Look in the media directory which manim might have created
-        if not video_file_path:
+        if not video_file_path and video_id_dir:
             media_dir = os.path.join(video_id_dir, "media", "videos")
             if os.path.exists(media_dir):
                 current_app.logger.info(f"Looking for MP4 files in media dir: {media_dir}")
@@ -128,18 +436,13 @@ def get_video_file(video_id):
         current_app.logger.info(f"Updated video path in database to: {video_file_path}")
     
     # Try to upload the video to S3 if found locally but not yet uploaded
-    try:
-        s3_service = get_s3_service()
-        s3_video_url = s3_service.upload_video(video_file_path, video.id)
-        
+    s3_video_url, content_hash = _store_in_s3(video_file_path)
+    if s3_video_url:
         # Update video with S3 URL
-        video.update_s3_url(s3_video_url)
-        current_app.logger.info(f"Uploaded video to S3: {s3_video_url}")
+        video.update_s3_url(s3_video_url, content_hash)
         
         # Redirect to the S3 URL instead of serving locally
         return redirect(s3_video_url)
-    except Exception as e:
-        current_app.logger.error(f"Failed to upload to S3: {str(e)}, serving local file instead")
     
     # Return the video file from local storage as fallback
     current_app.logger.info(f"Serving video file: {video_file_path}")
@@ -153,7 +456,161 @@ def get_video_file(video_id):
 @videos_bp.route('/<video_id>/code', methods=['GET'])
 @jwt_required()
 def get_video_code(video_id):
-    """Get the manim code used to generate the video"""
+    """Get the manim code used to generate the video (conditional GET, see _conditional_video_response)"""
+    def render(video):
+        code = video.load_code()
+        if not code:
+            return {"error": "Code not available for this video"}, 404
+        return {"code": code, "code_hash": video.code_hash, "version": video.version}, 200
+    
+    return _conditional_video_response("code", video_id, render)
+
+
+@videos_bp.route('/<video_id>/code', methods=['PUT'])
+@jwt_required()
+@traced("update_code", on_end=_record_timings)
+def update_video_code(video_id):
+    """Replace the manim code of a video and re-render it"""
+    user_id = get_jwt_identity()
+    set_log_context(user_id=user_id)
+    user = User.find_by_id(user_id)
+    
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    
+    # Get video by ID
+    video = Video.find_by_id(video_id)
+    
+    if not video:
+        return jsonify({"error": "Video not found"}), 404
+    
+    # Check if video belongs to user
+    if video.user_id != user_id:
+        return jsonify({"error": "You don't have permission to access this video"}), 403
+    
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('code'), str) or not data['code'].strip():
+        return jsonify({"error": "Missing code in request"}), 400
+    
+    code = data['code']
+    
+    if len(code) > MAX_CODE_LENGTH:
+        return jsonify({"error": f"Code is too long (maximum {MAX_CODE_LENGTH} characters)"}), 400
+    
+    # Run the pre-render checks before touching the existing video
+    is_valid, error_message = check_manim_code(code)
+    if not is_valid:
+        return jsonify({"error": error_message}), 422
+    
+    previous_status = video.status
+    if not video.start_processing():
+        return jsonify({"error": "Video is still being processed"}), 409
+    # The timings of the previous code no longer describe the video
+    video.clear_timings()
+    
+    video_dir = find_video_dir(video.id) or get_video_dir(video.id, create=True)
+    code_file = os.path.join(video_dir, "animation.py")
+    previous_code = video.load_code()
+    
+    with open(code_file, "w") as f:
+        f.write(code)
+    
+    qualities = get_tier_settings(user.subscription_tier)["render_qualities"] or ["medium"]
+    quality = video.quality or qualities[-1]
+    
+    try:
+        # Animations whose hash did not change are found in the partial movie
+        # cache by that hash (see run_cached_render), whichever code rendered
+        # them, so only the edited animations are rendered and encoded again
+        video_path = render_video(
+            code_file,
+            video_dir,
+            max_retries=1,
+            video_id=video.id,
+            tier=user.subscription_tier,
+            should_cancel=lambda: Video.is_cancelled(video.id),
+            quality=quality
+        )
+    except Exception as e:
+        # Keep the previous version of the video
+        if previous_code is not None:
+            with open(code_file, "w") as f:
+                f.write(previous_code)
+        # Also after a cancel, since the previous render is still valid
+        # (a no-op if the video was deleted meanwhile)
+        video.update_status(previous_status)
+        if not isinstance(e, RenderCancelled):
+            VideoCode.record_render_error(video.id, str(e))
+        
+        if isinstance(e, RenderCancelled):
+            return jsonify({"error": "Re-render was cancelled", "video_id": video.id}), 409
+        
+        return jsonify({"error": str(e), "video_id": video.id, "status": previous_status}), 422
+    
+    # The previous render and preview belong to the previous code
+    _release_stored_videos(video)
+    
+    video.code = code
+    video.video_path = video_path
+    video.quality = quality
+    video.preview_path = None
+    video.preview_url = None
+    video.preview_content_hash = None
+    video.hls_url = None
+    video.hls_content_hash = None
+    video.s3_video_url, video.content_hash = _store_in_s3(video_path)
+    video.status = "completed"
+    # User code is never offered to other users through the prompt index
+    video.code_edited = True
+    video.save(code_change_reason="edited")
+    get_prompt_index().remove(video.id)
+    _publish_thumbnails(video, video_path, video_dir)
+    delete_intermediates(video_dir)
+    run_in_background(current_app._get_current_object(), _publish_hls, video.id)
+    
+    return jsonify({
+        "message": "Video re-rendered successfully",
+        "video_id": video.id,
+        "status": "completed",
+        "video_url": f"/api/videos/{video.id}/file"
+    }), 200
+
+
+@videos_bp.route('/<video_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_video(video_id):
+    """Cancel an in-flight video generation"""
+    user_id = get_jwt_identity()
+    
+    # Get video by ID
+    video = Video.find_by_id(video_id)
+    
+    if not video:
+        return jsonify({"error": "Video not found"}), 404
+    
+    # Check if video belongs to user
+    if video.user_id != user_id:
+        return jsonify({"error": "You don't have permission to access this video"}), 403
+    
+    if video.status not in ("pending", "processing"):
+        return jsonify({"error": f"Video is not being processed (status: {video.status})"}), 409
+    
+    # Mark as cancelled first so renders running in other workers stop as well
+    video.update_status("cancelled")
+    cancel_render(video.id)
+    
+    return jsonify({
+        "message": "Video generation cancelled",
+        "video_id": video.id,
+        "status": "cancelled"
+    }), 200
+
+
+@videos_bp.route('/<video_id>', methods=['DELETE'])
+@jwt_required()
+def delete_video(video_id):
+    """Delete a video, cancelling its render if it is still in flight"""
     user_id = get_jwt_identity()
     
     # Get video by ID
@@ -166,10 +623,26 @@ def get_video_code(video_id):
     if video.user_id != user_id:
         return jsonify({"error": "You don't have permission to access this video"}), 403
     
-    if not video.code:
-        return jsonify({"error": "Code not available for this video"}), 404
+    if video.status in ("pending", "processing"):
+        video.update_status("cancelled")
+        cancel_render(video.id)
     
-    return jsonify({"code": video.code}), 200
+    # Release the uploaded copies, if any
+    _release_stored_videos(video)
+    _release_thumbnails(video)
+    
+    # Remove local files
+    video_dir = find_video_dir(video.id)
+    if video_dir:
+        shutil.rmtree(video_dir, ignore_errors=True)
+    
+    video.delete()
+    get_prompt_index().remove(video.id)
+    
+    return jsonify({
+        "message": "Video deleted",
+        "video_id": video.id
+    }), 200
 
 
 @videos_bp.route('/', methods=['POST'])
@@ -207,6 +680,7 @@ def create_video():
 
 @videos_bp.route('/generate', methods=['POST'])
 @jwt_required()
+@traced("generate_video", on_end=_record_timings)
 def generate_video_now():
     """Generate a video immediately and return the result (may be slow)"""
     user_id = get_jwt_identity()
@@ -221,13 +695,19 @@ def generate_video_now():
         return jsonify({"error": "Missing prompt in request"}), 400
     
     prompt = data['prompt']
+    tier_settings = get_tier_settings(user.subscription_tier)
+    set_log_context(user_id=user_id, tier=user.subscription_tier)
     
     try:
-        # Create videos directory if it doesn't exist
-        os.makedirs("videos", exist_ok=True)
-        
-        # Generate manim code using OpenAI
-        manim_code = generate_manim_code(prompt)
+        # Generate manim code using OpenAI, racing several validated candidates on tiers that allow it
+        candidates = tier_settings["codegen_candidates"]
+        with span("generate"):
+            manim_code = generate_manim_code(
+                prompt,
+                candidates=candidates,
+                validate=(lambda code, cancel_event: validate_manim_code(code, cancel_event, tier_settings))
+                if candidates > 1 else None
+            )
         
         # Create a video record with pending status
         video = Video(
@@ -237,19 +717,32 @@ def generate_video_now():
             status="processing"
         )
         video.save()
+        set_trace_attribute("video_id", video.id)
+        set_log_context(video_id=video.id)
         
         # Create directory for this video
-        video_dir = os.path.join("videos", video.id)
-        os.makedirs(video_dir, exist_ok=True)
+        video_dir = get_video_dir(video.id, create=True)
         
         # Save code to file
         code_file = os.path.join(video_dir, "animation.py")
         with open(code_file, "w") as f:
             f.write(manim_code)
         
+        # Quality ladder for the user's tier: the first rung is a fast preview
+        qualities = tier_settings["render_qualities"] or ["medium"]
+        
         # Render video with retry mechanism
         # Pass the original prompt to enable regeneration if errors occur
-        video_path = render_video(code_file, video_dir, original_prompt=prompt, max_retries=3)
+        video_path = render_video(
+            code_file,
+            video_dir,
+            original_prompt=prompt,
+            max_retries=3,
+            video_id=video.id,
+            tier=user.subscription_tier,
+            should_cancel=lambda: Video.is_cancelled(video.id),
+            quality=qualities[0]
+        )
         
         # If code was regenerated during rendering, read the updated version
         if os.path.exists(code_file):
@@ -259,25 +752,50 @@ def generate_video_now():
                     # Update the code in the database if it was changed during the retry process
                     video.code = updated_code
         
+        # The code rendered, so similar prompts may reuse it
+        index_rendered_video(video)
+        
+        # Prepare response with appropriate video URL
+        video_url = f"/api/videos/{video.id}/file"
+        
+        if len(qualities) > 1:
+            # Publish the preview now and render the final quality in the background
+            video.save(code_change_reason="regenerated")
+            preview_url, preview_hash = _store_in_s3(video_path)
+            video.publish_preview(video_path, preview_url, preview_hash)
+            _publish_thumbnails(video, video_path, video_dir)
+            
+            run_in_background(
+                current_app._get_current_object(),
+                _render_remaining_qualities,
+                video.id,
+                code_file,
+                video_dir,
+                qualities,
+                user.subscription_tier
+            )
+            
+            return jsonify({
+                "message": "Preview generated, rendering final quality",
+                "video_id": video.id,
+                "status": "processing",
+                "preview_url": preview_url or video_url,
+                "video_url": video_url
+            }), 202
+        
         # Update video record with path and status
         video.video_path = video_path
+        video.quality = qualities[0]
         video.status = "completed"
         
         # Upload to S3 bucket if available
-        try:
-            s3_service = get_s3_service()
-            s3_video_url = s3_service.upload_video(video_path, video.id)
-            video.s3_video_url = s3_video_url
-            current_app.logger.info(f"Uploaded video to S3: {s3_video_url}")
-        except Exception as e:
-            # Log the error but continue with local file
-            current_app.logger.error(f"Error uploading to S3: {str(e)}")
+        video.s3_video_url, video.content_hash = _store_in_s3(video_path)
             
         # Save all updates    
-        video.save()
-        
-        # Prepare response with appropriate video URL
-        video_url = f"/api/videos/{video.id}/file"
+        video.save(code_change_reason="regenerated")
+        _publish_thumbnails(video, video_path, video_dir)
+        delete_intermediates(video_dir)
+        run_in_background(current_app._get_current_object(), _publish_hls, video.id)
         
         return jsonify({
             "message": "Video generated successfully",
@@ -286,14 +804,25 @@ def generate_video_now():
             "video_url": video_url
         }), 200
         
+    except RenderCancelled:
+        # The status was already set to cancelled by the cancel/delete endpoint
+        logger.info(f"Video generation cancelled: {video.id}")
+        
+        return jsonify({
+            "error": "Video generation was cancelled",
+            "video_id": video.id,
+            "status": "cancelled"
+        }), 409
+        
     except Exception as e:
         # Log error
-        print(f"Error generating video: {str(e)}")
+        logger.error(f"Error generating video: {str(e)}", exc_info=True)
         
         # Update video record with error status
         if 'video' in locals():
             video.status = "failed"
             video.save()
+            VideoCode.record_render_error(video.id, str(e))
             
             return jsonify({
                 "error": str(e),
@@ -301,4 +830,206 @@ def generate_video_now():
                 "status": "failed"
             }), 500
         
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+def _store_in_s3(file_path, extension="mp4", content_type="video/mp4"):
+    """
+    Store a rendered file in S3 keyed by its content hash, taking a reference on it
+    
+    Returns:
+        tuple: (URL, content hash), or (None, None) if the upload failed
+    """
+    try:
+        with span("upload", kind=extension):
+            stored = get_s3_service().store_file(file_path, extension, content_type)
+        current_app.logger.info(f"Stored {extension} in S3: {stored['url']}")
+        return stored["url"], stored["content_hash"]
+    except Exception as e:
+        # Log the error but continue with local file
+        current_app.logger.error(f"Error uploading to S3: {str(e)}")
+        return None, None
+
+
+def _release_stored_object(content_hash, extension="mp4"):
+    """Release a reference on a content-addressed object in S3"""
+    if not content_hash:
+        return
+    
+    try:
+        s3_service = get_s3_service()
+        s3_service.release_object(s3_service.key_for_hash(content_hash, extension))
+    except Exception as e:
+        current_app.logger.error(f"Failed to release S3 object {content_hash}: {str(e)}")
+
+
+def _release_stored_videos(video):
+    """Release every S3 object a video references, including ones stored before content addressing"""
+    _release_stored_object(video.content_hash)
+    _release_stored_object(video.preview_content_hash)
+    _release_hls(video.hls_content_hash)
+    
+    # Videos uploaded before content addressing are stored under their ID
+    if (video.s3_video_url and not video.content_hash) or (video.preview_url and not video.preview_content_hash):
+        try:
+            s3_service = get_s3_service()
+            s3_service.delete_video(video.id)
+            s3_service.delete_video(f"{video.id}_preview")
+        except Exception as e:
+            current_app.logger.error(f"Failed to delete video from S3: {str(e)}")
+
+
+def _publish_thumbnails(video, video_path, video_dir):
+    """
+    Extract the poster frame and hover sprite of a rendered video, store them
+    next to the mp4 and record their URLs, replacing any previous ones
+    """
+    try:
+        with span("package", kind="thumbnails"):
+            thumbnails = generate_thumbnails(video_path, video_dir)
+    except Exception as e:
+        # Thumbnails are optional, the video is still usable without them
+        current_app.logger.error(f"Error generating thumbnails: {str(e)}")
+        return
+    
+    thumbnail_url, thumbnail_hash = _store_in_s3(thumbnails["poster_path"], "jpg", "image/jpeg")
+    sprite_url, sprite_hash = _store_in_s3(thumbnails["sprite_path"], "jpg", "image/jpeg")
+    
+    _release_thumbnails(video)
+    video.update_thumbnails(
+        thumbnails["poster_path"],
+        thumbnail_url,
+        thumbnail_hash,
+        sprite_url,
+        sprite_hash,
+        thumbnails["sprite"]
+    )
+
+
+def _release_thumbnails(video):
+    """Release the S3 objects of a video's poster frame and sprite sheet"""
+    _release_stored_object(video.thumbnail_content_hash, "jpg")
+    _release_stored_object(video.sprite_content_hash, "jpg")
+
+
+@traced("publish_hls", on_end=_record_timings)
+def _publish_hls(video_id):
+    """
+    Package the stored video of a video as HLS (see ffmpeg_service.package_hls)
+    and store the playlists and segments in S3 next to the mp4
+    
+    Args:
+        video_id (str): ID of the video
+    """
+    set_trace_attribute("video_id", video_id)
+    video = Video.find_by_id(video_id)
+    # The packaging is keyed by the stored mp4, so there is nothing to do without one
+    if not video or video.status != "completed" or not video.content_hash:
+        return
+    if video.hls_content_hash == video.content_hash:
+        return
+    if not video.video_path or not os.path.exists(video.video_path):
+        return
+    
+    content_hash = video.content_hash
+    previous_hash = video.hls_content_hash
+    output_dir = tempfile.mkdtemp(prefix=f"{SCRATCH_PREFIX}hls-", dir=RENDER_SCRATCH_DIR)
+    try:
+        with span("package", kind="hls"):
+            package_hls(video.video_path, output_dir)
+        with span("upload", kind="hls"):
+            stored = get_s3_service().store_directory(output_dir, content_hash, HLS_CONTENT_TYPES)
+    except Exception as e:
+        # HLS is optional, the mp4 is still served
+        logger.warning(f"Error packaging HLS for {video_id}: {str(e)}")
+        return
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    
+    if not video.update_hls(stored["url"] + "master.m3u8", content_hash):
+        # Re-rendered or deleted while packaging
+        _release_hls(content_hash)
+        return
+    _release_hls(previous_hash)
+
+
+def _release_hls(content_hash):
+    """Release the S3 prefix of an HLS packaging"""
+    if not content_hash:
+        return
+    
+    try:
+        s3_service = get_s3_service()
+        s3_service.release_object(s3_service.prefix_for_hash(content_hash))
+    except Exception as e:
+        current_app.logger.error(f"Failed to release HLS packaging {content_hash}: {str(e)}")
+
+
+@traced("render_final", on_end=_record_timings)
+def _render_remaining_qualities(video_id, code_file, video_dir, qualities, tier):
+    """
+    Render the higher rungs of the quality ladder after the preview was published,
+    swapping each one in as soon as it is ready
+    
+    Args:
+        video_id (str): ID of the video
+        code_file (str): Path to the (already validated) manim code
+        video_dir (str): Directory of the video
+        qualities (list): Full quality ladder, the first entry being the preview
+        tier (str): Subscription tier of the user
+    """
+    set_trace_attribute("video_id", video_id)
+    set_log_context(video_id=video_id, tier=tier)
+    video = Video.find_by_id(video_id)
+    if not video or video.status == "cancelled":
+        return
+    
+    for index, quality in enumerate(qualities[1:], start=1):
+        try:
+            # The code already rendered as a preview, so no regeneration here
+            video_path = render_video(
+                code_file,
+                video_dir,
+                max_retries=1,
+                video_id=video_id,
+                tier=tier,
+                should_cancel=lambda: Video.is_cancelled(video_id),
+                quality=quality
+            )
+        except RenderCancelled:
+            logger.info(f"Final render cancelled: {video_id}")
+            return
+        except Exception as e:
+            logger.error(f"Final render at {quality} quality failed for {video_id}: {str(e)}")
+            VideoCode.record_render_error(video_id, str(e))
+            break
+        
+        s3_video_url, content_hash = _store_in_s3(video_path)
+        is_last = index == len(qualities) - 1
+        previous_hash = video.content_hash
+        if not video.publish_rendition(video_path, s3_video_url, quality,
+                                       status="completed" if is_last else "processing",
+                                       content_hash=content_hash):
+            # Cancelled or deleted meanwhile
+            _release_stored_object(content_hash)
+            return
+        _release_stored_object(previous_hash)
+    
+    # Keep the best rendition so far if the final quality could not be rendered
+    if video.status != "completed" and video.video_path:
+        video.publish_rendition(video.video_path, video.s3_video_url, video.quality,
+                                content_hash=video.content_hash)
+    elif video.status != "completed":
+        if video.preview_content_hash:
+            # The video now references the preview object twice
+            get_s3_service().add_reference(get_s3_service().key_for_hash(video.preview_content_hash))
+        previous_hash = video.content_hash
+        if video.publish_rendition(video.preview_path, video.preview_url, qualities[0],
+                                   content_hash=video.preview_content_hash):
+            _release_stored_object(previous_hash)
+        else:
+            _release_stored_object(video.preview_content_hash)
+    
+    delete_intermediates(video_dir)
+    # Only the final rendition is packaged for streaming
+    _publish_hls(video_id)
@@ -0,0 +1,160 @@
+import os
+import click
+from flask import current_app
+from src.utils.storage import migrate_video_dirs, get_video_dir, get_legacy_video_dir
+from src.services.janitor_service import run_janitor_pass
+from src.services.manim_service import check_manim_code, prewarm_tex_cache, COMMON_TEX_EXPRESSIONS
+from src.services.template_service import TEMPLATES, match_template
+from src.models.video import versioned_update
+from src.models.video_code import VideoCode
+
+
+def register_commands(app):
+    """
+    Register maintenance commands on the Flask CLI (run with `flask --app app <command>`)
+
+    Args:
+        app: Flask application instance
+    """
+
+    @app.cli.command("migrate-video-dirs")
+    @click.option("--dry-run", is_flag=True, help="Only print what would be moved")
+    def migrate_video_dirs_command(dry_run):
+        """Move videos/<id> directories into the sharded videos/ab/cd/<id> layout"""
+        migrated = migrate_video_dirs(dry_run=dry_run)
+
+        for old_path, new_path in migrated.items():
+            click.echo(f"{old_path} -> {new_path}")
+
+        if not dry_run:
+            # Point stored paths at the new location
+            for old_path in migrated:
+                _rewrite_video_paths(os.path.basename(old_path))
+
+        click.echo(f"{'Would migrate' if dry_run else 'Migrated'} {len(migrated)} video directories")
+
+    @app.cli.command("run-janitor")
+    def run_janitor_command():
+        """Run one janitor pass now"""
+        result = run_janitor_pass()
+        if result is None:
+            click.echo("Another janitor pass is running")
+        else:
+            click.echo(f"Janitor pass finished: {result}")
+
+    @app.cli.command("check-templates")
+    def check_templates_command():
+        """Check that every scene template matches its example prompt and yields valid code"""
+        failed = 0
+        for template in TEMPLATES:
+            match = match_template(template["example"], threshold=0)
+            if not match or match["name"] != template["name"]:
+                error_message = f"example prompt matched {match['name'] if match else 'nothing'}"
+            else:
+                _, error_message = check_manim_code(match["code"])
+
+            if error_message:
+                failed += 1
+                click.echo(f"FAIL {template['name']}: {error_message}")
+            else:
+                click.echo(f"ok   {template['name']}")
+
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command("prewarm-tex-cache")
+    @click.option("--expressions", "expressions_file", type=click.File("r"),
+                  help="File with one TeX math expression per line, compiled along with the common ones")
+    @click.option("--no-common", is_flag=True, help="Skip the built-in list of common expressions")
+    @click.option("--no-templates", is_flag=True, help="Skip dry-running the scene template examples")
+    def prewarm_tex_cache_command(expressions_file, no_common, no_templates):
+        """Compile common TeX expressions and the TeX of the scene templates into the shared TeX cache"""
+        expressions = [] if no_common else list(COMMON_TEX_EXPRESSIONS)
+        if expressions_file:
+            expressions += [line.strip() for line in expressions_file if line.strip()]
+
+        codes = []
+        if not no_templates:
+            for template in TEMPLATES:
+                match = match_template(template["example"], threshold=0)
+                if match and match["name"] == template["name"]:
+                    codes.append((template["name"], match["code"]))
+
+        try:
+            results = prewarm_tex_cache(expressions, codes)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        for name, error_message in results:
+            click.echo(f"FAIL {name}: {error_message}" if error_message else f"ok   {name}")
+
+    @app.cli.command("timings-report")
+    @click.option("--limit", default=500, show_default=True, help="Number of most recent videos to include")
+    def timings_report_command(limit):
+        """Print p50/p95 seconds per pipeline stage over the most recent videos"""
+        samples = {}
+        cursor = current_app.mongo_db.videos.find({"timings": {"$exists": True}}, {"timings": 1})\
+            .sort("created_at", -1)\
+            .limit(limit)
+        for video_data in cursor:
+            for pipeline, timings in (video_data.get("timings") or {}).items():
+                for stage, seconds in timings.items():
+                    samples.setdefault((pipeline, stage), []).append(seconds)
+
+        if not samples:
+            click.echo("No timings recorded yet")
+            return
+
+        click.echo(f"{'pipeline':<16} {'stage':<10} {'runs':>6} {'p50':>9} {'p95':>9}")
+        for (pipeline, stage), values in sorted(samples.items()):
+            values.sort()
+            p50 = values[int(0.50 * (len(values) - 1))]
+            p95 = values[int(0.95 * (len(values) - 1))]
+            click.echo(f"{pipeline:<16} {stage:<10} {len(values):>6} {p50:>9.2f} {p95:>9.2f}")
+
+    @app.cli.command("migrate-video-code")
+    @click.option("--batch-size", default=200, show_default=True, help="Videos moved per batch")
+    def migrate_video_code_command(batch_size):
+        """Move code stored inline in videos documents to the compressed video_code collection"""
+        moved = 0
+        saved_bytes = 0
+        while True:
+            batch = list(current_app.mongo_db.videos.find({"code": {"$ne": None}}, {"code": 1}).limit(batch_size))
+            if not batch:
+                break
+            for video_data in batch:
+                code_hash = VideoCode.store(video_data["_id"], video_data["code"])
+                current_app.mongo_db.videos.update_one(
+                    {"_id": video_data["_id"]},
+                    versioned_update({"$set": {"code_hash": code_hash}, "$unset": {"code": ""}})
+                )
+                moved += 1
+                saved_bytes += len(video_data["code"].encode("utf-8"))
+
+        # What is left are documents with "code": null
+        current_app.mongo_db.videos.update_many({"code": {"$exists": True}}, {"$unset": {"code": ""}})
+        click.echo(f"Moved the code of {moved} videos ({saved_bytes} bytes) out of the videos collection")
+
+
+def _rewrite_video_paths(video_id):
+    """Replace the legacy directory in a video's stored file paths with the sharded one"""
+    video_data = current_app.mongo_db.videos.find_one({"_id": video_id}, {"video_path": 1, "preview_path": 1})
+    if not video_data:
+        return
+
+    legacy_dir = get_legacy_video_dir(video_id)
+    sharded_dir = get_video_dir(video_id)
+    updates = {}
+    for field in ("video_path", "preview_path"):
+        path = video_data.get(field)
+        if not path:
+            continue
+        # Stored paths may be relative to the working directory (videos/<id>/...)
+        marker = f"videos/{video_id}/"
+        if marker in path:
+            updates[field] = sharded_dir + "/" + path.split(marker, 1)[1]
+        elif path.startswith(legacy_dir):
+            updates[field] = sharded_dir + path[len(legacy_dir):]
+
+    if updates:
+        current_app.mongo_db.videos.update_one({"_id": video_id}, versioned_update({"$set": updates}))
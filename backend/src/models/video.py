@@ -1,105 +1,498 @@
 import uuid
+import threading
 from datetime import datetime
 from flask import current_app
+from src.utils.response_cache import get_response_cache
+from src.models.video_code import VideoCode, hash_code
+
+# Fields clients follow while a video is being generated (see find_statuses)
+STATUS_PROJECTION = {
+    "status": 1,
+    "quality": 1,
+    "preview_url": 1,
+    "s3_video_url": 1,
+    "thumbnail_url": 1,
+    "hls_url": 1
+}
+
+# Reads of video metadata leave out the code inlined by older versions of the
+# app (the code now lives in the video_code collection, see load_code)
+METADATA_PROJECTION = {"code": 0}
+
+# Signalled whenever this process updates a video, to wake up long polls
+_changes = threading.Condition()
+_change_count = 0
+
+
+def versioned_update(update):
+    """
+    Add the version bump and modification time to a MongoDB update of a video
+    (every write goes through it, so ETags derived from the version change)
+    
+    Args:
+        update (dict): Update document ($set, $unset, ...)
+        
+    Returns:
+        dict: The update document
+    """
+    update.setdefault("$inc", {})["version"] = 1
+    update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+    return update
+
+
+def _notify_change(video_id):
+    global _change_count
+    # Cached responses of the video are outdated
+    get_response_cache().invalidate(video_id)
+    with _changes:
+        _change_count += 1
+        _changes.notify_all()
+
 
 class Video:
     """Video model for tracking generated videos"""
     
     def __init__(self, user_id, prompt, code=None, video_path=None, id=None, 
-                 created_at=None, status="pending", thumbnail_path=None, s3_video_url=None):
+                 created_at=None, status="pending", thumbnail_path=None, s3_video_url=None,
+                 quality=None, preview_path=None, preview_url=None, content_hash=None,
+                 preview_content_hash=None, thumbnail_url=None, sprite_url=None, sprite=None,
+                 thumbnail_content_hash=None, sprite_content_hash=None, hls_url=None,
+                 hls_content_hash=None, timings=None, version=0, updated_at=None, code_hash=None,
+                 code_edited=False):
         self.id = id or str(uuid.uuid4())
         self.user_id = user_id
         self.prompt = prompt
-        self.code = code
+        self.code = code  # Only loaded on demand (see load_code)
+        self.code_hash = code_hash  # SHA-256 of the code stored in the video_code collection
+        self.code_edited = code_edited  # True once the user replaced the generated code
         self.video_path = video_path
         self.thumbnail_path = thumbnail_path
         self.created_at = created_at or datetime.utcnow()
-        self.status = status  # pending, processing, completed, failed
+        self.status = status  # pending, processing, completed, failed, cancelled
         self.s3_video_url = s3_video_url  # URL for the video in S3/R2 storage
+        self.quality = quality  # Render quality of video_path/s3_video_url (low, medium, high, ...)
+        self.preview_path = preview_path  # Local path of the fast low-quality preview
+        self.preview_url = preview_url  # URL of the preview in S3/R2 storage
+        self.content_hash = content_hash  # SHA-256 of the stored video (object key objects/<hash>.mp4)
+        self.preview_content_hash = preview_content_hash  # SHA-256 of the stored preview
+        self.thumbnail_url = thumbnail_url  # URL of the poster frame (thumbnail_path is its local copy)
+        self.sprite_url = sprite_url  # URL of the hover sprite sheet
+        self.sprite = sprite  # Sprite sheet layout: columns, rows, interval, tile_width, tile_height
+        self.thumbnail_content_hash = thumbnail_content_hash
+        self.sprite_content_hash = sprite_content_hash
+        self.hls_url = hls_url  # URL of the HLS master playlist of the stored video
+        self.hls_content_hash = hls_content_hash  # Video hash the HLS packaging was made from (prefix hls/<hash>/)
+        self.timings = timings or {}  # Seconds per pipeline stage, per pipeline run (see record_timings)
+        self.version = version  # Incremented by every write (see versioned_update)
+        self.updated_at = updated_at or self.created_at
+        
+    def save(self, code_change_reason=None):
+        """
+        Save video to database
+        
+        The code is written to the video_code collection, only when it changed.
+        
+        Args:
+            code_change_reason (str): Recorded in the code history when the code changed
+        """
+        if self.code is not None and hash_code(self.code) != self.code_hash:
+            self.code_hash = VideoCode.store(self.id, self.code, reason=code_change_reason)
         
-    def save(self):
-        """Save video to database"""
         video_data = {
             "_id": self.id,
             "user_id": self.user_id,
             "prompt": self.prompt,
-            "code": self.code,
+            "code_hash": self.code_hash,
+            "code_edited": self.code_edited,
             "video_path": self.video_path,
             "thumbnail_path": self.thumbnail_path,
             "created_at": self.created_at,
             "status": self.status,
-            "s3_video_url": self.s3_video_url
+            "s3_video_url": self.s3_video_url,
+            "quality": self.quality,
+            "preview_path": self.preview_path,
+            "preview_url": self.preview_url,
+            "content_hash": self.content_hash,
+            "preview_content_hash": self.preview_content_hash,
+            "thumbnail_url": self.thumbnail_url,
+            "sprite_url": self.sprite_url,
+            "sprite": self.sprite,
+            "thumbnail_content_hash": self.thumbnail_content_hash,
+            "sprite_content_hash": self.sprite_content_hash,
+            "hls_url": self.hls_url,
+            "hls_content_hash": self.hls_content_hash
         }
         
+        update = {"$set": video_data}
+        if self.code_hash:
+            # Code inlined by older versions now lives in video_code
+            update["$unset"] = {"code": ""}
+        
         current_app.mongo_db.videos.update_one(
             {"_id": self.id}, 
-            {"$set": video_data}, 
+            versioned_update(update), 
             upsert=True
         )
+        _notify_change(self.id)
         
         return self
     
     @classmethod
-    def find_by_id(cls, video_id):
-        """Find video by ID"""
-        video_data = current_app.mongo_db.videos.find_one({"_id": video_id})
-        
-        if not video_data:
-            return None
-        
+    def from_document(cls, video_data):
+        """Create a video from a MongoDB document"""
         return cls(
             id=video_data["_id"],
             user_id=video_data["user_id"],
             prompt=video_data["prompt"],
             code=video_data.get("code"),
+            code_hash=video_data.get("code_hash"),
+            code_edited=video_data.get("code_edited", False),
             video_path=video_data.get("video_path"),
             thumbnail_path=video_data.get("thumbnail_path"),
             created_at=video_data.get("created_at"),
             status=video_data.get("status", "pending"),
-            s3_video_url=video_data.get("s3_video_url")
+            s3_video_url=video_data.get("s3_video_url"),
+            quality=video_data.get("quality"),
+            preview_path=video_data.get("preview_path"),
+            preview_url=video_data.get("preview_url"),
+            content_hash=video_data.get("content_hash"),
+            preview_content_hash=video_data.get("preview_content_hash"),
+            thumbnail_url=video_data.get("thumbnail_url"),
+            sprite_url=video_data.get("sprite_url"),
+            sprite=video_data.get("sprite"),
+            thumbnail_content_hash=video_data.get("thumbnail_content_hash"),
+            sprite_content_hash=video_data.get("sprite_content_hash"),
+            hls_url=video_data.get("hls_url"),
+            hls_content_hash=video_data.get("hls_content_hash"),
+            timings=video_data.get("timings"),
+            version=video_data.get("version", 0),
+            updated_at=video_data.get("updated_at")
+        )
+    
+    @classmethod
+    def find_by_id(cls, video_id):
+        """Find video by ID"""
+        video_data = current_app.mongo_db.videos.find_one({"_id": video_id}, METADATA_PROJECTION)
+        
+        if not video_data:
+            return None
+        
+        return cls.from_document(video_data)
+    
+    @classmethod
+    def find_version(cls, video_id):
+        """
+        Get what is needed to validate a cached response of a video, without the document
+        
+        Returns:
+            dict: user_id, version (0 for videos never updated since versioning), updated_at
+                  and created_at, or None if the video doesn't exist
+        """
+        video_data = current_app.mongo_db.videos.find_one(
+            {"_id": video_id}, {"user_id": 1, "version": 1, "updated_at": 1, "created_at": 1}
         )
+        if video_data:
+            video_data.setdefault("version", 0)
+        
+        return video_data
+    
+    @classmethod
+    def find_versions_by_user_id(cls, user_id, limit=10, skip=0):
+        """Same page as find_by_user_id, with only the ID and version of each video"""
+        cursor = current_app.mongo_db.videos.find({"user_id": user_id}, {"version": 1})\
+            .sort("created_at", -1)\
+            .skip(skip)\
+            .limit(limit)
+        
+        return [(video_data["_id"], video_data.get("version", 0)) for video_data in cursor]
+    
+    @classmethod
+    def find_statuses(cls, user_id, video_ids):
+        """
+        Get the status fields of several videos of a user in a single query
+        
+        Args:
+            user_id (str): Owner of the videos; videos of other users are left out
+            video_ids (list): IDs of the videos
+            
+        Returns:
+            dict: Video ID to its STATUS_PROJECTION fields, for the videos found
+        """
+        cursor = current_app.mongo_db.videos.find(
+            {"_id": {"$in": list(video_ids)}, "user_id": user_id},
+            STATUS_PROJECTION
+        )
+        
+        return {video_data.pop("_id"): video_data for video_data in cursor}
+    
+    @staticmethod
+    def change_count():
+        """Number of video updates made by this process so far (see wait_for_change)"""
+        return _change_count
+    
+    @staticmethod
+    def wait_for_change(since, timeout):
+        """
+        Block until this process updates a video or the timeout passes. Updates
+        made by other worker processes are not signalled, so callers re-query
+        periodically.
+        
+        Args:
+            since (int): change_count() observed before the caller's last query
+            timeout (float): Maximum seconds to wait
+            
+        Returns:
+            bool: True if a video was updated since the given count
+        """
+        with _changes:
+            return _changes.wait_for(lambda: _change_count != since, timeout)
     
     @classmethod
     def find_by_user_id(cls, user_id, limit=10, skip=0):
         """Find videos by user ID"""
         videos = []
-        cursor = current_app.mongo_db.videos.find({"user_id": user_id})\
+        cursor = current_app.mongo_db.videos.find({"user_id": user_id}, METADATA_PROJECTION)\
             .sort("created_at", -1)\
             .skip(skip)\
             .limit(limit)
         
         for video_data in cursor:
-            videos.append(cls(
-                id=video_data["_id"],
-                user_id=video_data["user_id"],
-                prompt=video_data["prompt"],
-                code=video_data.get("code"),
-                video_path=video_data.get("video_path"),
-                thumbnail_path=video_data.get("thumbnail_path"),
-                created_at=video_data.get("created_at"),
-                status=video_data.get("status", "pending"),
-                s3_video_url=video_data.get("s3_video_url")
-            ))
+            videos.append(cls.from_document(video_data))
         
         return videos
     
+    @classmethod
+    def iter_by_user_id(cls, user_id, video_ids=None, status="completed", limit=0):
+        """
+        Iterate over a user's videos, newest first, fetching them in cursor batches
+        
+        Args:
+            user_id (str): Owner of the videos
+            video_ids (list): Only these videos (all of the user's if None)
+            status (str): Only videos with this status (any if None)
+            limit (int): Maximum number of videos (0 for no limit)
+            
+        Yields:
+            Video: The next video
+        """
+        query = {"user_id": user_id}
+        if video_ids is not None:
+            query["_id"] = {"$in": list(video_ids)}
+        if status:
+            query["status"] = status
+        
+        cursor = current_app.mongo_db.videos.find(query, METADATA_PROJECTION).sort("created_at", -1).limit(limit)
+        for video_data in cursor:
+            yield cls.from_document(video_data)
+    
+    def load_code(self):
+        """
+        Load the code of the video (left out of metadata reads)
+        
+        Returns:
+            str: The code, or None if the video has none yet
+        """
+        if self.code is None:
+            if self.code_hash:
+                self.code = VideoCode.load(self.id)
+            else:
+                # Inlined by an older version of the app and not migrated yet
+                video_data = current_app.mongo_db.videos.find_one({"_id": self.id}, {"code": 1})
+                self.code = video_data.get("code") if video_data else None
+        
+        return self.code
+    
     def update_status(self, status):
         """Update video status"""
         self.status = status
         current_app.mongo_db.videos.update_one(
             {"_id": self.id}, 
-            {"$set": {"status": status}}
+            versioned_update({"$set": {"status": status}})
         )
+        _notify_change(self.id)
         
         return self
         
-    def update_s3_url(self, s3_video_url):
+    @classmethod
+    def fail_interrupted(cls, video_ids):
+        """
+        Mark videos whose generation was interrupted (e.g. by a worker shutdown) as failed
+        
+        Args:
+            video_ids (list): IDs of the videos; finished ones are left as they are
+            
+        Returns:
+            list: IDs of the videos marked as failed
+        """
+        unfinished = {"_id": {"$in": list(video_ids)}, "status": {"$in": ["pending", "processing"]}}
+        failed_ids = [video_data["_id"] for video_data in current_app.mongo_db.videos.find(unfinished, {"_id": 1})]
+        if not failed_ids:
+            return []
+        
+        current_app.mongo_db.videos.update_many(
+            {**unfinished, "_id": {"$in": failed_ids}},
+            versioned_update({"$set": {"status": "failed"}})
+        )
+        for video_id in failed_ids:
+            _notify_change(video_id)
+        
+        return failed_ids
+    
+    @classmethod
+    def is_cancelled(cls, video_id):
+        """Check whether a video has been cancelled or deleted (cheap status-only lookup)"""
+        video_data = current_app.mongo_db.videos.find_one({"_id": video_id}, {"status": 1})
+        
+        return not video_data or video_data.get("status") == "cancelled"
+    
+    def start_processing(self):
+        """
+        Atomically move the video to processing unless it is already being processed
+        
+        Returns:
+            bool: True if this caller now owns the processing of the video
+        """
+        result = current_app.mongo_db.videos.update_one(
+            {"_id": self.id, "status": {"$nin": ["pending", "processing"]}},
+            versioned_update({"$set": {"status": "processing"}})
+        )
+        if result.modified_count:
+            self.status = "processing"
+            _notify_change(self.id)
+        
+        return result.modified_count == 1
+    
+    def delete(self):
+        """Delete video from database"""
+        current_app.mongo_db.videos.delete_one({"_id": self.id})
+        VideoCode.delete(self.id)
+        _notify_change(self.id)
+        
+        return True
+        
+    def update_s3_url(self, s3_video_url, content_hash=None):
         """Update the S3 video URL"""
         self.s3_video_url = s3_video_url
+        self.content_hash = content_hash
+        current_app.mongo_db.videos.update_one(
+            {"_id": self.id},
+            versioned_update({"$set": {"s3_video_url": s3_video_url, "content_hash": content_hash}})
+        )
+        _notify_change(self.id)
+        
+        return self
+    
+    def publish_preview(self, preview_path, preview_url, preview_content_hash=None):
+        """Publish the fast preview render so it can be played while the final renders"""
+        self.preview_path = preview_path
+        self.preview_url = preview_url
+        self.preview_content_hash = preview_content_hash
         current_app.mongo_db.videos.update_one(
             {"_id": self.id},
-            {"$set": {"s3_video_url": s3_video_url}}
+            versioned_update({"$set": {
+                "preview_path": preview_path,
+                "preview_url": preview_url,
+                "preview_content_hash": preview_content_hash
+            }})
         )
+        _notify_change(self.id)
+        
+        return self
+    
+    def publish_rendition(self, video_path, s3_video_url, quality, status="completed", content_hash=None):
+        """
+        Swap in a rendered quality in a single atomic update, so readers see
+        either the previous rendition or the new one, never a mix of both
+        
+        Returns:
+            bool: False if the video was cancelled or deleted meanwhile
+        """
+        result = current_app.mongo_db.videos.update_one(
+            {"_id": self.id, "status": {"$ne": "cancelled"}},
+            versioned_update({"$set": {
+                "video_path": video_path,
+                "s3_video_url": s3_video_url,
+                "quality": quality,
+                "status": status,
+                "content_hash": content_hash
+            }})
+        )
+        if not result.matched_count:
+            return False
+        
+        self.video_path = video_path
+        self.s3_video_url = s3_video_url
+        self.quality = quality
+        self.status = status
+        self.content_hash = content_hash
+        _notify_change(self.id)
+        
+        return True
+    
+    def update_thumbnails(self, thumbnail_path, thumbnail_url, thumbnail_content_hash,
+                          sprite_url, sprite_content_hash, sprite):
+        """Update the poster frame and hover sprite sheet"""
+        thumbnails = {
+            "thumbnail_path": thumbnail_path,
+            "thumbnail_url": thumbnail_url,
+            "thumbnail_content_hash": thumbnail_content_hash,
+            "sprite_url": sprite_url,
+            "sprite_content_hash": sprite_content_hash,
+            "sprite": sprite
+        }
+        for field, value in thumbnails.items():
+            setattr(self, field, value)
+        current_app.mongo_db.videos.update_one({"_id": self.id}, versioned_update({"$set": thumbnails}))
+        _notify_change(self.id)
+        
+        return self
+    
+    def update_hls(self, hls_url, hls_content_hash):
+        """
+        Record the HLS packaging of the stored video, unless the video was
+        re-rendered (or deleted) while it was being packaged
+        
+        Returns:
+            bool: False if the packaging no longer matches the stored video
+        """
+        result = current_app.mongo_db.videos.update_one(
+            {"_id": self.id, "content_hash": hls_content_hash},
+            versioned_update({"$set": {"hls_url": hls_url, "hls_content_hash": hls_content_hash}})
+        )
+        if not result.matched_count:
+            return False
+        
+        self.hls_url = hls_url
+        self.hls_content_hash = hls_content_hash
+        _notify_change(self.id)
+        
+        return True
+    
+    @classmethod
+    def record_timings(cls, video_id, pipeline, timings):
+        """
+        Record the stage timings of a pipeline run (see tracing.Trace.stage_timings).
+        Runs of different pipelines (the request, the final render, the HLS
+        packaging) are kept side by side, since they may finish in any order.
+        
+        Not part of save(), so saving a video never overwrites timings
+        recorded by a background job.
+        
+        Args:
+            video_id (str): ID of the video
+            pipeline (str): Name of the pipeline run
+            timings (dict): Seconds per stage and total
+        """
+        current_app.mongo_db.videos.update_one({"_id": video_id},
+                                               versioned_update({"$set": {f"timings.{pipeline}": timings}}))
+        # Timings are part of the metadata responses
+        get_response_cache().invalidate(video_id)
+    
+    def clear_timings(self):
+        """Drop the timings of previous pipeline runs (e.g. before a re-render)"""
+        self.timings = {}
+        current_app.mongo_db.videos.update_one({"_id": self.id}, versioned_update({"$unset": {"timings": ""}}))
+        get_response_cache().invalidate(self.id)
         
         return self
     
@@ -109,9 +502,19 @@ class Video:
             "id": self.id,
             "user_id": self.user_id,
             "prompt": self.prompt,
+            "code_hash": self.code_hash,
             "video_path": self.video_path,
             "thumbnail_path": self.thumbnail_path,
             "created_at": self.created_at,
             "status": self.status,
-            "s3_video_url": self.s3_video_url
+            "s3_video_url": self.s3_video_url,
+            "quality": self.quality,
+            "preview_url": self.preview_url,
+            "content_hash": self.content_hash,
+            "thumbnail_url": self.thumbnail_url,
+            "sprite_url": self.sprite_url,
+            "sprite": self.sprite,
+            "hls_url": self.hls_url,
+            "timings": self.timings,
+            "version": self.version
         }
\ No newline at end of file
@@ -0,0 +1,118 @@
+import os
+import zlib
+import hashlib
+from datetime import datetime
+from bson.binary import Binary
+from flask import current_app
+from pymongo import ReturnDocument
+
+# Previous versions of a video's code kept (edits and regenerations during renders)
+CODE_HISTORY_LIMIT = int(os.environ.get("CODE_HISTORY_LIMIT", 10))
+
+# Characters of a render error kept with the code (the end of stderr holds the error)
+RENDER_ERROR_EXCERPT_LENGTH = int(os.environ.get("RENDER_ERROR_EXCERPT_LENGTH", 4000))
+
+CODE_COMPRESSION_LEVEL = 6
+
+
+def hash_code(code):
+    """SHA-256 of a program, as referenced by Video.code_hash"""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def compress_text(text):
+    return Binary(zlib.compress(text.encode("utf-8"), CODE_COMPRESSION_LEVEL))
+
+
+def decompress_text(data):
+    return zlib.decompress(bytes(data)).decode("utf-8") if data is not None else None
+
+
+class VideoCode:
+    """
+    Generated code of a video, its previous versions and the last render error,
+    zlib-compressed in the video_code collection (keyed by video ID) so the
+    videos documents stay small
+    """
+    
+    @staticmethod
+    def store(video_id, code, reason=None):
+        """
+        Store the code of a video, moving the code it replaces to the history
+        
+        Args:
+            video_id (str): ID of the video
+            code (str): The code
+            reason (str): Why the previous code was replaced (edit, regenerated, ...)
+        
+        Returns:
+            str: Hash of the code
+        """
+        code_hash = hash_code(code)
+        now = datetime.utcnow()
+        collection = current_app.mongo_db.video_code
+        
+        previous = collection.find_one_and_update(
+            {"_id": video_id},
+            {"$set": {"code": compress_text(code), "code_hash": code_hash, "size": len(code), "updated_at": now}},
+            projection={"code": 1, "code_hash": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if previous and previous.get("code") is not None and previous.get("code_hash") != code_hash:
+            collection.update_one({"_id": video_id}, {"$push": {"history": {
+                "$each": [{
+                    "code_hash": previous["code_hash"],
+                    "code": previous["code"],
+                    "replaced_at": now,
+                    "reason": reason
+                }],
+                "$slice": -CODE_HISTORY_LIMIT
+            }}})
+        
+        return code_hash
+    
+    @staticmethod
+    def load(video_id):
+        """
+        Load the code of a video
+        
+        Returns:
+            str: The code, or None if none was stored
+        """
+        code_data = current_app.mongo_db.video_code.find_one({"_id": video_id}, {"code": 1})
+        
+        return decompress_text(code_data.get("code")) if code_data else None
+    
+    @staticmethod
+    def load_many(video_ids, mongo_db=None):
+        """
+        Load the code of several videos in one query
+        
+        Returns:
+            dict: Video ID to code, for the videos with stored code
+        """
+        mongo_db = mongo_db if mongo_db is not None else current_app.mongo_db
+        cursor = mongo_db.video_code.find({"_id": {"$in": list(video_ids)}, "code": {"$ne": None}}, {"code": 1})
+        
+        return {code_data["_id"]: decompress_text(code_data["code"]) for code_data in cursor}
+    
+    @staticmethod
+    def record_render_error(video_id, message):
+        """Keep the end of the error of a failed render with the code"""
+        if not message:
+            return
+        
+        current_app.mongo_db.video_code.update_one(
+            {"_id": video_id},
+            {"$set": {
+                "render_error": compress_text(message[-RENDER_ERROR_EXCERPT_LENGTH:]),
+                "render_error_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    
+    @staticmethod
+    def delete(video_id):
+        current_app.mongo_db.video_code.delete_one({"_id": video_id})
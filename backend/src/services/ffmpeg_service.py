@@ -0,0 +1,281 @@
+import os
+import json
+import subprocess
+
+# ffmpeg executables (the manim image ships them on the PATH)
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+
+# Thumbnail settings
+POSTER_WIDTH = 640
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 5
+# Position of the poster frame as a fraction of the video duration
+POSTER_POSITION = float(os.environ.get("THUMBNAIL_POSITION", 0.5))
+
+# HLS packaging: segment length in seconds and the optional transcoding ladder,
+# as comma separated <height>:<bitrate> rungs (e.g. "720:2500k,480:1000k,360:600k").
+# With an empty ladder the rendered stream is segmented as-is, without re-encoding.
+HLS_SEGMENT_SECONDS = int(os.environ.get("HLS_SEGMENT_SECONDS", 4))
+HLS_LADDER = os.environ.get("HLS_LADDER", "")
+HLS_MASTER_PLAYLIST = "master.m3u8"
+
+
+def _run_ffmpeg(args, timeout=None):
+    """
+    Run ffmpeg with the given arguments
+
+    Args:
+        args (list): Arguments passed to ffmpeg
+        timeout (int): Optional timeout in seconds
+
+    Returns:
+        subprocess.CompletedProcess: Result of the command
+    """
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y"] + args
+    process = subprocess.run(command, text=True, capture_output=True, timeout=timeout, check=False)
+
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg failed: {process.stderr.strip()}")
+
+    return process
+
+
+def concat_videos(input_paths, output_path):
+    """
+    Join videos with identical encoding parameters without re-encoding,
+    using ffmpeg's concat demuxer
+
+    Args:
+        input_paths (list): Paths of the videos to join, in order
+        output_path (str): Path of the joined video
+
+    Returns:
+        str: Path to the joined video
+    """
+    if not input_paths:
+        raise ValueError("No videos to concatenate")
+
+    list_path = f"{output_path}.txt"
+    with open(list_path, "w") as f:
+        for path in input_paths:
+            # Single quotes inside paths have to be escaped for the concat demuxer
+            escaped_path = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped_path}'\n")
+
+    try:
+        _run_ffmpeg([
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_path,
+            "-c", "copy",
+            output_path
+        ])
+    finally:
+        os.remove(list_path)
+
+    return output_path
+
+
+def probe_video(path):
+    """
+    Get the duration, frame size and audio presence of a video
+
+    Args:
+        path (str): Path to the video
+
+    Returns:
+        dict: duration (seconds), width, height and has_audio
+    """
+    command = [
+        FFPROBE_BINARY, "-v", "error",
+        "-show_entries", "stream=codec_type,width,height:format=duration",
+        "-of", "json",
+        path
+    ]
+    process = subprocess.run(command, text=True, capture_output=True, check=False)
+
+    if process.returncode != 0:
+        raise Exception(f"ffprobe failed: {process.stderr.strip()}")
+
+    result = json.loads(process.stdout or "{}")
+    streams = result.get("streams", [])
+    video_stream = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    return {
+        "duration": float(result.get("format", {}).get("duration", 0) or 0),
+        "width": int(video_stream.get("width", 0) or 0),
+        "height": int(video_stream.get("height", 0) or 0),
+        "has_audio": any(stream.get("codec_type") == "audio" for stream in streams)
+    }
+
+
+def generate_thumbnails(video_path, output_dir):
+    """
+    Extract a poster frame and a hover sprite sheet from a video in a single ffmpeg pass
+
+    The sprite sheet is a SPRITE_COLUMNS x SPRITE_ROWS grid of frames sampled
+    evenly over the whole video, so frontends can scrub through it on hover.
+
+    Args:
+        video_path (str): Path to the video
+        output_dir (str): Directory for poster.jpg and sprite.jpg
+
+    Returns:
+        dict: poster_path, sprite_path and the sprite layout (columns, rows,
+              interval in seconds, tile_width, tile_height)
+    """
+    info = probe_video(video_path)
+    duration = info["duration"]
+    if duration <= 0:
+        raise Exception(f"Could not determine the duration of {video_path}")
+
+    tiles = SPRITE_COLUMNS * SPRITE_ROWS
+    interval = duration / tiles
+    poster_time = duration * POSTER_POSITION
+    poster_path = os.path.join(output_dir, "poster.jpg")
+    sprite_path = os.path.join(output_dir, "sprite.jpg")
+
+    filter_graph = (
+        f"[0:v]split=2[poster_in][sprite_in];"
+        f"[poster_in]trim=start={poster_time:.3f},setpts=PTS-STARTPTS,scale={POSTER_WIDTH}:-2[poster];"
+        f"[sprite_in]fps={1 / interval:.6f},scale={SPRITE_TILE_WIDTH}:-2,tile={SPRITE_COLUMNS}x{SPRITE_ROWS}[sprite]"
+    )
+    _run_ffmpeg([
+        "-i", video_path,
+        "-filter_complex", filter_graph,
+        "-map", "[poster]", "-frames:v", "1", "-q:v", "3", poster_path,
+        "-map", "[sprite]", "-frames:v", "1", "-q:v", "5", sprite_path
+    ])
+
+    tile_height = round(SPRITE_TILE_WIDTH * info["height"] / info["width"]) if info["width"] else None
+    return {
+        "poster_path": poster_path,
+        "sprite_path": sprite_path,
+        "sprite": {
+            "columns": SPRITE_COLUMNS,
+            "rows": SPRITE_ROWS,
+            "interval": round(interval, 3),
+            "tile_width": SPRITE_TILE_WIDTH,
+            "tile_height": tile_height
+        }
+    }
+
+
+def remux_faststart(input_path, output_path):
+    """
+    Remux an mp4 with the moov atom at the front, so browsers can start
+    playback before the whole file is downloaded
+
+    Args:
+        input_path (str): Path to the source mp4
+        output_path (str): Path of the remuxed mp4
+
+    Returns:
+        str: Path to the remuxed mp4
+    """
+    _run_ffmpeg([
+        "-i", input_path,
+        "-map", "0",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        # Explicit muxer, output paths may carry a temporary suffix
+        "-f", "mp4",
+        output_path
+    ])
+
+    return output_path
+
+
+def parse_hls_ladder(ladder=HLS_LADDER):
+    """
+    Parse an HLS ladder specification
+
+    Args:
+        ladder (str): Comma separated <height>:<bitrate> rungs
+
+    Returns:
+        list: (height, bitrate) tuples, highest first
+    """
+    rungs = []
+    for rung in ladder.split(","):
+        if not rung.strip():
+            continue
+        height, bitrate = rung.strip().split(":")
+        rungs.append((int(height), bitrate))
+
+    return sorted(rungs, reverse=True)
+
+
+def package_hls(input_path, output_dir, ladder=None):
+    """
+    Package a video as HLS: a master playlist plus one media playlist and
+    set of segments per variant, in a single ffmpeg run
+
+    Args:
+        input_path (str): Path to the source mp4
+        output_dir (str): Directory for the playlists and segments
+        ladder (list): (height, bitrate) rungs to transcode to; rungs taller than
+                       the source are skipped. Without rungs the source stream is
+                       segmented as-is.
+
+    Returns:
+        str: Path to the master playlist
+    """
+    info = probe_video(input_path)
+    ladder = parse_hls_ladder() if ladder is None else ladder
+    rungs = [(height, bitrate) for height, bitrate in ladder if height <= info["height"]]
+    if ladder and not rungs:
+        # Never upscale: a source shorter than every rung gets the lowest bitrate as-is
+        rungs = [(info["height"], ladder[-1][1])]
+
+    os.makedirs(output_dir, exist_ok=True)
+    args = ["-i", input_path]
+
+    if rungs:
+        split_outputs = "".join(f"[v{index}]" for index in range(len(rungs)))
+        filters = [f"[0:v]split={len(rungs)}{split_outputs}"]
+        filters += [f"[v{index}]scale=-2:{height}[v{index}out]" for index, (height, _) in enumerate(rungs)]
+        args += ["-filter_complex", ";".join(filters)]
+
+        stream_map = []
+        for index, (_, bitrate) in enumerate(rungs):
+            args += [
+                "-map", f"[v{index}out]",
+                f"-c:v:{index}", "libx264",
+                f"-b:v:{index}", bitrate,
+                f"-maxrate:v:{index}", bitrate,
+                f"-bufsize:v:{index}", bitrate,
+            ]
+            if info["has_audio"]:
+                args += ["-map", "0:a:0"]
+                stream_map.append(f"v:{index},a:{index}")
+            else:
+                stream_map.append(f"v:{index}")
+
+        # Keyframes on segment boundaries so every variant switches cleanly
+        args += [
+            "-preset", "veryfast",
+            "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        ]
+        if info["has_audio"]:
+            args += ["-c:a", "aac", "-b:a", "128k"]
+    else:
+        args += ["-map", "0:v:0", "-c", "copy"]
+        stream_map = ["v:0"]
+        if info["has_audio"]:
+            args += ["-map", "0:a:0"]
+            stream_map = ["v:0,a:0"]
+
+    args += [
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(output_dir, "v%v", "segment_%03d.ts"),
+        "-master_pl_name", HLS_MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "v%v", "index.m3u8")
+    ]
+    _run_ffmpeg(args)
+
+    return os.path.join(output_dir, HLS_MASTER_PLAYLIST)
@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+from flask import current_app
+from src.services.openai_service import get_api_key
+from src.services.s3_service import get_s3_service
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Probes reuse the last dependency check for this long, so frequent readiness
+# probes from several replicas don't turn into database and bucket traffic
+READINESS_CACHE_SECONDS = float(os.environ.get("READINESS_CACHE_SECONDS", 10))
+
+_results = {}
+_results_lock = threading.Lock()
+_refreshing = set()
+
+
+def _check_mongodb():
+    current_app.mongo_db.command("ping")
+    return None
+
+
+def _check_storage():
+    # Videos fall back to local files when R2 isn't configured
+    if not os.environ.get("CLOUDFLARE_R2_BUCKET_NAME"):
+        return "not configured, serving local files"
+
+    get_s3_service().check_bucket()
+    return None
+
+
+def _check_openai():
+    # Only the configuration: an API call per probe would cost more than the probe is worth
+    get_api_key()
+    return None
+
+
+# Dependencies a worker needs to serve generation requests
+CHECKS = {
+    "mongodb": _check_mongodb,
+    "storage": _check_storage,
+    "openai": _check_openai,
+}
+
+
+def _run_check(name):
+    started = time.monotonic()
+    try:
+        detail = CHECKS[name]()
+        result = {"ok": True}
+        if detail:
+            result["detail"] = detail
+    except Exception as e:
+        result = {"ok": False, "detail": str(e)}
+        logger.warning(f"Readiness check {name} failed: {str(e)}")
+    result["duration"] = round(time.monotonic() - started, 4)
+    result["checked_at"] = time.time()
+    return result
+
+
+def _cached_check(name):
+    """The last result of a check, refreshed when older than READINESS_CACHE_SECONDS"""
+    with _results_lock:
+        cached = _results.get(name)
+        fresh = cached is not None and time.time() - cached["checked_at"] < READINESS_CACHE_SECONDS
+        # While one probe refreshes a check, concurrent probes answer with the previous result
+        if fresh or (cached is not None and name in _refreshing):
+            return cached
+        _refreshing.add(name)
+
+    try:
+        result = _run_check(name)
+    finally:
+        with _results_lock:
+            _refreshing.discard(name)
+
+    with _results_lock:
+        _results[name] = result
+    return result
+
+
+def check_readiness():
+    """
+    Check the dependencies of this worker (cached for READINESS_CACHE_SECONDS)
+
+    Must be called in an app context.
+
+    Returns:
+        tuple: (ready, dict of check name to {"ok", "detail", "duration", "checked_at"})
+    """
+    results = {name: _cached_check(name) for name in CHECKS}
+    return all(result["ok"] for result in results.values()), results
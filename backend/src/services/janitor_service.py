@@ -0,0 +1,297 @@
+import os
+import json
+import shutil
+import threading
+import time
+import fcntl
+import heapq
+from datetime import datetime, timedelta
+from flask import current_app
+from src.utils.storage import VIDEOS_DIR, find_video_dir
+from src.services.s3_service import get_s3_service
+from src.services.manim_service import cleanup_stale_scratch_dirs
+from src.models.video import versioned_update
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds between two janitor passes
+JANITOR_INTERVAL = int(os.environ.get("JANITOR_INTERVAL", 600))
+
+# Disk budget for local videos; uploaded videos are evicted beyond it
+VIDEOS_DISK_BUDGET_MB = int(os.environ.get("VIDEOS_DISK_BUDGET_MB", 10240))
+
+# Files worth keeping in a video directory; everything else is an intermediate
+KEPT_FILES = {"animation.py"}
+KEPT_EXTENSIONS = {".mp4", ".jpg", ".png", ".m3u8", ".ts"}
+
+# Directories under VIDEOS_DIR that aren't video directories
+RESERVED_DIRS = {".render_cache"}
+
+# Where a pass records how far it got, for the next pass (of any worker) to resume from
+JANITOR_STATE_FILE = ".janitor-state.json"
+
+# Videos updated this long before the previous pass started are looked at
+# again, covering clock differences between workers
+JANITOR_CURSOR_OVERLAP = timedelta(minutes=5)
+
+_janitor_thread = None
+
+# Directory path -> (mtime_ns, bytes of the files directly in it), so passes only
+# stat the files of directories that changed since the previous pass
+_dir_sizes = {}
+
+
+def delete_intermediates(video_dir):
+    """
+    Delete intermediate files (manim media trees, segments, temp files) from a video directory
+
+    Args:
+        video_dir (str): Directory of the video
+
+    Returns:
+        int: Number of bytes freed
+    """
+    if not video_dir or not os.path.isdir(video_dir):
+        return 0
+
+    freed = 0
+    for entry in os.scandir(video_dir):
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                freed += _directory_size(entry.path)
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif entry.name not in KEPT_FILES and os.path.splitext(entry.name)[1] not in KEPT_EXTENSIONS:
+                freed += entry.stat(follow_symlinks=False).st_size
+                os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Could not delete intermediate {entry.path}: {str(e)}")
+
+    return freed
+
+
+def _directory_size(path):
+    """Total size of the files under a directory"""
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        if dirpath == VIDEOS_DIR:
+            dirnames[:] = [name for name in dirnames if name not in RESERVED_DIRS]
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _videos_disk_usage():
+    """
+    Bytes used by the videos directory, re-reading file sizes only in
+    directories whose modification time changed since the last call
+
+    Rendered files are moved into place with a rename, which updates the
+    modification time of their directory.
+    """
+    total = 0
+    seen = set()
+    for dirpath, dirnames, filenames in os.walk(VIDEOS_DIR):
+        if dirpath == VIDEOS_DIR:
+            dirnames[:] = [name for name in dirnames if name not in RESERVED_DIRS]
+        try:
+            mtime_ns = os.stat(dirpath).st_mtime_ns
+        except OSError:
+            continue
+        seen.add(dirpath)
+        cached = _dir_sizes.get(dirpath)
+        if cached and cached[0] == mtime_ns:
+            total += cached[1]
+            continue
+
+        size = 0
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+        _dir_sizes[dirpath] = (mtime_ns, size)
+        total += size
+
+    for dirpath in set(_dir_sizes) - seen:
+        del _dir_sizes[dirpath]
+
+    return total
+
+
+def _last_used(video_path):
+    """When a local video file was last served or written, or None if it is gone"""
+    try:
+        file_stat = os.stat(video_path)
+    except OSError:
+        return None
+    # Local files are only read when they are served, so atime tracks recency
+    return max(file_stat.st_atime, file_stat.st_mtime)
+
+
+def update_eviction_candidates(state, started):
+    """
+    Add the videos uploaded since the previous pass to the eviction candidates
+    kept in the janitor state, with when their local file was last used
+
+    Args:
+        state (dict): Janitor state, updated in place
+        started (datetime): When the current pass started
+    """
+    candidates = state.setdefault("evictable", {})
+    query = {"status": "completed", "s3_video_url": {"$ne": None}, "video_path": {"$ne": None}}
+    if state.get("evictable_until"):
+        since = datetime.fromisoformat(state["evictable_until"]) - JANITOR_CURSOR_OVERLAP
+        query["updated_at"] = {"$gt": since}
+    for video_data in current_app.mongo_db.videos.find(query, {"video_path": 1}):
+        last_used = _last_used(video_data["video_path"])
+        if last_used is not None:
+            candidates[video_data["_id"]] = last_used
+    state["evictable_until"] = started.isoformat()
+
+
+def evict_uploaded_videos(budget_bytes, candidates):
+    """
+    Delete local copies of videos already stored in R2, least recently used
+    first, until the videos directory fits the disk budget
+
+    Only the videos taken off the candidates are looked up and stat'ed again:
+    one served since it was recorded goes back with its new time, one no
+    longer uploaded or local is dropped.
+
+    Args:
+        budget_bytes (int): Disk budget for the videos directory
+        candidates (dict): Video ID -> when its local file was last used
+            (see update_eviction_candidates), updated in place
+
+    Returns:
+        int: Number of bytes freed
+    """
+    used_bytes = _videos_disk_usage()
+    if used_bytes <= budget_bytes:
+        return 0
+
+    queue = [(last_used, video_id) for video_id, last_used in candidates.items()]
+    heapq.heapify(queue)
+
+    s3_service = get_s3_service()
+    freed = 0
+    while queue and used_bytes - freed > budget_bytes:
+        recorded, video_id = heapq.heappop(queue)
+        video_data = current_app.mongo_db.videos.find_one(
+            {"_id": video_id, "status": "completed", "s3_video_url": {"$ne": None}, "video_path": {"$ne": None}},
+            {"video_path": 1, "preview_path": 1, "s3_video_url": 1}
+        )
+        last_used = _last_used(video_data["video_path"]) if video_data else None
+        if last_used is None:
+            candidates.pop(video_id, None)
+            continue
+        if last_used > recorded:
+            candidates[video_id] = last_used
+            heapq.heappush(queue, (last_used, video_id))
+            continue
+
+        # Only evict what is verifiably in the bucket
+        key = s3_service.key_from_url(video_data["s3_video_url"])
+        if not key or not s3_service.object_exists(key):
+            continue
+
+        for path in (video_data.get("video_path"), video_data.get("preview_path")):
+            if path and os.path.exists(path):
+                freed += os.path.getsize(path)
+                os.remove(path)
+
+        current_app.mongo_db.videos.update_one(
+            {"_id": video_id},
+            versioned_update({"$set": {"video_path": None, "preview_path": None}})
+        )
+        del candidates[video_id]
+
+    logger.info(f"Evicted {freed} bytes of local videos already stored in R2")
+    return freed
+
+
+def run_janitor_pass():
+    """
+    Run one janitor pass: remove stale scratch directories, intermediates of
+    finished videos and, beyond the disk budget, local copies of uploaded videos
+
+    Only one worker runs a pass at a time (guarded by a lock file).
+
+    Returns:
+        dict: What the pass cleaned up, or None if another worker holds the lock
+    """
+    os.makedirs(VIDEOS_DIR, exist_ok=True)
+    with open(os.path.join(VIDEOS_DIR, ".janitor.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+
+        result = {"scratch_dirs": cleanup_stale_scratch_dirs(), "intermediate_bytes": 0}
+
+        # Only videos that finished since the previous pass still have intermediates
+        started = datetime.utcnow()
+        state = _read_state()
+        query = {"status": {"$in": ["completed", "failed"]}}
+        if state.get("intermediates_until"):
+            since = datetime.fromisoformat(state["intermediates_until"]) - JANITOR_CURSOR_OVERLAP
+            query["updated_at"] = {"$gt": since}
+        cursor = current_app.mongo_db.videos.find(query, {"_id": 1})
+        result["videos_checked"] = 0
+        for video_data in cursor:
+            result["videos_checked"] += 1
+            result["intermediate_bytes"] += delete_intermediates(find_video_dir(video_data["_id"]))
+        state["intermediates_until"] = started.isoformat()
+
+        # Likewise only videos uploaded since then join the eviction candidates
+        update_eviction_candidates(state, started)
+        result["evicted_bytes"] = evict_uploaded_videos(VIDEOS_DISK_BUDGET_MB * 1024 * 1024, state["evictable"])
+        _write_state(state)
+
+        return result
+
+
+def _read_state():
+    try:
+        with open(os.path.join(VIDEOS_DIR, JANITOR_STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state):
+    path = os.path.join(VIDEOS_DIR, JANITOR_STATE_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def start_janitor(app):
+    """
+    Start the background janitor thread (once per process)
+
+    Args:
+        app: Flask application instance
+    """
+    global _janitor_thread
+
+    if _janitor_thread is not None or JANITOR_INTERVAL <= 0:
+        return
+
+    def loop():
+        while True:
+            time.sleep(JANITOR_INTERVAL)
+            try:
+                with app.app_context():
+                    result = run_janitor_pass()
+                if result:
+                    logger.info(f"Janitor pass finished: {result}")
+            except Exception as e:
+                logger.error(f"Janitor pass failed: {str(e)}", exc_info=True)
+
+    _janitor_thread = threading.Thread(target=loop, name="videos-janitor", daemon=True)
+    _janitor_thread.start()
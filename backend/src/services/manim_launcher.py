@@ -0,0 +1,173 @@
+"""
+Runs the manim CLI with lookups in the shared render caches
+
+manim reuses a partial movie, a TeX SVG or a text SVG when a file named after
+the hash of the animation, TeX source or text settings already exists in the
+render's media directory. This launcher wraps the code computing those names:
+the cached file of the same name is linked in at the moment manim needs it.
+Any job hashing the same reuses it, whatever scene, user or retry made it.
+
+Usage: python manim_launcher.py <manim arguments>
+
+Where the caches are comes from the environment (see run_cached_render). The
+launcher runs in the sandboxed render process, so it only imports the
+standard library and manim.
+"""
+import os
+import sys
+
+# Cache directory (of the render quality) holding partial movies named <hash>.mp4
+PARTIAL_MOVIE_CACHE_ENV = "MANIM_PARTIAL_MOVIE_CACHE"
+
+# Cache directories of the SVGs compiled from TeX and rendered from text, named <hash>.svg
+TEX_CACHE_ENV = "MANIM_TEX_CACHE"
+TEXT_CACHE_ENV = "MANIM_TEXT_CACHE"
+
+
+def link_cached_file(cache_dir, name, target_dir):
+    """
+    Link a cached file into a directory under the same name
+
+    The cached file is marked as used, so eviction spares it while the render
+    runs (see render_cache.EVICTION_GRACE_PERIOD).
+
+    Args:
+        cache_dir (str): Cache directory to look in
+        name (str): File name (a content hash and extension)
+        target_dir (str): Directory manim looks for the file in
+
+    Returns:
+        bool: True if the file is in the directory afterwards
+    """
+    target = os.path.join(target_dir, name)
+    if os.path.lexists(target):
+        return True
+
+    source = os.path.join(cache_dir, name)
+    try:
+        os.utime(source)
+    except OSError:
+        # Not cached
+        return False
+
+    os.makedirs(target_dir, exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        return True
+    except OSError:
+        # Different filesystem (e.g. tmpfs scratch): fall back to a symlink
+        try:
+            os.symlink(source, target)
+        except FileExistsError:
+            return True
+        except OSError:
+            return False
+    return True
+
+
+def cached_partial_movie_lookup(is_already_cached, cache_dir, config):
+    """
+    Wrap SceneFileWriter.is_already_cached to look in the shared cache first
+
+    Args:
+        is_already_cached (callable): The original method
+        cache_dir (str): Partial movie cache directory of the render quality
+        config (dict): manim's config (read when looking up, after the CLI set it)
+
+    Returns:
+        callable: The wrapped method
+    """
+    def lookup(file_writer, hash_invocation):
+        partial_movie_dir = getattr(file_writer, "partial_movie_directory", None)
+        if partial_movie_dir is not None:
+            name = f"{hash_invocation}{config['movie_file_extension']}"
+            link_cached_file(cache_dir, name, str(partial_movie_dir))
+        return is_already_cached(file_writer, hash_invocation)
+
+    return lookup
+
+
+def cached_tex_file(generate_tex_file, cache_dir):
+    """
+    Wrap tex_file_writing.generate_tex_file, which names the .tex file after a
+    hash of the TeX source, to link in the cached SVG of the same name
+
+    Args:
+        generate_tex_file (callable): The original function
+        cache_dir (str): TeX SVG cache directory
+
+    Returns:
+        callable: The wrapped function
+    """
+    def generate(*args, **kwargs):
+        tex_file = generate_tex_file(*args, **kwargs)
+        name = os.path.splitext(os.path.basename(tex_file))[0] + ".svg"
+        link_cached_file(cache_dir, name, os.path.dirname(tex_file))
+        return tex_file
+
+    return generate
+
+
+def cached_text_hash(text2hash, cache_dir, config):
+    """
+    Wrap Text._text2hash, which names the SVG a text is rendered to, to link
+    in the cached SVG of that name
+
+    Args:
+        text2hash (callable): The original method
+        cache_dir (str): Text SVG cache directory
+        config: manim's config (for the text directory)
+
+    Returns:
+        callable: The wrapped method
+    """
+    def text_hash(text, *args, **kwargs):
+        hash_name = text2hash(text, *args, **kwargs)
+        link_cached_file(cache_dir, f"{hash_name}.svg", str(config.get_dir("text_dir")))
+        return hash_name
+
+    return text_hash
+
+
+def install_hooks(environ=os.environ):
+    """Wrap manim's cache lookups for the caches configured in the environment"""
+    from manim import config
+
+    partial_movie_cache = environ.get(PARTIAL_MOVIE_CACHE_ENV)
+    if partial_movie_cache:
+        from manim.scene.scene_file_writer import SceneFileWriter
+        SceneFileWriter.is_already_cached = cached_partial_movie_lookup(
+            SceneFileWriter.is_already_cached,
+            partial_movie_cache,
+            config
+        )
+
+    tex_cache = environ.get(TEX_CACHE_ENV)
+    if tex_cache:
+        # tex_to_svg_file calls it through the module, so replacing it there is enough
+        from manim.utils import tex_file_writing
+        tex_file_writing.generate_tex_file = cached_tex_file(tex_file_writing.generate_tex_file, tex_cache)
+
+    text_cache = environ.get(TEXT_CACHE_ENV)
+    if text_cache:
+        from manim.mobject.text.text_mobject import MarkupText, Text
+        for text_class in (Text, MarkupText):
+            text_class._text2hash = cached_text_hash(text_class._text2hash, text_cache, config)
+
+
+def main():
+    # Run as a script, the directory of this file comes first on sys.path;
+    # the rendered code must not be able to import the app's modules
+    if sys.path and os.path.abspath(sys.path[0] or ".") == os.path.dirname(os.path.abspath(__file__)):
+        del sys.path[0]
+
+    install_hooks()
+
+    from manim.__main__ import main as manim_main
+    sys.argv[0] = "manim"
+    manim_main()
+
+
+if __name__ == "__main__":
+    main()
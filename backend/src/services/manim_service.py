@@ -1,12 +1,140 @@
 import os
+import sys
 import subprocess
 import tempfile
 import shutil
 import stat
-import traceback
 import re
+import ast
+import signal
+import resource
+import threading
+import time
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from .openai_service import regenerate_with_error, test_manim_code
+from .model_router import get_model_router
+from .ffmpeg_service import concat_videos, remux_faststart
+from .render_cache import get_partial_movie_cache, get_tex_cache, read_used_partial_movies
+from .manim_launcher import PARTIAL_MOVIE_CACHE_ENV, TEX_CACHE_ENV, TEXT_CACHE_ENV
+from src.utils.tiers import get_tier_settings
+from src.utils.metrics import counter, gauge, histogram, SIZE_BUCKETS
+from src.utils.tracing import span
+from src.utils.log import get_logger, log_context, set_log_context
+
+logger = get_logger(__name__)
+
+# Maximum number of manim processes rendering at the same time in this process
+MAX_CONCURRENT_RENDERS = int(os.environ.get("MAX_CONCURRENT_RENDERS", os.cpu_count() or 2))
+
+# How often (in seconds) a running render checks for timeouts and cancellation
+RENDER_POLL_INTERVAL = 0.5
+
+# How often (in seconds) the external should_cancel callback is consulted
+CANCEL_CHECK_INTERVAL = float(os.environ.get("RENDER_CANCEL_CHECK_INTERVAL", 2))
+
+# Seconds to wait after SIGTERM before the process group is killed
+KILL_GRACE_PERIOD = 5
+
+# Manim quality presets and the output directory name manim uses for each
+QUALITY_FLAGS = {
+    "low": "-ql",         # 480p15
+    "medium": "-qm",      # 720p30
+    "high": "-qh",        # 1080p60
+    "production": "-qp",  # 1440p60
+}
+QUALITY_DIRS = {
+    "low": "480p15",
+    "medium": "720p30",
+    "high": "1080p60",
+    "production": "1440p60",
+}
+
+# Maximum number of segments a scene is split into for parallel rendering (1 disables it)
+MAX_RENDER_SEGMENTS = int(os.environ.get("RENDER_PARALLEL_SEGMENTS", os.cpu_count() or 1))
+
+# Scenes with fewer top-level animations than this are always rendered serially
+MIN_PARALLEL_ANIMATIONS = int(os.environ.get("RENDER_PARALLEL_MIN_ANIMATIONS", 6))
+
+# Scene methods that each count as one animation (they all go through Scene.play)
+ANIMATION_METHODS = {"play", "wait", "pause", "wait_until"}
+
+# Constructs whose state carries over between animations in ways that skipping
+# animations with -n does not reproduce (time-based updaters, unseeded randomness, sound)
+UNSAFE_SEGMENT_ATTRIBUTES = {"time", "renderer", "add_sound", "embed", "interactive_embed"}
+
+# Renders run in a per-job scratch directory on a fast local filesystem (tmpfs
+# in Docker); only the final video is copied to the videos volume
+RENDER_SCRATCH_DIR = os.environ.get("RENDER_SCRATCH_DIR", tempfile.gettempdir())
+SCRATCH_PREFIX = "manim-render-"
+
+# Runs backed by the shared caches use the manim CLI through manim_launcher,
+# which links cached files in as manim looks them up. The interpreter must have
+# manim installed (the app's own by default).
+MANIM_PYTHON = os.environ.get("MANIM_PYTHON", sys.executable)
+MANIM_LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manim_launcher.py")
+
+# Wall-clock limit in seconds of a dry run validating a generated candidate
+DRY_RUN_TIMEOUT = int(os.environ.get("DRY_RUN_TIMEOUT", 60))
+
+# manim config options for the directories, under the media directory, where it
+# writes the SVGs compiled from TeX and rendered from text. Both are named after
+# a hash of their content and reused when they already exist.
+TEX_CACHE_DIRS = {"tex_dir": "Tex", "text_dir": "texts"}
+
+# Wall-clock limit in seconds of a dry run pre-warming the TeX cache
+TEX_PREWARM_TIMEOUT = int(os.environ.get("TEX_PREWARM_TIMEOUT", 600))
+
+# Expressions compiled into the TeX cache by the prewarm-tex-cache command:
+# axis labels and numbers (DecimalNumber compiles one character at a time)
+# and formulas that come up again and again in explanations
+COMMON_TEX_EXPRESSIONS = [
+    *[str(digit) for digit in range(10)], "-", ".", ",",
+    "x", "y", "z", "t", "n", "a", "b", "c", "f(x)", "g(x)", "y = f(x)",
+    "\\pi", "\\theta", "\\alpha", "\\beta", "\\lambda", "\\sigma", "\\mu", "\\Delta", "\\infty",
+    "=", "+", "\\times", "\\cdot", "\\approx", "\\leq", "\\geq",
+    "x^2", "y = x^2", "a^2 + b^2 = c^2", "e^{i\\pi} + 1 = 0", "E = mc^2",
+    "\\frac{d}{dx}", "f'(x)", "\\frac{dy}{dx}", "\\int", "\\int_a^b f(x)\\,dx", "\\sum_{n=1}^{\\infty}",
+    "\\lim_{x \\to 0}", "\\sin(x)", "\\cos(x)", "\\tan(x)", "\\sin^2\\theta + \\cos^2\\theta = 1",
+    "\\sqrt{2}", "x = \\frac{-b \\pm \\sqrt{b^2 - 4ac}}{2a}", "\\vec{v}", "\\mathbb{R}",
+]
+
+PREWARM_SCENE = """from manim import *
+
+EXPRESSIONS = {expressions!r}
+
+
+class PrewarmTex(Scene):
+    def construct(self):
+        for expression in EXPRESSIONS:
+            try:
+                MathTex(expression)
+            except Exception:
+                # An expression that doesn't compile only skips itself
+                pass
+"""
+
+_render_slots = threading.BoundedSemaphore(MAX_CONCURRENT_RENDERS)
+
+RENDER_DURATION = histogram("render_duration_seconds", "render_video duration by quality and outcome", ["quality", "outcome"])
+RENDER_OUTPUT_BYTES = histogram("render_output_bytes", "Size of rendered videos by quality", ["quality"], SIZE_BUCKETS)
+RENDER_RETRIES = counter("render_retries_total", "Render attempts retried with regenerated code, by cause", ["cause"])
+RENDERS_IN_FLIGHT = gauge("renders_in_flight", "render_video calls in progress by tier", ["tier"])
+RENDER_SLOT_WAITERS = gauge("render_slot_waiters", "manim processes waiting for a free render slot")
+
+# In-flight renders keyed by video ID: {"event": threading.Event, "processes": set}
+_active_renders = {}
+_active_renders_lock = threading.Lock()
+
+
+class RenderCancelled(Exception):
+    """Raised when a render is cancelled by the user"""
+    pass
+
+
+class RenderTimeout(Exception):
+    """Raised when a manim process exceeds its wall-clock or CPU limit"""
+    pass
 
 def set_permissions(path, is_dir=False):
     """
@@ -25,11 +153,720 @@ def set_permissions(path, is_dir=False):
             os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IROTH | stat.S_IWOTH)
         return True
     except Exception as e:
-        print(f"Permission setting failed for {path}: {str(e)}")
-        print(traceback.format_exc())
+        logger.warning(f"Permission setting failed for {path}: {str(e)}", exc_info=True)
         return False
 
-def render_video(code_file_path, output_dir, original_prompt=None, max_retries=3):
+def find_scene_class(code):
+    """
+    Find the name of the first Scene class in manim code
+    
+    Args:
+        code (str): The manim code
+        
+    Returns:
+        str: Name of the scene class, or None if there is none
+    """
+    for line in code.split('\n'):
+        if "class" in line and "Scene" in line:
+            # Extract class name (assuming format "class ClassName(Scene):")
+            return line.split("class ")[1].split("(")[0].strip()
+    
+    return None
+
+def check_manim_code(code):
+    """
+    Run the pre-render checks on manim code without rendering it
+    
+    Args:
+        code (str): The manim code to check
+        
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    try:
+        compile(code, '<string>', 'exec')
+    except SyntaxError as se:
+        return False, f"Syntax error: {str(se)}"
+    
+    is_valid, error_message = test_manim_code(code)
+    if not is_valid:
+        return False, error_message
+    
+    if not find_scene_class(code):
+        return False, "No Scene class found in the code"
+    
+    return True, None
+
+def validate_manim_code(code, cancel_event=None, limits=None):
+    """
+    Validate manim code with the static checks and a dry run, which executes
+    construct() without writing any frames or video
+    
+    Suitable as the validate callback of generate_manim_code().
+    
+    Args:
+        code (str): The manim code to validate
+        cancel_event (threading.Event): Event set when the validation is no longer needed
+        limits (dict): Tier settings used for the resource limits
+        
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    is_valid, error_message = check_manim_code(code)
+    if not is_valid:
+        return False, error_message
+    
+    limits = dict(limits or get_tier_settings(None))
+    limits["render_timeout"] = min(limits.get("render_timeout") or DRY_RUN_TIMEOUT, DRY_RUN_TIMEOUT)
+    
+    return _dry_run(code, limits, cancel_event=cancel_event)
+
+def _dry_run(code, limits, cancel_event=None, file_name="candidate"):
+    """
+    Execute the construct() of a scene with manim --dry_run in a scratch directory
+    
+    TeX and text SVGs come from the shared TeX cache, and the ones compiled by
+    a successful run are published to it, so the render of a validated
+    candidate finds them.
+    
+    Args:
+        code (str): The manim code
+        limits (dict): Tier settings for the manim process
+        cancel_event (threading.Event): Event set when the run is no longer needed
+        file_name (str): Module name of the code file
+        
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    os.makedirs(RENDER_SCRATCH_DIR, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f"{SCRATCH_PREFIX}dry-run-", dir=RENDER_SCRATCH_DIR)
+    try:
+        code_path = os.path.join(work_dir, f"{file_name}.py")
+        with open(code_path, "w") as f:
+            f.write(code)
+        
+        media_dir = os.path.join(work_dir, "media")
+        scene_class = find_scene_class(code)
+        command = [
+            "manim", code_path, scene_class,
+            QUALITY_FLAGS["low"],
+            "--dry_run",
+            "--media_dir", media_dir
+        ]
+        env = None
+        cache_env = _cache_environment()
+        if cache_env:
+            command, env = _launch_with_caches(command, cache_env)
+            command += ["--config_file", _write_manim_config(media_dir, _tex_cache_options(media_dir))]
+        
+        process = run_manim_command(command, limits, cancel_event=cancel_event, cwd=work_dir, env=env)
+        if process.returncode == 0:
+            _publish_tex_cache(media_dir)
+    except RenderCancelled:
+        return False, "Validation was cancelled"
+    except RenderTimeout as e:
+        return False, str(e)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if process.returncode != 0:
+        # The exception is the last line of the traceback
+        error_lines = [line.strip() for line in process.stderr.splitlines() if line.strip()]
+        return False, error_lines[-1] if error_lines else f"manim exited with code {process.returncode}"
+    
+    return True, None
+
+def prewarm_tex_cache(expressions=None, codes=()):
+    """
+    Compile TeX expressions and the TeX of manim scenes into the shared TeX
+    cache ahead of the renders that need them
+    
+    Args:
+        expressions (list): TeX math expressions (default: COMMON_TEX_EXPRESSIONS)
+        codes (iterable): (name, code) of scenes to dry-run, e.g. template examples
+        
+    Returns:
+        list: (name, error_message) per dry run, error_message being None on success
+    """
+    if not get_tex_cache():
+        raise ValueError("The TeX cache is disabled (TEX_CACHE_ENABLED=false)")
+    
+    limits = dict(get_tier_settings(None))
+    limits["render_timeout"] = TEX_PREWARM_TIMEOUT
+    limits["render_cpu_limit"] = None
+    
+    expressions = COMMON_TEX_EXPRESSIONS if expressions is None else expressions
+    runs = [("expressions", PREWARM_SCENE.format(expressions=list(expressions)))] if expressions else []
+    runs += list(codes)
+    
+    results = []
+    for name, code in runs:
+        is_valid, error_message = _dry_run(code, limits, file_name="prewarm")
+        results.append((name, error_message))
+    
+    return results
+
+def _limit_resources(cpu_seconds, memory_mb):
+    """
+    Build a preexec function that applies resource limits to a child process
+    
+    Args:
+        cpu_seconds (int): CPU time limit in seconds (RLIMIT_CPU)
+        memory_mb (int): Address space limit in megabytes (RLIMIT_AS)
+        
+    Returns:
+        callable: Function to run in the child before exec
+    """
+    def apply_limits():
+        if cpu_seconds:
+            # The soft limit delivers SIGXCPU, the hard limit SIGKILL shortly after
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + KILL_GRACE_PERIOD))
+        if memory_mb:
+            memory_bytes = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    
+    return apply_limits
+
+def _kill_process_group(process):
+    """
+    Terminate a process and all of its children (latex, ffmpeg, ...)
+    
+    Args:
+        process (subprocess.Popen): Process started in its own session
+    """
+    if process.poll() is not None:
+        return
+    
+    try:
+        pgid = os.getpgid(process.pid)
+        os.killpg(pgid, signal.SIGTERM)
+        try:
+            process.wait(timeout=KILL_GRACE_PERIOD)
+        except subprocess.TimeoutExpired:
+            os.killpg(pgid, signal.SIGKILL)
+            process.wait()
+    except ProcessLookupError:
+        # The process exited between the poll and the kill
+        pass
+
+def _register_render(video_id):
+    """Register an in-flight render and return its cancellation event"""
+    with _active_renders_lock:
+        render = _active_renders.setdefault(video_id, {"event": threading.Event(), "processes": set(), "users": 0})
+        render["users"] += 1
+        return render["event"]
+
+def _unregister_render(video_id):
+    """Drop an in-flight render once its last user is done with it"""
+    with _active_renders_lock:
+        render = _active_renders.get(video_id)
+        if render:
+            render["users"] -= 1
+            if render["users"] <= 0:
+                del _active_renders[video_id]
+
+def _track_process(video_id, process, add=True):
+    """Add or remove a running process from an in-flight render"""
+    with _active_renders_lock:
+        render = _active_renders.get(video_id)
+        if not render:
+            return
+        if add:
+            render["processes"].add(process)
+        else:
+            render["processes"].discard(process)
+
+def cancel_render(video_id):
+    """
+    Cancel an in-flight render, killing its manim processes and freeing its slot
+    
+    Args:
+        video_id (str): ID of the video being rendered
+        
+    Returns:
+        bool: True if a render was in flight in this process
+    """
+    with _active_renders_lock:
+        render = _active_renders.get(video_id)
+        if not render:
+            return False
+        render["event"].set()
+        processes = list(render["processes"])
+    
+    for process in processes:
+        logger.info(f"Killing manim process {process.pid} for cancelled video {video_id}")
+        _kill_process_group(process)
+    
+    return True
+
+def cancel_all_renders():
+    """
+    Cancel every in-flight render of this process (e.g. on worker shutdown)
+    
+    Returns:
+        list: Keys (video IDs) of the cancelled renders
+    """
+    with _active_renders_lock:
+        keys = list(_active_renders)
+    
+    return [key for key in keys if cancel_render(key)]
+
+def _acquire_render_slot(cancel_event, should_cancel=None):
+    """Wait for a free render slot, giving up if the render is cancelled"""
+    if _render_slots.acquire(blocking=False):
+        return
+    
+    last_check = time.monotonic()
+    with RENDER_SLOT_WAITERS.track():
+        while not _render_slots.acquire(timeout=RENDER_POLL_INTERVAL):
+            if cancel_event.is_set():
+                raise RenderCancelled("Render was cancelled while waiting for a free slot")
+            if should_cancel and time.monotonic() - last_check >= CANCEL_CHECK_INTERVAL:
+                last_check = time.monotonic()
+                if should_cancel():
+                    raise RenderCancelled("Render was cancelled while waiting for a free slot")
+
+def run_manim_command(command, limits, video_id=None, cancel_event=None, should_cancel=None, cwd=None, env=None):
+    """
+    Run a manim command with a wall-clock timeout, resource limits and cancellation
+    
+    Args:
+        command (list): Command line to execute
+        limits (dict): Tier settings with render_timeout, render_cpu_limit and render_memory_limit
+        video_id (str): ID of the video being rendered (used for cancellation)
+        cancel_event (threading.Event): Event set when the render is cancelled
+        should_cancel (callable): Optional callback polled to detect cancellation from other workers
+        cwd (str): Working directory for the process
+        env (dict): Environment of the process (defaults to this process' environment)
+        
+    Returns:
+        subprocess.CompletedProcess: Result of the command
+    """
+    cancel_event = cancel_event or threading.Event()
+    _acquire_render_slot(cancel_event, should_cancel)
+    
+    try:
+        process = subprocess.Popen(
+            command,
+            cwd=cwd,
+            env=env,
+            text=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,  # Own process group so children can be killed too
+            preexec_fn=_limit_resources(limits.get("render_cpu_limit"), limits.get("render_memory_limit"))
+        )
+        if video_id:
+            _track_process(video_id, process)
+        
+        timeout = limits.get("render_timeout")
+        deadline = time.monotonic() + timeout if timeout else None
+        last_check = time.monotonic()
+        
+        try:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(timeout=RENDER_POLL_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                
+                now = time.monotonic()
+                if should_cancel and now - last_check >= CANCEL_CHECK_INTERVAL:
+                    last_check = now
+                    if should_cancel():
+                        cancel_event.set()
+                
+                if cancel_event.is_set():
+                    _kill_process_group(process)
+                    process.communicate()
+                    raise RenderCancelled("Render was cancelled")
+                
+                if deadline and now > deadline:
+                    _kill_process_group(process)
+                    process.communicate()
+                    raise RenderTimeout(
+                        f"Rendering exceeded the time limit of {timeout} seconds. "
+                        "The animation may contain an infinite loop or be too long."
+                    )
+        finally:
+            if video_id:
+                _track_process(video_id, process, add=False)
+        
+        # A cancellation can kill the process before the loop notices the event
+        if cancel_event.is_set():
+            raise RenderCancelled("Render was cancelled")
+        
+        if process.returncode == -signal.SIGXCPU:
+            raise RenderTimeout(
+                f"Rendering exceeded the CPU time limit of {limits['render_cpu_limit']} seconds. "
+                "The animation may contain an infinite loop or be too long."
+            )
+        
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+    finally:
+        _render_slots.release()
+
+def _write_manim_config(media_dir, options):
+    """
+    Write a manim config file for a render
+    
+    Args:
+        media_dir (str): Media directory of the render (the file is written there)
+        options (dict): Options for the [CLI] section
+        
+    Returns:
+        str: Path to the config file
+    """
+    os.makedirs(media_dir, exist_ok=True)
+    config_path = os.path.join(media_dir, "manim.cfg")
+    with open(config_path, "w") as f:
+        f.write("[CLI]\n")
+        for key, value in options.items():
+            f.write(f"{key} = {value}\n")
+    
+    return config_path
+
+def _tex_cache_options(media_dir):
+    """
+    manim config options putting its TeX and text directories in the media
+    directory of a run, where manim_launcher links the cached SVGs
+    """
+    return {key: os.path.join(media_dir, name) for key, name in TEX_CACHE_DIRS.items()}
+
+def _cache_environment(quality=None):
+    """
+    Environment variables pointing manim_launcher at the enabled shared caches
+    
+    Args:
+        quality (str): Render quality whose partial movies are looked up (None for dry runs)
+        
+    Returns:
+        dict: The variables, empty if no cache is enabled
+    """
+    env = {}
+    tex_cache = get_tex_cache()
+    if tex_cache:
+        env[TEX_CACHE_ENV] = tex_cache.namespace_dir(TEX_CACHE_DIRS["tex_dir"])
+        env[TEXT_CACHE_ENV] = tex_cache.namespace_dir(TEX_CACHE_DIRS["text_dir"])
+    
+    cache = get_partial_movie_cache()
+    if cache and quality:
+        env[PARTIAL_MOVIE_CACHE_ENV] = cache.namespace_dir(QUALITY_DIRS[quality])
+    
+    return env
+
+def _launch_with_caches(command, cache_env):
+    """
+    Run a manim command through manim_launcher
+    
+    Returns:
+        tuple: (command, environment of the process)
+    """
+    return [MANIM_PYTHON, MANIM_LAUNCHER] + command[1:], {**os.environ, **cache_env}
+
+def _publish_tex_cache(media_dir):
+    """
+    Publish the TeX and text SVGs compiled by a successful run to the TeX cache
+    
+    manim_launcher only links in the SVGs manim asks for, so every linked SVG
+    is a hit and every compiled one a miss.
+    
+    Args:
+        media_dir (str): Media directory of the run
+    """
+    cache = get_tex_cache()
+    if not cache:
+        return
+    
+    hits = misses = 0
+    for name in TEX_CACHE_DIRS.values():
+        directory = os.path.join(media_dir, name)
+        linked = cache.cached_names(directory, name, suffix=".svg")
+        hits += len(linked)
+        misses += cache.publish_from(directory, name, linked, suffix=".svg")
+    
+    if hits or misses:
+        cache.record(hits, misses)
+        logger.info(f"TeX cache: {hits} hits, {misses} misses, hit rate {cache.stats()['hit_rate']:.0%}")
+
+def run_cached_render(command, media_dir, file_name, scene_class, quality, limits, **kwargs):
+    """
+    Run a manim render with its partial movie, TeX and text directories backed
+    by the shared caches
+    
+    The render runs through manim_launcher, which links a cached file into the
+    render's media directory when manim looks up its hash: an animation, TeX
+    expression or text already rendered by any job is not rendered again.
+    After a successful render the new files are published to the caches.
+    
+    Args:
+        command (list): manim command, without --media_dir
+        media_dir (str): Media directory of the render
+        file_name (str): Module name of the code file
+        scene_class (str): Name of the scene
+        quality (str): Render quality
+        limits (dict): Tier settings for the manim process
+        **kwargs: Passed on to run_manim_command()
+        
+    Returns:
+        subprocess.CompletedProcess: Result of the command
+    """
+    command = command + ["--media_dir", media_dir]
+    cache_env = _cache_environment(quality)
+    if cache_env:
+        command, kwargs["env"] = _launch_with_caches(command, cache_env)
+    
+    options = {}
+    if TEX_CACHE_ENV in cache_env:
+        options.update(_tex_cache_options(media_dir))
+    
+    cache = get_partial_movie_cache()
+    if cache:
+        namespace = QUALITY_DIRS[quality]
+        partial_movie_dir = os.path.join(media_dir, "videos", file_name, namespace, "partial_movie_files", scene_class)
+        # Keep manim from pruning the linked files (it caps the cache at 100 files by default)
+        options["max_files_cached"] = -1
+    
+    if options:
+        command += ["--config_file", _write_manim_config(media_dir, options)]
+    
+    process = run_manim_command(command, limits, **kwargs)
+    
+    if process.returncode == 0:
+        _publish_tex_cache(media_dir)
+    
+    if process.returncode == 0 and cache:
+        used = read_used_partial_movies(partial_movie_dir)
+        linked = cache.cached_names(partial_movie_dir, namespace)
+        hits = used & linked if used else linked
+        published = cache.publish_from(partial_movie_dir, namespace, linked, only=used or None)
+        misses = len(used - linked) if used else published
+        cache.record(len(hits), misses)
+        logger.info(f"Partial movie cache: {len(hits)} hits, {misses} misses, {published} published, "
+                    f"hit rate {cache.stats()['hit_rate']:.0%}")
+    
+    return process
+
+def _is_self_call(node, method_names=None):
+    """Check whether a node is a call like self.<method>(...)"""
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == "self"
+        and (method_names is None or node.func.attr in method_names)
+    )
+
+def _is_segment_safe(scene_node):
+    """
+    Check that a scene has no state that would differ when rendered in segments
+    
+    Args:
+        scene_node (ast.ClassDef): The scene class
+        
+    Returns:
+        bool: True if the scene can be split at animation boundaries
+    """
+    uses_random = False
+    seeds_random = False
+    
+    for node in ast.walk(scene_node):
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            return False
+        if isinstance(node, ast.Attribute) and node.attr in UNSAFE_SEGMENT_ATTRIBUTES:
+            return False
+        if isinstance(node, (ast.Name, ast.Attribute)):
+            name = node.id if isinstance(node, ast.Name) else node.attr
+            if "random" in name:
+                uses_random = True
+            if "seed" in name:
+                seeds_random = True
+        # Updaters taking dt accumulate time, which skipped animations don't advance
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "add_updater":
+            for arg in node.args[:1]:
+                if isinstance(arg, ast.Lambda) and len(arg.args.args) > 1:
+                    return False
+                if isinstance(arg, ast.Name):
+                    for function in ast.walk(scene_node):
+                        if isinstance(function, ast.FunctionDef) and function.name == arg.id and len(function.args.args) > 1:
+                            return False
+    
+    return not uses_random or seeds_random
+
+def plan_render_segments(code, scene_class, max_segments=MAX_RENDER_SEGMENTS):
+    """
+    Split a scene into ranges of animations that can be rendered in parallel
+    
+    The scene is split at its top-level self.play/self.wait calls, or at its
+    self.next_section() markers when it has any. Animations are numbered the
+    way manim's -n option counts them.
+    
+    Args:
+        code (str): The manim code
+        scene_class (str): Name of the scene to render
+        max_segments (int): Maximum number of segments
+        
+    Returns:
+        list: (first, last) animation numbers per segment, last being None for
+              the final segment, or None if the scene must be rendered serially
+    """
+    if max_segments < 2:
+        return None
+    
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    
+    scene_node = next((node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == scene_class), None)
+    if scene_node is None:
+        return None
+    
+    construct = next((node for node in scene_node.body if isinstance(node, ast.FunctionDef) and node.name == "construct"), None)
+    if construct is None or not _is_segment_safe(scene_node):
+        return None
+    
+    helper_methods = {node.name for node in scene_node.body if isinstance(node, ast.FunctionDef)} - {"construct"}
+    
+    animation_count = 0
+    section_starts = []
+    for statement in construct.body:
+        if isinstance(statement, ast.Expr) and _is_self_call(statement.value, ANIMATION_METHODS):
+            animation_count += 1
+            continue
+        if isinstance(statement, ast.Expr) and _is_self_call(statement.value, {"next_section"}):
+            section_starts.append(animation_count)
+            continue
+        # Animations inside loops, conditionals or helper methods can't be counted statically
+        for node in ast.walk(statement):
+            if _is_self_call(node, ANIMATION_METHODS | helper_methods | {"next_section"}):
+                return None
+    
+    if animation_count < max(MIN_PARALLEL_ANIMATIONS, 2):
+        return None
+    
+    # Candidate boundaries: explicit sections if present, otherwise every animation.
+    # The first segment never ends at animation 0: manim reads "-n 0,0" as no
+    # upper bound and would render the whole scene.
+    if section_starts:
+        boundaries = sorted({start for start in section_starts if 1 < start < animation_count})
+    else:
+        boundaries = list(range(2, animation_count))
+    
+    segment_count = min(max_segments, len(boundaries) + 1)
+    if segment_count < 2:
+        return None
+    
+    # Pick the boundaries closest to an even split of the animations
+    starts = [0]
+    for index in range(1, segment_count):
+        target = index * animation_count / segment_count
+        boundary = min((b for b in boundaries if b > starts[-1]), key=lambda b: abs(b - target), default=None)
+        if boundary is None:
+            break
+        starts.append(boundary)
+    
+    segments = []
+    for index, start in enumerate(starts):
+        last = starts[index + 1] - 1 if index + 1 < len(starts) else None
+        segments.append((start, last))
+    
+    return segments if len(segments) > 1 else None
+
+def _render_segments(command, segments, work_dir, file_name, scene_class, quality, output_path,
+                     limits, render_key, cancel_event, should_cancel):
+    """
+    Render animation ranges of a scene in parallel manim processes and join them
+    
+    Args:
+        command (list): Base manim command without --media_dir or -n
+        segments (list): Animation ranges from plan_render_segments()
+        work_dir (str): Directory for the per-segment media trees
+        file_name (str): Module name of the code file
+        scene_class (str): Name of the scene
+        quality (str): Render quality
+        output_path (str): Path of the joined video
+        limits (dict): Tier settings for each manim process
+        render_key (str): Key of the render for cancellation
+        cancel_event (threading.Event): Event set when the render is cancelled
+        should_cancel (callable): Optional cancellation callback
+        
+    Returns:
+        tuple: (subprocess.CompletedProcess, path to the joined video or None on failure)
+    """
+    # Set when a segment fails so its siblings stop early
+    abort_event = threading.Event()
+    
+    def check_cancelled():
+        # Cancellation of the whole render also stops segments waiting for a slot
+        if not cancel_event.is_set() and should_cancel and should_cancel():
+            cancel_event.set()
+        return cancel_event.is_set()
+    
+    def render_segment(index, first, last):
+        segment_media_dir = os.path.join(work_dir, f"segment_{index}", "media")
+        os.makedirs(segment_media_dir, exist_ok=True)
+        animation_range = f"{first},{last}" if last is not None else str(first)
+        segment_command = command + ["-n", animation_range]
+        logger.debug(f"Executing segment {index}: {' '.join(segment_command)}")
+        
+        try:
+            process = run_cached_render(
+                segment_command,
+                segment_media_dir,
+                file_name,
+                scene_class,
+                quality,
+                limits,
+                video_id=render_key,
+                cancel_event=abort_event,
+                should_cancel=check_cancelled
+            )
+        except RenderCancelled:
+            return None, None
+        except Exception:
+            # A timeout or crash of one segment stops its siblings as well
+            abort_event.set()
+            raise
+        
+        if process.returncode != 0:
+            abort_event.set()
+            return process, None
+        
+        quality_dir = Path(segment_media_dir) / "videos" / file_name / QUALITY_DIRS[quality]
+        videos = sorted(quality_dir.glob("*.mp4"), key=lambda path: path.stat().st_mtime)
+        return process, str(videos[-1]) if videos else None
+    
+    # Start from a clean work directory so files from a failed attempt are never reused
+    shutil.rmtree(work_dir, ignore_errors=True)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            futures = [executor.submit(render_segment, index, first, last) for index, (first, last) in enumerate(segments)]
+            results = [future.result() for future in futures]
+        
+        if cancel_event.is_set():
+            raise RenderCancelled("Render was cancelled")
+        
+        # Report the first real failure (aborted siblings return no process)
+        for process, _ in results:
+            if process is not None and process.returncode != 0:
+                return process, None
+        
+        stdout = "\n".join(process.stdout for process, _ in results if process is not None)
+        segment_files = [path for _, path in results]
+        if None in segment_files:
+            return subprocess.CompletedProcess(command, 1, stdout, "A segment did not produce a video file"), None
+        
+        concat_videos(segment_files, output_path)
+        
+        return subprocess.CompletedProcess(command, 0, stdout, ""), output_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def render_video(code_file_path, output_dir, original_prompt=None, max_retries=3,
+                 video_id=None, tier="free", should_cancel=None, quality="medium"):
     """
     Renders manim code into a video with automatic error recovery
     
@@ -38,18 +875,108 @@ def render_video(code_file_path, output_dir, original_prompt=None, max_retries=3
         output_dir (str): Directory to store the output video
         original_prompt (str): Original prompt used to generate the code (for retries)
         max_retries (int): Maximum number of retry attempts
+        video_id (str): ID of the video, used to cancel the render with cancel_render()
+        tier (str): Subscription tier of the user, selects timeouts and resource limits
+        should_cancel (callable): Optional callback returning True when the render should stop
+        quality (str): Render quality, one of QUALITY_FLAGS
         
     Returns:
         str: Path to the rendered video file
     """
-    print(f"Starting video rendering process")
-    print(f"Code file: {code_file_path}")
-    print(f"Output directory: {output_dir}")
+    if quality not in QUALITY_FLAGS:
+        raise ValueError(f"Unknown render quality: {quality}")
+    
+    limits = get_tier_settings(tier)
+    render_key = video_id or code_file_path
+    cancel_event = _register_render(render_key)
     
+    # Everything manim writes (media tree, partial movies, tex files) stays in scratch
+    os.makedirs(RENDER_SCRATCH_DIR, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(prefix=f"{SCRATCH_PREFIX}{video_id or 'job'}-", dir=RENDER_SCRATCH_DIR)
+    logger.info(f"Starting {quality} render of {code_file_path}",
+                extra={"video_id": video_id, "output_dir": output_dir, "scratch_dir": scratch_dir, "tier": tier})
+    
+    outcome = "failed"
+    started = time.monotonic()
+    RENDERS_IN_FLIGHT.inc(tier=tier)
+    try:
+        # Code regenerations after failed attempts are timed as their own stage
+        with log_context(video_id=video_id, quality=quality), span("render", quality=quality, tier=tier):
+            output_path = _render_with_retries(code_file_path, output_dir, original_prompt, max_retries,
+                                               limits, render_key, cancel_event, should_cancel, quality,
+                                               scratch_dir)
+        outcome = "success"
+        RENDER_OUTPUT_BYTES.observe(os.path.getsize(output_path), quality=quality)
+        return output_path
+    except RenderCancelled:
+        outcome = "cancelled"
+        raise
+    except RenderTimeout:
+        outcome = "timeout"
+        raise
+    finally:
+        RENDERS_IN_FLIGHT.dec(tier=tier)
+        RENDER_DURATION.observe(time.monotonic() - started, quality=quality, outcome=outcome)
+        # Deterministic cleanup on success, failure and cancellation
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        _unregister_render(render_key)
+
+def cleanup_stale_scratch_dirs(max_age=24 * 3600):
+    """
+    Remove scratch directories left behind by renders whose process died
+    
+    Args:
+        max_age (int): Minimum age in seconds of the directories to remove
+        
+    Returns:
+        int: Number of directories removed
+    """
+    if not os.path.isdir(RENDER_SCRATCH_DIR):
+        return 0
+    
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in os.scandir(RENDER_SCRATCH_DIR):
+        try:
+            if entry.name.startswith(SCRATCH_PREFIX) and entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    
+    return removed
+
+def _regenerate_code(original_prompt, error_message, limits, cause):
+    """
+    Regenerate the code after an error, speculatively generating and dry-running
+    several candidates in parallel when the tier allows it
+    """
+    RENDER_RETRIES.inc(cause=cause)
+    candidates = limits.get("codegen_candidates", 1)
+    validate = None
+    if candidates > 1:
+        validate = lambda code, cancel_event: validate_manim_code(code, cancel_event, limits)
+    
+    with span("retry", cause=cause):
+        return regenerate_with_error(original_prompt, error_message, candidates=candidates, validate=validate)
+
+def _report_render_outcome(code, success):
+    """Let the model router know whether the code it routed rendered"""
+    if code:
+        get_model_router().record_outcome(code, success)
+
+def _render_with_retries(code_file_path, output_dir, original_prompt, max_retries,
+                         limits, render_key, cancel_event, should_cancel, quality, scratch_dir):
+    """Render loop of render_video, regenerating the code after failures"""
     attempt = 0
     last_error = None
     
     while attempt < max_retries:
+        if cancel_event.is_set():
+            raise RenderCancelled("Render was cancelled")
+        set_log_context(attempt=attempt + 1)
+        current_code = None
+        
         try:
             # Read the current code
             with open(code_file_path, 'r') as f:
@@ -58,77 +985,101 @@ def render_video(code_file_path, output_dir, original_prompt=None, max_retries=3
             # Run static analysis on the code first
             is_valid, error_message = test_manim_code(current_code)
             if not is_valid and original_prompt:
-                print(f"Static analysis found issue: {error_message}")
+                logger.warning(f"Static analysis found issue: {error_message}")
+                _report_render_outcome(current_code, False)
                 # Regenerate code with error feedback
-                updated_code = regenerate_with_error(original_prompt, error_message)
+                updated_code = _regenerate_code(original_prompt, error_message, limits, "static_analysis")
                 
                 # Save the regenerated code
                 with open(code_file_path, 'w') as f:
                     f.write(updated_code)
                     
-                print(f"Regenerated code due to known issue")
+                logger.info("Regenerated code due to known issue")
                 attempt += 1
                 continue
             
             # Make sure the output directory exists with proper permissions
             if not os.path.exists(output_dir):
                 os.makedirs(output_dir, exist_ok=True)
-                print(f"Created output directory: {output_dir}")
+                logger.debug(f"Created output directory: {output_dir}")
             
             # Set directory permissions
             set_permissions(output_dir, is_dir=True)
-            print(f"Set permissions on output directory")
             
             # Get the file name without extension
             file_name = os.path.basename(code_file_path).split('.')[0]
             
             # Ensure the code file has the right permissions
             set_permissions(code_file_path)
-            print(f"Set permissions on code file")
             
             # Find the first Scene class in the code
-            scene_class = None
-            for line in current_code.split('\n'):
-                if "class" in line and "Scene" in line:
-                    # Extract class name (assuming format "class ClassName(Scene):")
-                    parts = line.split("class ")[1].split("(")[0].strip()
-                    scene_class = parts
-                    break
+            scene_class = find_scene_class(current_code)
             
             if not scene_class:
                 raise Exception("No Scene class found in the generated code")
             
-            print(f"Found scene class: {scene_class}")
+            logger.debug(f"Found scene class: {scene_class}")
             
-            # Prepare a media directory with correct permissions
-            media_dir = os.path.join(os.path.dirname(code_file_path), "media")
-            if not os.path.exists(media_dir):
-                os.makedirs(media_dir, exist_ok=True)
-                set_permissions(media_dir, is_dir=True)
+            # Render a copy of the current code from the scratch directory
+            work_code_path = os.path.join(scratch_dir, os.path.basename(code_file_path))
+            with open(work_code_path, 'w') as f:
+                f.write(current_code)
+            
+            # Start every attempt from an empty media directory, so nothing a
+            # killed or failed attempt left behind is mistaken for a cached file
+            media_dir = os.path.join(scratch_dir, "media")
+            shutil.rmtree(media_dir, ignore_errors=True)
+            os.makedirs(media_dir, exist_ok=True)
             
             # Run the manim command to render the video
             command = [
                 "manim",  
-                code_file_path, 
+                work_code_path, 
                 scene_class,
-                "-qm",  # Medium quality
+                QUALITY_FLAGS[quality],
                 "--format", "mp4"  # Ensure mp4 output format
             ]
             
-            print(f"Executing command: {' '.join(command)}")
-            
-            # Execute the command
-            process = subprocess.run(
-                command,
-                text=True,
-                capture_output=True,
-                check=False
-            )
+            # Long scenes are split into animation ranges rendered in parallel
+            segments = plan_render_segments(current_code, scene_class)
+            if segments:
+                logger.info(f"Rendering {len(segments)} segments in parallel: {segments}")
+                quality_dir = os.path.join(media_dir, "videos", file_name, QUALITY_DIRS[quality])
+                os.makedirs(quality_dir, exist_ok=True)
+                process, _ = _render_segments(
+                    command,
+                    segments,
+                    os.path.join(scratch_dir, "segments"),
+                    file_name,
+                    scene_class,
+                    quality,
+                    os.path.join(quality_dir, f"{scene_class}.mp4"),
+                    limits,
+                    render_key,
+                    cancel_event,
+                    should_cancel
+                )
+            else:
+                logger.debug(f"Executing command: {' '.join(command)}")
+                
+                # Execute the command
+                process = run_cached_render(
+                    command,
+                    media_dir,
+                    file_name,
+                    scene_class,
+                    quality,
+                    limits,
+                    video_id=render_key,
+                    cancel_event=cancel_event,
+                    should_cancel=should_cancel
+                )
             
-            print(f"Command output: {process.stdout}")
+            # Full manim output only at debug level; it is truncated in the log either way
+            logger.debug("manim finished", extra={"returncode": process.returncode, "stdout": process.stdout})
             
             if process.returncode != 0:
-                print(f"Command stderr: {process.stderr}")
+                logger.warning(f"manim exited with code {process.returncode}", extra={"stderr": process.stderr})
                 error_output = process.stderr
                 
                 # Check for known error patterns
@@ -143,15 +1094,16 @@ def render_video(code_file_path, output_dir, original_prompt=None, max_retries=3
                     error_matches = re.findall(error_pattern, error_output)
                     specific_error = error_matches[0] if error_matches else error_output[:200]
                     
-                    print(f"Detected known error pattern: {specific_error}")
+                    logger.warning(f"Detected known error pattern: {specific_error}")
+                    _report_render_outcome(current_code, False)
                     # Regenerate code with error feedback
-                    updated_code = regenerate_with_error(original_prompt, specific_error)
+                    updated_code = _regenerate_code(original_prompt, specific_error, limits, "known_error")
                     
                     # Save the regenerated code
                     with open(code_file_path, 'w') as f:
                         f.write(updated_code)
                     
-                    print(f"Regenerated code to fix error, attempt {attempt+1}/{max_retries}")
+                    logger.info(f"Regenerated code to fix error, attempt {attempt+1}/{max_retries}")
                     attempt += 1
                     continue
                 else:
@@ -162,71 +1114,77 @@ def render_video(code_file_path, output_dir, original_prompt=None, max_retries=3
             # Try different possible output locations
             rendered_file = None
             search_dirs = [
-                # Standard Manim Community output directory
-                Path(os.path.dirname(code_file_path)) / "media" / "videos" / file_name,
+                # Standard Manim Community output directory for the requested quality
+                Path(media_dir) / "videos" / file_name / QUALITY_DIRS[quality],
                 # Root media directory (fallback)
-                Path(os.path.dirname(code_file_path)) / "media",
-                # Current working directory
-                Path(os.getcwd()) / "media" / "videos",
-                # Output directory itself
-                Path(output_dir)
+                Path(media_dir)
             ]
             
             # Search for MP4 files in all potential directories
             for search_dir in search_dirs:
-                print(f"Searching for video files in: {search_dir}")
                 if search_dir.exists():
-                    # Search recursively for any mp4 files
+                    # Search recursively for any mp4 files, skipping the per-animation partial movies
                     for file in list(search_dir.glob("**/*.mp4")):
-                        print(f"Found video file: {file}")
+                        if "partial_movie_files" in file.parts:
+                            continue
                         if rendered_file is None or file.stat().st_mtime > Path(rendered_file).stat().st_mtime:
                             rendered_file = str(file)
-            
-            if not rendered_file:
-                # If we still can't find the file, do a more extensive search
-                print("Doing a more extensive search for MP4 files...")
-                for root, dirs, files in os.walk(os.path.dirname(code_file_path)):
-                    for file in files:
-                        if file.endswith('.mp4'):
-                            full_path = os.path.join(root, file)
-                            print(f"Found potential video file: {full_path}")
-                            if rendered_file is None or os.path.getmtime(full_path) > os.path.getmtime(rendered_file):
-                                rendered_file = full_path
+                if rendered_file:
+                    break
             
             if not rendered_file:
                 raise Exception("Could not find rendered video file. Check manim output.")
             
-            print(f"Using rendered file: {rendered_file}")
+            logger.debug(f"Using rendered file: {rendered_file}")
             
-            # Create a unique output path
-            output_path = os.path.join(output_dir, f"{scene_class}.mp4")
+            # Create a unique output path per quality
+            output_path = os.path.join(output_dir, f"{scene_class}_{quality}.mp4")
             
-            # Copy the video to our output directory
-            print(f"Copying video to: {output_path}")
-            shutil.copy2(rendered_file, output_path)
+            # Copy the video to our output directory, replacing any previous
+            # render atomically so readers never see a half-written file.
+            # The copy is a faststart remux, so playback can begin before
+            # the whole file is downloaded.
+            temp_output_path = f"{output_path}.tmp"
+            try:
+                remux_faststart(rendered_file, temp_output_path)
+            except Exception as e:
+                logger.warning(f"Faststart remux failed, copying as-is: {str(e)}")
+                shutil.copy2(rendered_file, temp_output_path)
+            os.replace(temp_output_path, output_path)
             
             # Ensure the output file has the right permissions
             set_permissions(output_path)
-            print(f"Set permissions on output file")
             
             # Verify file exists and has content
             if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                print(f"Successfully created video: {output_path} ({os.path.getsize(output_path)} bytes)")
+                logger.info(f"Rendered video: {output_path} ({os.path.getsize(output_path)} bytes)")
             else:
                 raise Exception(f"Video file was not created properly at {output_path}")
             
             # Successful render - return the path
+            _report_render_outcome(current_code, True)
             return output_path
         
+        except RenderCancelled:
+            logger.info(f"Render cancelled: {code_file_path}")
+            raise
+        
+        except RenderTimeout:
+            # Regenerated code would most likely run just as long, each attempt
+            # costing another full timeout
+            logger.warning(f"Render timed out: {code_file_path}")
+            _report_render_outcome(current_code, False)
+            raise
+        
         except Exception as e:
             last_error = str(e)
-            print(f"Error rendering video (attempt {attempt+1}/{max_retries}): {last_error}")
-            print(traceback.format_exc())
+            logger.warning(f"Error rendering video (attempt {attempt+1}/{max_retries}): {last_error}", exc_info=True)
+            _report_render_outcome(current_code, False)
             
             # If we have a prompt and we haven't exhausted retries, try regenerating the code
             if original_prompt and attempt < max_retries - 1:
-                print(f"Regenerating code due to error: {last_error}")
-                updated_code = regenerate_with_error(original_prompt, last_error)
+                logger.info("Regenerating code due to the render error")
+                updated_code = _regenerate_code(original_prompt, last_error, limits, "render_error")
                 
                 # Save the regenerated code
                 with open(code_file_path, 'w') as f:
@@ -235,7 +1193,7 @@ def render_video(code_file_path, output_dir, original_prompt=None, max_retries=3
                 attempt += 1
             else:
                 if attempt >= max_retries - 1:
-                    print(f"Max retry attempts reached ({max_retries})")
+                    logger.error(f"Max retry attempts reached ({max_retries})")
                 raise Exception(f"Error rendering video with manim after {attempt+1} attempts: {last_error}")
     
     # If we've exhausted all retries (shouldn't reach here due to exception above)
@@ -0,0 +1,193 @@
+import os
+import re
+import random
+import hashlib
+import threading
+from collections import deque, OrderedDict
+
+# Models used for code generation: a fast one for simple prompts and a strong
+# one for everything else and for retries after validation failures
+CODEGEN_FAST_MODEL = os.environ.get("CODEGEN_FAST_MODEL", "gpt-4o-mini")
+CODEGEN_STRONG_MODEL = os.environ.get("CODEGEN_STRONG_MODEL", "gpt-4-turbo")
+CODEGEN_FAST_TEMPERATURE = float(os.environ.get("CODEGEN_FAST_TEMPERATURE", 0.3))
+CODEGEN_STRONG_TEMPERATURE = float(os.environ.get("CODEGEN_STRONG_TEMPERATURE", 0.5))
+
+# Prompts with at most this many words (and a single instruction) count as simple
+SIMPLE_PROMPT_MAX_WORDS = int(os.environ.get("CODEGEN_SIMPLE_PROMPT_WORDS", 25))
+
+# The fast model stops being used for simple prompts once its success rate
+# drops below this, measured over at least ROUTER_MIN_SAMPLES requests
+ROUTER_MIN_SUCCESS_RATE = float(os.environ.get("CODEGEN_ROUTER_MIN_SUCCESS_RATE", 0.7))
+ROUTER_MIN_SAMPLES = int(os.environ.get("CODEGEN_ROUTER_MIN_SAMPLES", 20))
+
+# Share of simple prompts still sent to a disfavoured fast model, so its
+# statistics keep up when it recovers
+ROUTER_EXPLORE_RATE = float(os.environ.get("CODEGEN_ROUTER_EXPLORE_RATE", 0.05))
+
+# Number of recent requests per model the statistics are computed over
+ROUTER_WINDOW = 200
+
+# Generated programs kept while waiting for their render outcome (see track)
+ROUTER_PENDING_OUTCOMES = 1000
+
+# Words that chain several steps into one prompt ("draw a circle, then ...")
+MULTI_STEP_PATTERN = re.compile(r"\b(then|after that|afterwards|next|finally|followed by)\b|[;\n]")
+
+
+def is_simple_prompt(prompt):
+    """
+    Check whether a prompt is short and asks for a single thing
+
+    Args:
+        prompt (str): User prompt
+
+    Returns:
+        bool: True if the prompt is simple
+    """
+    words = prompt.split()
+    if len(words) > SIMPLE_PROMPT_MAX_WORDS:
+        return False
+    if MULTI_STEP_PATTERN.search(prompt.lower()):
+        return False
+    # More than one sentence usually means more than one step
+    return len([sentence for sentence in re.split(r"[.!?]+", prompt) if sentence.strip()]) <= 1
+
+
+def _percentile(values, percentile):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percentile / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class ModelRouter:
+    """
+    Picks the model for each code generation request and tracks how the models do
+
+    Simple prompts go to the fast model while it keeps a good success rate and
+    is actually faster; everything else, and every retry after a failed
+    validation, goes to the strong model. Success rate and latency are
+    computed over a sliding window of recent requests per model.
+    """
+
+    def __init__(self, fast_model=CODEGEN_FAST_MODEL, strong_model=CODEGEN_STRONG_MODEL):
+        self.models = {
+            "fast": {"name": fast_model, "temperature": CODEGEN_FAST_TEMPERATURE},
+            "strong": {"name": strong_model, "temperature": CODEGEN_STRONG_TEMPERATURE},
+        }
+        self._history = {}  # model name -> deque of (latency, success)
+        self._pending = OrderedDict()  # code hash -> (model name, latency)
+        self._lock = threading.Lock()
+
+    def choose(self, prompt, escalate=False):
+        """
+        Choose the model for a request
+
+        Args:
+            prompt (str): User prompt
+            escalate (bool): The previous attempt failed validation
+
+        Returns:
+            dict: name and temperature of the model
+        """
+        fast, strong = self.models["fast"], self.models["strong"]
+        if escalate or fast["name"] == strong["name"] or not is_simple_prompt(prompt):
+            return strong
+
+        fast_stats = self.model_stats(fast["name"])
+        strong_stats = self.model_stats(strong["name"])
+        if fast_stats["requests"] < ROUTER_MIN_SAMPLES:
+            return fast
+
+        unreliable = fast_stats["success_rate"] < ROUTER_MIN_SUCCESS_RATE
+        # A fast model that turns out slower in practice (rate limits, overload) isn't worth it
+        slower = strong_stats["requests"] >= ROUTER_MIN_SAMPLES and fast_stats["p95"] > strong_stats["p95"]
+        if (unreliable or slower) and random.random() >= ROUTER_EXPLORE_RATE:
+            return strong
+
+        return fast
+
+    def record(self, model_name, latency, success):
+        """
+        Record the outcome of a request
+
+        Args:
+            model_name (str): Model that served the request
+            latency (float): Seconds the request took
+            success (bool): Whether it produced code that passed validation (or rendered,
+                            see record_outcome)
+        """
+        with self._lock:
+            history = self._history.setdefault(model_name, deque(maxlen=ROUTER_WINDOW))
+            history.append((latency, success))
+
+    def track(self, model_name, latency, code):
+        """
+        Remember which model generated code that was not validated by a dry run,
+        so the request is recorded once the render of the code reports back
+
+        Args:
+            model_name (str): Model that generated the code
+            latency (float): Seconds the request took
+            code (str): The generated code
+        """
+        with self._lock:
+            self._pending[hashlib.sha256(code.encode("utf-8")).hexdigest()] = (model_name, latency)
+            while len(self._pending) > ROUTER_PENDING_OUTCOMES:
+                self._pending.popitem(last=False)
+
+    def record_outcome(self, code, success):
+        """
+        Record whether tracked code rendered (a no-op for code not generated by
+        a model, e.g. templates, or already reported)
+
+        Args:
+            code (str): Code that was rendered
+            success (bool): Whether it rendered
+        """
+        with self._lock:
+            pending = self._pending.pop(hashlib.sha256(code.encode("utf-8")).hexdigest(), None)
+        if pending:
+            model_name, latency = pending
+            self.record(model_name, latency, success)
+
+    def model_stats(self, model_name):
+        """Success rate and p50/p95 latency of a model over the recent window"""
+        with self._lock:
+            history = list(self._history.get(model_name, ()))
+
+        latencies = [latency for latency, _ in history]
+        successes = sum(1 for _, success in history if success)
+        return {
+            "requests": len(history),
+            "success_rate": round(successes / len(history), 3) if history else None,
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95)
+        }
+
+    def stats(self):
+        """Statistics of every model"""
+        return {role: {"model": model["name"], **self.model_stats(model["name"])}
+                for role, model in self.models.items()}
+
+
+_model_router = None
+_model_router_lock = threading.Lock()
+
+
+def get_model_router():
+    """
+    Get the model router of this process
+
+    Returns:
+        ModelRouter: The model router
+    """
+    global _model_router
+
+    with _model_router_lock:
+        if _model_router is None:
+            _model_router = ModelRouter()
+
+    return _model_router
@@ -1,28 +1,77 @@
 import os
 import requests
 import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from .template_service import generate_from_template
+from .prompt_index import find_similar_code
+from .model_router import get_model_router
+from src.utils.metrics import counter, histogram
+from src.utils.tracing import span
+from src.utils.log import get_logger
 
 # Load environment variables
 load_dotenv()
 
-# Set OpenAI API key from environment variable
-api_key = os.environ.get("OPENAI_API_KEY")
-print(f"OpenAI API Key: {api_key}")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file or environment.")
+logger = get_logger(__name__)
 
-def generate_manim_code(prompt, max_retries=3):
+# OpenAI-compatible API endpoint (point it at a local stub for testing)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+CODEGEN_REQUESTS = counter("codegen_requests_total", "Code generation requests by where the code came from", ["source"])
+OPENAI_REQUESTS = counter("openai_requests_total", "OpenAI completion requests by model and outcome", ["model", "outcome"])
+OPENAI_LATENCY = histogram("openai_request_duration_seconds", "OpenAI completion request latency", ["model"])
+CODEGEN_RETRIES = counter("codegen_retries_total", "Failed code generation attempts, by cause", ["cause"])
+STATIC_REJECTIONS = counter("static_analysis_rejections_total", "Code rejected by the static checks, by issue", ["issue"])
+
+def get_api_key():
+    """
+    Get the OpenAI API key, read on first use so the app starts (and serves
+    cached code) without it
+    
+    Returns:
+        str: The API key
+    """
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file or environment.")
+    return api_key
+
+def generate_manim_code(prompt, max_retries=3, use_cache=True, candidates=1, validate=None, escalate=False):
     """
     Generate manim code based on user prompt using OpenAI's API
     
+    Prompts matching a scene template of the template library are filled in
+    locally, and prompts nearly identical to a previously rendered one reuse
+    its code, both without calling the API.
+    
     Args:
         prompt (str): User's description of what animation to create
         max_retries (int): Maximum number of retry attempts for fixing errors
+        use_cache (bool): Try the template library and the prompt index before the API
+        candidates (int): Number of candidate programs requested per attempt
+        validate (callable): Optional validator called as validate(code, cancel_event)
+                             and returning (is_valid, error_message). Candidates are
+                             validated in parallel and the first valid one wins.
+        escalate (bool): Use the strong model right away (e.g. after a failed render)
         
     Returns:
         str: Generated manim code
     """
+    if use_cache:
+        template_code = generate_from_template(prompt)
+        if template_code:
+            CODEGEN_REQUESTS.inc(source="template")
+            return template_code
+        similar_code = find_similar_code(prompt)
+        if similar_code:
+            CODEGEN_REQUESTS.inc(source="prompt_index")
+            return similar_code
+    CODEGEN_REQUESTS.inc(source="model")
+    
     error_message = None
     attempt = 0
     
@@ -73,72 +122,171 @@ def generate_manim_code(prompt, max_retries=3):
                 - Make sure all used classes are properly imported from manimlib
                 """
             
-            # Prepare the request payload
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            payload = {
-                "model": "gpt-4-turbo",  # or whatever model is most suitable
-                "messages": [
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": 0.5,
-                "max_tokens": 3000
-            }
-            
-            # Make a direct HTTP request to the OpenAI API
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                data=json.dumps(payload)
-            )
-            
-            # Check if the request was successful
-            response.raise_for_status()
+            # Simple prompts may go to the fast model; retries always use the strong one
+            router = get_model_router()
+            model = router.choose(prompt, escalate=escalate or attempt > 0)
+            started = time.monotonic()
+            try:
+                with span("llm", model=model["name"], candidates=candidates, attempt=attempt + 1):
+                    candidate_codes = _request_completions(system_message, user_prompt, candidates, model)
+            except Exception:
+                router.record(model["name"], time.monotonic() - started, False)
+                OPENAI_REQUESTS.inc(model=model["name"], outcome="api_error")
+                CODEGEN_RETRIES.inc(cause="api_error")
+                raise
+            latency = time.monotonic() - started
+            OPENAI_LATENCY.observe(latency, model=model["name"])
+            logger.info(f"Generated {len(candidate_codes)} candidates with {model['name']} in {latency:.1f}s",
+                        extra={"codegen_attempt": attempt + 1})
+            if logger.isEnabledFor(logging.DEBUG):
+                for index, manim_code in enumerate(candidate_codes):
+                    logger.debug(f"Received manim code (candidate {index+1})",
+                                 extra={"codegen_attempt": attempt + 1, "code": manim_code})
             
-            # Parse the response JSON
-            result = response.json()
+            # Try to validate the code by running a simple syntax check
+            syntax_errors = []
+            valid_codes = []
+            for manim_code in candidate_codes:
+                try:
+                    compile(manim_code, '<string>', 'exec')
+                    valid_codes.append(manim_code)
+                except SyntaxError as se:
+                    syntax_errors.append(f"Syntax error in generated code: {str(se)}")
             
-            # Extract the generated code
-            manim_code = result["choices"][0]["message"]["content"].strip()
-            print(f"Received manim code (attempt {attempt+1}):\n{manim_code}")
+            if not valid_codes:
+                router.record(model["name"], latency, False)
+                OPENAI_REQUESTS.inc(model=model["name"], outcome="syntax_error")
+                CODEGEN_RETRIES.inc(cause="syntax_error")
+                error_message = syntax_errors[0] if syntax_errors else "No code was generated"
+                logger.warning(f"Syntax error detected: {error_message}", extra={"codegen_attempt": attempt + 1})
+                attempt += 1
+                continue
             
-            # Ensure the code contains the necessary imports and class definition
-            if "from manim import" not in manim_code and "import manim" not in manim_code and "from manimlib import" not in manim_code:
-                # Add basic imports if they're missing
-                manim_code = "from manimlib import *\n\n" + manim_code
-
-            if "python" in manim_code:
-                # Remove any Python code block markers
-                manim_code = manim_code.replace("```python", "").replace("```", "").strip()
+            logger.debug(f"Generated manim code passed syntax check ({len(valid_codes)}/{len(candidate_codes)} candidates)")
+            if not validate:
+                # A syntax check says little: the render reports whether the code works
+                router.track(model["name"], latency, valid_codes[0])
+                OPENAI_REQUESTS.inc(model=model["name"], outcome="success")
+                return valid_codes[0]
             
-            # Try to validate the code by running a simple syntax check
-            try:
-                compile(manim_code, '<string>', 'exec')
-                print(f"Generated manim code passed syntax check")
+            with span("validate", candidates=len(valid_codes)):
+                manim_code, error_message = _first_valid_candidate(valid_codes, validate)
+            router.record(model["name"], latency, manim_code is not None)
+            OPENAI_REQUESTS.inc(model=model["name"], outcome="success" if manim_code else "invalid")
+            if manim_code:
                 return manim_code
-            except SyntaxError as se:
-                error_message = f"Syntax error in generated code: {str(se)}"
-                print(f"Syntax error detected: {error_message}")
-                attempt += 1
-                continue
-                
-            # If we get here, the code syntax is valid
-            print(f"Generated manim code (attempt {attempt+1}):\n{manim_code}")
-            return manim_code
+            CODEGEN_RETRIES.inc(cause="validation_failed")
+            
+            logger.warning(f"No candidate passed validation: {error_message}", extra={"codegen_attempt": attempt + 1})
+            attempt += 1
+            continue
         
         except Exception as e:
             error_message = str(e)
-            print(f"Error in attempt {attempt+1}: {error_message}")
+            logger.warning(f"Code generation attempt {attempt+1} failed: {error_message}")
             attempt += 1
             if attempt >= max_retries:
                 raise Exception(f"Failed to generate valid manim code after {max_retries} attempts. Last error: {error_message}")
     
     # If we've exhausted all retries
-    raise Exception(f"Failed to generate valid manim code after {max_retries} attempts.")
+    raise Exception(f"Failed to generate valid manim code after {max_retries} attempts. Last error: {error_message}")
+
+def _request_completions(system_message, user_prompt, candidates=1, model=None):
+    """
+    Request one or more completions of a prompt in a single API call
+    
+    Args:
+        system_message (str): System message
+        user_prompt (str): User message
+        candidates (int): Number of completions (the API's n parameter)
+        model (dict): name and temperature of the model (defaults to the strong model)
+        
+    Returns:
+        list: Cleaned up code of every completion
+    """
+    model = model or get_model_router().models["strong"]
+    
+    # Prepare the request payload
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {get_api_key()}"
+    }
+    
+    payload = {
+        "model": model["name"],
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": model["temperature"],
+        "max_tokens": 3000,
+        "n": max(1, candidates)
+    }
+    
+    # Make a direct HTTP request to the OpenAI API
+    response = requests.post(
+        f"{OPENAI_BASE_URL}/chat/completions",
+        headers=headers,
+        data=json.dumps(payload)
+    )
+    
+    # Check if the request was successful
+    response.raise_for_status()
+    
+    # Parse the response JSON
+    result = response.json()
+    
+    return [_clean_code(choice["message"]["content"]) for choice in result["choices"]]
+
+def _clean_code(content):
+    """Strip code block markers from a completion and add the manim import if it is missing"""
+    manim_code = content.strip()
+    
+    # Ensure the code contains the necessary imports and class definition
+    if "from manim import" not in manim_code and "import manim" not in manim_code and "from manimlib import" not in manim_code:
+        # Add basic imports if they're missing
+        manim_code = "from manimlib import *\n\n" + manim_code
+
+    if "python" in manim_code:
+        # Remove any Python code block markers
+        manim_code = manim_code.replace("```python", "").replace("```", "").strip()
+    
+    return manim_code
+
+def _first_valid_candidate(candidate_codes, validate):
+    """
+    Validate candidate programs in parallel and return the first one that passes
+    
+    Once a candidate wins, the validations still queued are dropped and the
+    running ones are told to stop through their cancel event.
+    
+    Args:
+        candidate_codes (list): Candidate programs
+        validate (callable): Validator called as validate(code, cancel_event)
+        
+    Returns:
+        tuple: (winning code, None), or (None, error message of the first failure)
+    """
+    cancel_event = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(candidate_codes), thread_name_prefix="codegen-validate")
+    futures = {executor.submit(validate, code, cancel_event): code for code in candidate_codes}
+    first_error = None
+    
+    try:
+        for future in as_completed(futures):
+            try:
+                is_valid, error_message = future.result()
+            except Exception as e:
+                is_valid, error_message = False, str(e)
+            
+            if is_valid:
+                return futures[future], None
+            first_error = first_error or error_message
+    finally:
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return None, first_error
 
 def test_manim_code(code):
     """
@@ -159,11 +307,12 @@ def test_manim_code(code):
     
     for issue, message in known_issues:
         if issue in code:
+            STATIC_REJECTIONS.inc(issue=issue)
             return False, message
     
     return True, None
 
-def regenerate_with_error(prompt, error_message, max_retries=2):
+def regenerate_with_error(prompt, error_message, max_retries=2, candidates=1, validate=None):
     """
     Regenerate manim code with error feedback
     
@@ -171,6 +320,8 @@ def regenerate_with_error(prompt, error_message, max_retries=2):
         prompt (str): Original user prompt
         error_message (str): Error message from previous attempt
         max_retries (int): Maximum number of retry attempts
+        candidates (int): Number of candidate programs requested per attempt
+        validate (callable): Optional candidate validator (see generate_manim_code)
         
     Returns:
         str: Updated manim code that addresses the error
@@ -188,4 +339,6 @@ def regenerate_with_error(prompt, error_message, max_retries=2):
     Please regenerate valid manimgl code that won't produce these errors.
     """
     
-    return generate_manim_code(retry_prompt, max_retries)
\ No newline at end of file
+    # The reused code (if any) is what failed, so ask the strong model
+    return generate_manim_code(retry_prompt, max_retries, use_cache=False,
+                               candidates=candidates, validate=validate, escalate=True)
\ No newline at end of file
@@ -0,0 +1,359 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import current_app
+from src.models.video_code import VideoCode, hash_code
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Minimum cosine similarity for reusing the code of an indexed prompt
+PROMPT_INDEX_THRESHOLD = float(os.environ.get("PROMPT_INDEX_THRESHOLD", 0.8))
+PROMPT_INDEX_ENABLED = os.environ.get("PROMPT_INDEX_ENABLED", "true").lower() == "true"
+# Most recent successful prompts kept in the index
+PROMPT_INDEX_MAX_ENTRIES = int(os.environ.get("PROMPT_INDEX_MAX_ENTRIES", 5000))
+# Seconds between two loads of prompts indexed by other workers
+PROMPT_INDEX_REFRESH = int(os.environ.get("PROMPT_INDEX_REFRESH", 300))
+
+# Words that say nothing about what to animate
+STOP_WORDS = {
+    "a", "an", "the", "of", "to", "and", "in", "on", "with", "for", "that", "this", "me", "i", "you",
+    "please", "can", "could", "would", "want", "like", "create", "make", "generate", "render",
+    "animation", "animate", "animated", "video", "scene", "show", "showing", "shows", "display",
+    "draw", "visualize", "visualise", "illustrate", "demonstrate", "simple", "nice"
+}
+
+# Spellings folded into one term before indexing
+SYNONYMS = {
+    "sine": "sin", "cosine": "cos", "tangent": "tan", "squared": "square", "graph": "plot",
+    "plotting": "plot", "curve": "plot", "function": "plot", "circles": "circle", "squares": "square",
+    "triangles": "triangle", "rotating": "rotate", "rotation": "rotate", "moving": "move",
+    "transforming": "transform", "transformation": "transform", "morph": "transform",
+    "equation": "formula", "formulas": "formula", "theorem": "theorem", "derivative": "derivative",
+    "derivatives": "derivative", "integral": "integral", "integrals": "integral"
+}
+
+
+def tokenize(prompt):
+    """
+    Turn a prompt into index terms: content words, numbers and character
+    trigrams of words (so "sines" and "sin" still overlap)
+
+    Args:
+        prompt (str): Prompt to tokenize
+
+    Returns:
+        tuple: (Counter of terms, frozenset of the numbers in the prompt)
+    """
+    terms = Counter()
+    numbers = set()
+    for token in re.findall(r"\d+(?:\.\d+)?|[a-z]+", prompt.lower()):
+        if token[0].isdigit():
+            numbers.add(token)
+            terms[f"n:{token}"] += 1
+            continue
+        if token in STOP_WORDS:
+            continue
+        word = SYNONYMS.get(token, token)
+        terms[f"w:{word}"] += 1
+        for trigram in _trigrams(word):
+            terms[f"c:{trigram}"] += 0.5
+
+    return terms, frozenset(numbers)
+
+
+def _trigrams(word):
+    padded = f" {word} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def words_covered(words, other_words):
+    """
+    Check that every content word has a counterpart in another prompt, either
+    the same word or a close spelling (typos, plurals)
+
+    Args:
+        words (set): Content words of a prompt
+        other_words (set): Content words of the other prompt
+
+    Returns:
+        bool: True if no word is missing from the other prompt
+    """
+    for word in words - other_words:
+        trigrams = _trigrams(word)
+        if not any(
+            len(trigrams & _trigrams(other)) / len(trigrams | _trigrams(other)) >= 0.5
+            for other in other_words
+        ):
+            return False
+    return True
+
+
+class PromptIndex:
+    """
+    In-process TF-IDF index over the prompts of successfully rendered videos
+
+    Terms are weighted with TF-IDF and compared with cosine similarity through
+    an inverted index, so a lookup only scores prompts sharing a term with the
+    query. No external embedding service is involved. Similar prompts are only
+    reused when neither mentions something the other doesn't ("a bouncing ball"
+    vs "a bouncing red ball"), since the code would miss or add it.
+    """
+
+    def __init__(self, threshold=PROMPT_INDEX_THRESHOLD, max_entries=PROMPT_INDEX_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.entries = {}  # video ID -> {"terms", "numbers", "code", "added"}
+        self.postings = {}  # term -> set of video IDs
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._loaded_until = None
+        self._last_refresh = 0
+
+    @staticmethod
+    def _words(terms):
+        return {term[2:] for term in terms if term.startswith("w:")}
+
+    def _idf(self, term):
+        return math.log((1 + len(self.entries)) / (1 + len(self.postings.get(term, ())))) + 1
+
+    def _weights(self, terms):
+        weights = {term: count * self._idf(term) for term, count in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1
+        return {term: weight / norm for term, weight in weights.items()}
+
+    def add(self, video_id, prompt, code):
+        """
+        Index (or re-index) the prompt and code of a successfully rendered video
+
+        Args:
+            video_id (str): ID of the video
+            prompt (str): Prompt of the video
+            code (str): Code that rendered successfully
+        """
+        if not prompt or not code:
+            return
+
+        terms, numbers = tokenize(prompt)
+        if not terms:
+            return
+
+        with self._lock:
+            self._remove(video_id)
+            self.entries[video_id] = {"terms": terms, "numbers": numbers, "code": code, "added": time.time()}
+            for term in terms:
+                self.postings.setdefault(term, set()).add(video_id)
+
+            if len(self.entries) > self.max_entries:
+                oldest = min(self.entries, key=lambda entry_id: self.entries[entry_id]["added"])
+                self._remove(oldest)
+
+    def remove(self, video_id):
+        """Remove a video from the index"""
+        with self._lock:
+            self._remove(video_id)
+
+    def _remove(self, video_id):
+        entry = self.entries.pop(video_id, None)
+        if not entry:
+            return
+        for term in entry["terms"]:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.discard(video_id)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, prompt, threshold=None):
+        """
+        Find the most similar indexed prompt
+
+        Prompts mentioning different numbers never match: "plot sin(x) from 0
+        to 5" must not reuse the code of "plot sin(x) from 0 to 10".
+
+        Args:
+            prompt (str): Prompt to look up
+            threshold (float): Minimum similarity (defaults to the index threshold)
+
+        Returns:
+            dict: video_id, similarity and code of the best match, or None
+        """
+        threshold = self.threshold if threshold is None else threshold
+        terms, numbers = tokenize(prompt)
+
+        with self._lock:
+            self.lookups += 1
+            if not terms:
+                return None
+
+            query = self._weights(terms)
+            query_words = self._words(terms)
+            candidates = set()
+            for term in query:
+                candidates |= self.postings.get(term, set())
+
+            best = None
+            for video_id in candidates:
+                entry = self.entries[video_id]
+                if entry["numbers"] != numbers:
+                    continue
+                entry_words = self._words(entry["terms"])
+                if not words_covered(query_words, entry_words) or not words_covered(entry_words, query_words):
+                    continue
+                weights = self._weights(entry["terms"])
+                similarity = sum(weight * weights.get(term, 0) for term, weight in query.items())
+                if best is None or similarity > best["similarity"]:
+                    best = {"video_id": video_id, "similarity": similarity, "code": entry["code"]}
+
+            if not best or best["similarity"] < threshold:
+                return None
+
+            self.hits += 1
+            return best
+
+    @staticmethod
+    def is_reusable(video_data):
+        """Whether a video document holds generated code that rendered successfully"""
+        return video_data.get("status") == "completed" and not video_data.get("code_edited")
+
+    def load(self, mongo_db):
+        """
+        Index the successfully rendered videos updated since the last load, and
+        drop the ones that no longer qualify (re-rendered, failed, edited)
+
+        Args:
+            mongo_db: Database holding the videos collection
+        """
+        # Code lives in the video_code collection (inline in videos not migrated yet)
+        has_code = {"$or": [{"code_hash": {"$ne": None}}, {"code": {"$ne": None}}]}
+        if self._loaded_until is None:
+            query = {"status": "completed", "code_edited": {"$ne": True}, **has_code}
+        else:
+            # Every write bumps updated_at, so this also sees videos created
+            # before the last load and completed (or edited) after it
+            query = {"updated_at": {"$gt": self._loaded_until}}
+
+        projection = {"prompt": 1, "code": 1, "code_hash": 1, "status": 1, "code_edited": 1, "updated_at": 1}
+        cursor = mongo_db.videos.find(query, projection).sort("updated_at", -1).limit(self.max_entries)
+
+        documents = list(cursor)
+        reusable = [video_data for video_data in documents if self.is_reusable(video_data)]
+        codes = VideoCode.load_many([video_data["_id"] for video_data in reusable if video_data.get("code_hash")],
+                                    mongo_db)
+        for video_data in reversed(documents):
+            if self.is_reusable(video_data):
+                code = codes.get(video_data["_id"]) or video_data.get("code")
+                self.add(video_data["_id"], video_data.get("prompt"), code)
+            else:
+                self.remove(video_data["_id"])
+            updated_at = video_data.get("updated_at")
+            if updated_at and (self._loaded_until is None or updated_at > self._loaded_until):
+                self._loaded_until = updated_at
+
+        if self._loaded_until is None:
+            # Nothing indexable yet: the next refresh only looks at newer writes
+            self._loaded_until = datetime.utcnow()
+
+        self._last_refresh = time.time()
+
+    def refresh(self, mongo_db):
+        """Load prompts indexed by other workers, at most every PROMPT_INDEX_REFRESH seconds"""
+        if time.time() - self._last_refresh >= PROMPT_INDEX_REFRESH:
+            self.load(mongo_db)
+
+    def stats(self):
+        """Size and hit rate of the index"""
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "threshold": self.threshold
+            }
+
+
+_prompt_index = None
+_prompt_index_lock = threading.Lock()
+
+
+def get_prompt_index():
+    """
+    Get the prompt index of this process
+
+    Returns:
+        PromptIndex: The prompt index
+    """
+    global _prompt_index
+
+    with _prompt_index_lock:
+        if _prompt_index is None:
+            _prompt_index = PromptIndex()
+
+    return _prompt_index
+
+
+def find_similar_code(prompt):
+    """
+    Look up the code of a previously rendered prompt similar enough to reuse
+
+    Args:
+        prompt (str): User prompt
+
+    Returns:
+        str: Code of the most similar prompt, or None
+    """
+    if not PROMPT_INDEX_ENABLED:
+        return None
+
+    try:
+        index = get_prompt_index()
+        index.refresh(current_app.mongo_db)
+        match = index.search(prompt)
+        # Other workers may have deleted, edited or re-rendered the video since the last refresh
+        while match and not _still_reusable(match):
+            index.remove(match["video_id"])
+            match = index.search(prompt)
+    except Exception as e:
+        # The index is an optimization, never a reason to fail generation
+        logger.warning(f"Prompt index lookup failed: {str(e)}")
+        return None
+
+    if match:
+        logger.info(f"Reusing code of video {match['video_id']} (similarity {match['similarity']:.2f})")
+        return match["code"]
+
+    return None
+
+
+def _still_reusable(match):
+    """Check an index match against the current state of its video"""
+    video_data = current_app.mongo_db.videos.find_one(
+        {"_id": match["video_id"]}, {"status": 1, "code_edited": 1, "code_hash": 1}
+    )
+    if not video_data or not PromptIndex.is_reusable(video_data):
+        return False
+
+    # Legacy videos with inline code have no hash
+    return not video_data.get("code_hash") or video_data["code_hash"] == hash_code(match["code"])
+
+
+def index_rendered_video(video):
+    """
+    Add a successfully rendered video to the prompt index
+
+    Args:
+        video (Video): Video whose code rendered successfully
+    """
+    if not PROMPT_INDEX_ENABLED or video.code_edited:
+        return
+
+    try:
+        get_prompt_index().add(video.id, video.prompt, video.code)
+    except Exception as e:
+        logger.warning(f"Could not index prompt of video {video.id}: {str(e)}")
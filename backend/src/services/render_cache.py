@@ -0,0 +1,293 @@
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from src.utils.metrics import counter
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Shared cache of manim's partial movie files, reused across jobs, users and retries
+RENDER_CACHE_DIR = os.environ.get(
+    "RENDER_CACHE_DIR",
+    os.path.join(os.getcwd(), "videos", ".render_cache")
+)
+RENDER_CACHE_MAX_MB = int(os.environ.get("RENDER_CACHE_MAX_MB", 2048))
+RENDER_CACHE_ENABLED = os.environ.get("RENDER_CACHE_ENABLED", "true").lower() == "true"
+
+# Shared cache of the SVGs manim compiles from TeX (latex + dvisvgm) and renders
+# from text (Pango), with its own size budget
+TEX_CACHE_MAX_MB = int(os.environ.get("TEX_CACHE_MAX_MB", 256))
+TEX_CACHE_ENABLED = os.environ.get("TEX_CACHE_ENABLED", "true").lower() == "true"
+
+# Entries used more recently than this are never evicted, since running
+# renders may still reference them through symlinks. Entries are marked as used
+# when they are linked into a job, so this must exceed the longest render timeout.
+EVICTION_GRACE_PERIOD = int(os.environ.get("RENDER_CACHE_EVICTION_GRACE", 900))
+
+CACHE_LOOKUPS = counter("render_cache_lookups_total", "Shared render cache lookups by cache and result", ["cache", "result"])
+
+# Minimum seconds between two eviction passes in this process
+EVICTION_INTERVAL = 60
+
+# Manim lists the partial movies it combined in this file (one "file '...'" per line)
+PARTIAL_MOVIE_LIST = "partial_movie_file_list.txt"
+
+
+class SharedRenderCache:
+    """
+    Size-bounded, content-addressed file cache shared by all render workers
+
+    Manim names cached files after the hash of what they contain and skips
+    rendering whatever it finds under that name. Renders look each file up
+    in the cache by that name when manim needs it (see manim_launcher), so
+    a job only links the files it uses. Files rendered by the job are
+    published back with an atomic rename, so concurrent readers never see a
+    partially written file. Eviction is least-recently-used by mtime.
+    """
+
+    def __init__(self, root, max_bytes, name):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._last_eviction = 0
+        self._warned_symlinks = False
+
+    def namespace_dir(self, namespace):
+        """Directory of the files of a cache partition (created if needed)"""
+        path = os.path.join(self.root, namespace)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _warn_symlinks(self, directory):
+        if self._warned_symlinks:
+            return
+        self._warned_symlinks = True
+        logger.warning(f"The {self.name} cache ({self.root}) and {directory} are on different filesystems, "
+                       "cached files are linked into jobs with symlinks; put RENDER_CACHE_DIR on the "
+                       "filesystem of RENDER_SCRATCH_DIR for hard links")
+
+    def cached_names(self, directory, namespace, suffix=".mp4"):
+        """
+        Get the files of a job directory that are links to cached files (see
+        manim_launcher.link_cached_file)
+
+        Args:
+            directory (str): Job directory
+            namespace (str): Cache partition
+            suffix (str): Only files with this suffix are considered
+
+        Returns:
+            set: Names of the linked files
+        """
+        if not os.path.isdir(directory):
+            return set()
+
+        source_dir = self.namespace_dir(namespace)
+        linked = set()
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(suffix):
+                continue
+            try:
+                if os.path.samefile(entry.path, os.path.join(source_dir, entry.name)):
+                    linked.add(entry.name)
+                    if entry.is_symlink():
+                        self._warn_symlinks(directory)
+            except OSError:
+                continue
+
+        return linked
+
+    def publish_from(self, source_dir, namespace, linked=(), suffix=".mp4", only=None):
+        """
+        Publish files rendered by a job into the shared cache
+
+        Args:
+            source_dir (str): Job directory containing the rendered files
+            namespace (str): Cache partition
+            linked (set): Names that came from the cache and must not be republished
+            suffix (str): Only files with this suffix are published
+            only (set): If given, only these names are published (e.g. the files
+                        a successful render actually used)
+
+        Returns:
+            int: Number of new files added to the cache
+        """
+        if not os.path.isdir(source_dir):
+            return 0
+
+        target_dir = self.namespace_dir(namespace)
+        published = 0
+
+        for entry in os.scandir(source_dir):
+            if (not entry.name.endswith(suffix) or entry.name in linked
+                    or (only is not None and entry.name not in only)
+                    or entry.is_symlink() or not entry.is_file()):
+                continue
+            target = os.path.join(target_dir, entry.name)
+            if os.path.exists(target):
+                continue
+
+            temp_target = os.path.join(target_dir, f".{uuid.uuid4().hex}.tmp")
+            try:
+                try:
+                    os.link(entry.path, temp_target)
+                except OSError:
+                    shutil.copy2(entry.path, temp_target)
+                os.replace(temp_target, target)
+                published += 1
+            except OSError as e:
+                logger.warning(f"Could not publish {entry.name} to the {self.name} cache: {str(e)}")
+                if os.path.exists(temp_target):
+                    os.remove(temp_target)
+
+        if published:
+            self.evict()
+
+        return published
+
+    def record(self, hits, misses):
+        """Record cache hits and misses for hit-rate reporting"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        CACHE_LOOKUPS.inc(hits, cache=self.name, result="hit")
+        CACHE_LOOKUPS.inc(misses, cache=self.name, result="miss")
+
+    def evict(self, force=False):
+        """
+        Delete least recently used files until the cache fits its size budget
+
+        Args:
+            force (bool): Run even if the last eviction pass was recent
+
+        Returns:
+            int: Number of files deleted
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._last_eviction < EVICTION_INTERVAL:
+                return 0
+            self._last_eviction = time.monotonic()
+
+        entries = []
+        total_bytes = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    file_stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((file_stat.st_mtime, file_stat.st_size, path))
+                total_bytes += file_stat.st_size
+
+        if total_bytes <= self.max_bytes:
+            return 0
+
+        # Evict down to 90% of the budget so every publish doesn't trigger a pass
+        target_bytes = self.max_bytes * 0.9
+        cutoff = time.time() - EVICTION_GRACE_PERIOD
+        deleted = 0
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= target_bytes or mtime > cutoff:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+                deleted += 1
+            except FileNotFoundError:
+                # Already evicted by another worker
+                total_bytes -= size
+
+        logger.info(f"Evicted {deleted} files from the {self.name} cache ({int(total_bytes)} bytes left)")
+        return deleted
+
+    def stats(self):
+        """
+        Get cache statistics
+
+        Returns:
+            dict: Hits, misses and hit rate since this process started
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+def read_used_partial_movies(partial_movie_dir):
+    """
+    Get the names of the partial movies manim combined into the final video
+
+    Args:
+        partial_movie_dir (str): manim's partial movie directory for the scene
+
+    Returns:
+        set: File names listed in manim's partial movie list, empty if there is none
+    """
+    list_path = os.path.join(partial_movie_dir, PARTIAL_MOVIE_LIST)
+    if not os.path.exists(list_path):
+        return set()
+
+    with open(list_path, "r") as f:
+        return set(re.findall(r"([^/\\']+\.mp4)'", f.read()))
+
+
+# Initialize the partial movie cache
+partial_movie_cache = None
+
+
+def get_partial_movie_cache():
+    """
+    Get or create the shared partial movie cache
+
+    Returns:
+        SharedRenderCache: The cache, or None if caching is disabled
+    """
+    global partial_movie_cache
+
+    if not RENDER_CACHE_ENABLED:
+        return None
+
+    if partial_movie_cache is None:
+        partial_movie_cache = SharedRenderCache(
+            os.path.join(RENDER_CACHE_DIR, "partial_movies"),
+            RENDER_CACHE_MAX_MB * 1024 * 1024,
+            "partial movie"
+        )
+
+    return partial_movie_cache
+
+
+# Initialize the TeX and text cache
+tex_cache = None
+
+
+def get_tex_cache():
+    """
+    Get or create the shared cache of compiled TeX and text SVGs
+
+    Returns:
+        SharedRenderCache: The cache, or None if caching is disabled
+    """
+    global tex_cache
+
+    if not TEX_CACHE_ENABLED:
+        return None
+
+    if tex_cache is None:
+        tex_cache = SharedRenderCache(
+            os.path.join(RENDER_CACHE_DIR, "tex"),
+            TEX_CACHE_MAX_MB * 1024 * 1024,
+            "tex"
+        )
+
+    return tex_cache
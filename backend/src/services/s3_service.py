@@ -1,34 +1,79 @@
 import os
-import boto3
-from botocore.client import Config
+import hashlib
 from flask import current_app
+from pymongo import ReturnDocument
 import uuid
+import time
+import threading
+from src.utils.metrics import counter, histogram
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Content-addressed objects never change, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Seconds a store waits for the deletion of an object whose last reference was
+# just released (see release_object) before uploading it again
+DELETION_WAIT_TIMEOUT = 60
+
+S3_UPLOADS = counter("s3_uploads_total", "Stored files and directories by kind (extension or namespace) and result", ["kind", "result"])
+S3_UPLOAD_BYTES = counter("s3_upload_bytes_total", "Bytes uploaded to the bucket by kind", ["kind"])
+S3_UPLOAD_DURATION = histogram("s3_upload_duration_seconds", "Duration of uploads to the bucket by kind", ["kind"])
 
 class S3Service:
     """Service for handling S3 operations with Cloudflare R2"""
     
     def __init__(self):
         self.s3 = None
+        self._probe_client = None
         self.bucket_name = os.environ.get('CLOUDFLARE_R2_BUCKET_NAME')
         self.setup_client()
         
+    @staticmethod
+    def _create_client(**config):
+        # boto3 takes a large part of the import time of the app, so it is
+        # only loaded when the first storage operation needs it
+        import boto3
+        from botocore.client import Config
+        
+        return boto3.client(
+            's3',
+            endpoint_url=os.environ.get('CLOUDFLARE_R2_ENDPOINT'),
+            aws_access_key_id=os.environ.get('CLOUDFLARE_R2_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('CLOUDFLARE_R2_SECRET_ACCESS_KEY'),
+            config=Config(signature_version='s3v4', **config)
+        )
+        
     def setup_client(self):
         """Set up the S3 client with Cloudflare R2 credentials"""
         try:
-            self.s3 = boto3.client(
-                's3',
-                endpoint_url=os.environ.get('CLOUDFLARE_R2_ENDPOINT'),
-                aws_access_key_id=os.environ.get('CLOUDFLARE_R2_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.environ.get('CLOUDFLARE_R2_SECRET_ACCESS_KEY'),
-                config=Config(signature_version='s3v4')
-            )
+            self.s3 = self._create_client()
         except Exception as e:
-            print(f"Error setting up S3 client: {str(e)}")
+            logger.error(f"Error setting up S3 client: {str(e)}")
             self.s3 = None
     
+    def check_bucket(self, timeout=2):
+        """
+        Check that the bucket is reachable, failing fast (for readiness probes)
+        
+        Raises:
+            Exception: If the bucket can't be reached within the timeout
+        """
+        if not self.s3 or not self.bucket_name:
+            raise ValueError("S3 client or bucket name not configured")
+        
+        # A separate client: the uploads keep their default timeouts and retries
+        if self._probe_client is None:
+            self._probe_client = self._create_client(connect_timeout=timeout, read_timeout=timeout,
+                                                     retries={"max_attempts": 1})
+        self._probe_client.head_bucket(Bucket=self.bucket_name)
+    
     def upload_video(self, file_path, video_id):
         """
-        Upload a video to Cloudflare R2 bucket
+        Upload a video to Cloudflare R2 bucket under its video ID
+        
+        Kept for videos stored before content addressing; new uploads go through store_file()
         
         Args:
             file_path (str): Path to the video file
@@ -58,18 +103,321 @@ class S3Service:
                 }
             )
             
-            # Generate the public URL
-            video_url = f"{os.environ.get('CLOUDFLARE_R2_PUBLIC_URL')}/{key}"
+            return self.url_for_key(key)
             
-            return video_url
+        except Exception as e:
+            logger.error(f"Error uploading file to S3: {str(e)}")
+            raise
+    
+    def url_for_key(self, key):
+        """Get the public URL of an object key"""
+        return f"{os.environ.get('CLOUDFLARE_R2_PUBLIC_URL')}/{key}"
+    
+    @staticmethod
+    def hash_file(file_path):
+        """
+        Compute the SHA-256 of a file without reading it into memory at once
+        
+        Args:
+            file_path (str): Path to the file
             
+        Returns:
+            str: Hex digest of the file content
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        
+        return digest.hexdigest()
+    
+    @staticmethod
+    def key_for_hash(content_hash, extension="mp4"):
+        """Get the object key of a content hash"""
+        return f"objects/{content_hash}.{extension}"
+    
+    def store_file(self, file_path, extension="mp4", content_type="video/mp4"):
+        """
+        Store a file in the bucket keyed by the SHA-256 of its content and take a
+        reference on it. Byte-identical files are uploaded only once.
+        
+        Every reference must be released with release_object() when it is no longer used.
+        
+        Args:
+            file_path (str): Path to the file
+            extension (str): Extension of the object key
+            content_type (str): Content type of the object
+            
+        Returns:
+            dict: key, url, content_hash and size of the stored object
+        """
+        if not self.s3 or not self.bucket_name:
+            raise ValueError("S3 client or bucket name not configured")
+        
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        
+        content_hash = self.hash_file(file_path)
+        key = self.key_for_hash(content_hash, extension)
+        size = os.path.getsize(file_path)
+        
+        # Take the reference first, so a concurrent release can't delete the object under us
+        stored = current_app.mongo_db.storage_objects.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"refcount": 1}, "$setOnInsert": {"content_hash": content_hash, "size": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        
+        try:
+            if stored.get("deleting"):
+                # The object is being deleted: upload it again once it is gone
+                self._wait_for_deletion(key)
+                needs_upload = True
+            else:
+                # A reference alone doesn't mean the object exists: another writer's
+                # upload may still be running or may have failed. Uploading the same
+                # content to the same key again is harmless.
+                needs_upload = not stored.get("uploaded") and not self.object_exists(key)
+            if needs_upload:
+                started = time.monotonic()
+                self.s3.upload_file(
+                    Filename=file_path,
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    ExtraArgs={
+                        'ContentType': content_type,
+                        'CacheControl': IMMUTABLE_CACHE_CONTROL,
+                        'ACL': 'public-read'
+                    }
+                )
+                S3_UPLOAD_DURATION.observe(time.monotonic() - started, kind=extension)
+                S3_UPLOAD_BYTES.inc(size, kind=extension)
+                S3_UPLOADS.inc(kind=extension, result="uploaded")
+                logger.info(f"Uploaded {size} bytes to S3: {key}")
+            else:
+                S3_UPLOADS.inc(kind=extension, result="deduplicated")
+                logger.info(f"Object already stored in S3, skipping upload: {key}")
+            self._mark_uploaded(key, stored)
+        except Exception as e:
+            S3_UPLOADS.inc(kind=extension, result="error")
+            logger.error(f"Error uploading file to S3: {str(e)}")
+            self.release_object(key)
+            raise
+        
+        return {
+            "key": key,
+            "url": self.url_for_key(key),
+            "content_hash": content_hash,
+            "size": size
+        }
+    
+    @staticmethod
+    def prefix_for_hash(content_hash, namespace="hls"):
+        """Get the key prefix of a directory stored for a content hash"""
+        return f"{namespace}/{content_hash}/"
+    
+    def store_directory(self, local_dir, content_hash, content_types, namespace="hls"):
+        """
+        Store every file of a directory under a prefix derived from a content hash
+        (e.g. the HLS packaging of a video) and take a reference on the prefix.
+        
+        The prefix is reference counted as a single object; release it with release_object().
+        
+        Args:
+            local_dir (str): Directory to upload
+            content_hash (str): Content hash the directory was derived from
+            content_types (dict): Content type per file extension
+            namespace (str): First component of the key prefix
+            
+        Returns:
+            dict: key (the prefix) and url of the prefix
+        """
+        if not self.s3 or not self.bucket_name:
+            raise ValueError("S3 client or bucket name not configured")
+        
+        prefix = self.prefix_for_hash(content_hash, namespace)
+        files = []
+        for dirpath, _, filenames in os.walk(local_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                files.append((path, os.path.relpath(path, local_dir).replace(os.sep, "/")))
+        size = sum(os.path.getsize(path) for path, _ in files)
+        
+        stored = current_app.mongo_db.storage_objects.find_one_and_update(
+            {"_id": prefix},
+            {"$inc": {"refcount": 1}, "$setOnInsert": {"content_hash": content_hash, "size": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        
+        try:
+            if stored.get("deleting"):
+                self._wait_for_deletion(prefix)
+            # Uploaded by another writer only once it is marked (see store_file);
+            # release_object() clears the mark before deleting
+            if not stored.get("uploaded"):
+                started = time.monotonic()
+                for path, relative_path in files:
+                    content_type = content_types.get(os.path.splitext(path)[1], "application/octet-stream")
+                    self.s3.upload_file(
+                        Filename=path,
+                        Bucket=self.bucket_name,
+                        Key=prefix + relative_path,
+                        ExtraArgs={
+                            'ContentType': content_type,
+                            'CacheControl': IMMUTABLE_CACHE_CONTROL,
+                            'ACL': 'public-read'
+                        }
+                    )
+                S3_UPLOAD_DURATION.observe(time.monotonic() - started, kind=namespace)
+                S3_UPLOAD_BYTES.inc(size, kind=namespace)
+                S3_UPLOADS.inc(kind=namespace, result="uploaded")
+                logger.info(f"Uploaded {len(files)} files ({size} bytes) to S3: {prefix}")
+            else:
+                S3_UPLOADS.inc(kind=namespace, result="deduplicated")
+                logger.info(f"Directory already stored in S3, skipping upload: {prefix}")
+            self._mark_uploaded(prefix, stored)
         except Exception as e:
-            print(f"Error uploading file to S3: {str(e)}")
+            S3_UPLOADS.inc(kind=namespace, result="error")
+            logger.error(f"Error uploading directory to S3: {str(e)}")
+            self.release_object(prefix)
             raise
+        
+        return {"key": prefix, "url": self.url_for_key(prefix)}
+    
+    @staticmethod
+    def _mark_uploaded(key, stored):
+        """Record that the object of a storage record is complete in the bucket"""
+        if not stored.get("uploaded"):
+            current_app.mongo_db.storage_objects.update_one({"_id": key}, {"$set": {"uploaded": True}})
+    
+    @staticmethod
+    def _wait_for_deletion(key):
+        """Wait until a concurrent release_object() is done deleting an object"""
+        deadline = time.monotonic() + DELETION_WAIT_TIMEOUT
+        while current_app.mongo_db.storage_objects.find_one({"_id": key, "deleting": True}, {"_id": 1}):
+            if time.monotonic() > deadline:
+                logger.warning(f"Deletion of {key} did not finish in {DELETION_WAIT_TIMEOUT}s, uploading anyway")
+                return
+            time.sleep(0.1)
+    
+    def _delete_prefix(self, prefix):
+        """Delete every object under a key prefix"""
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            keys = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if keys:
+                self.s3.delete_objects(Bucket=self.bucket_name, Delete={"Objects": keys})
+    
+    def add_reference(self, key):
+        """Take an additional reference on a stored object"""
+        current_app.mongo_db.storage_objects.update_one({"_id": key}, {"$inc": {"refcount": 1}})
+    
+    def release_object(self, key):
+        """
+        Release a reference on a stored object, deleting it once nothing points to it
+        
+        Args:
+            key (str): Object key returned by store_file(), or prefix returned by store_directory()
+            
+        Returns:
+            bool: True if the object was deleted
+        """
+        if not key:
+            return False
+        
+        objects = current_app.mongo_db.storage_objects
+        objects.update_one({"_id": key}, {"$inc": {"refcount": -1}})
+        
+        # Only the caller that marks the record deletes the object. The record
+        # stays as a tombstone while the object is deleted, so a store_file()
+        # taking a new reference meanwhile waits and uploads it again.
+        claimed = objects.find_one_and_update(
+            {"_id": key, "refcount": {"$lte": 0}, "deleting": {"$ne": True}},
+            {"$set": {"deleting": True, "uploaded": False}}
+        )
+        if not claimed:
+            return False
+        
+        try:
+            if key.endswith("/"):
+                self._delete_prefix(key)
+            else:
+                self.s3.delete_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting file from S3: {str(e)}")
+            return False
+        finally:
+            # Keep the record if a store revived it (it re-uploads the object)
+            if not objects.delete_one({"_id": key, "refcount": {"$lte": 0}}).deleted_count:
+                objects.update_one({"_id": key}, {"$unset": {"deleting": ""}})
+    
+    def key_from_url(self, url):
+        """
+        Get the object key of a public URL returned by upload_video
+        
+        Args:
+            url (str): Public URL of the object
+            
+        Returns:
+            str: Object key, or None if the URL is not in this bucket
+        """
+        public_url = os.environ.get('CLOUDFLARE_R2_PUBLIC_URL')
+        if not url or not public_url or not url.startswith(f"{public_url}/"):
+            return None
+        
+        return url[len(public_url) + 1:]
+    
+    def object_exists(self, key):
+        """
+        Check that an object is stored in the bucket
+        
+        Args:
+            key (str): Object key
+            
+        Returns:
+            bool: True if the object exists
+        """
+        if not self.s3 or not self.bucket_name:
+            raise ValueError("S3 client or bucket name not configured")
+        
+        try:
+            self.s3.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except Exception:
+            return False
+            
+    def iter_object(self, key, chunk_size=1024 * 1024):
+        """
+        Stream an object of the bucket in chunks, without buffering it
+        
+        Args:
+            key (str): Object key
+            chunk_size (int): Size of the chunks read from the response
+            
+        Returns:
+            generator: Chunks of the object; the request is made right away,
+                       so a missing object raises here rather than mid-stream
+        """
+        if not self.s3 or not self.bucket_name:
+            raise ValueError("S3 client or bucket name not configured")
+        
+        body = self.s3.get_object(Bucket=self.bucket_name, Key=key)["Body"]
+        
+        def chunks():
+            try:
+                for chunk in body.iter_chunks(chunk_size):
+                    yield chunk
+            finally:
+                body.close()
+        
+        return chunks()
             
     def delete_video(self, video_id):
         """
-        Delete a video from Cloudflare R2 bucket
+        Delete a video stored under its video ID from Cloudflare R2 bucket
         
         Args:
             video_id (str): ID of the video to delete
@@ -91,11 +439,12 @@ class S3Service:
             return True
             
         except Exception as e:
-            print(f"Error deleting file from S3: {str(e)}")
+            logger.error(f"Error deleting file from S3: {str(e)}")
             return False
 
-# Initialize the S3 service
+# Created on first use (by concurrent request threads)
 s3_service = None
+_s3_service_lock = threading.Lock()
 
 def get_s3_service():
     """
@@ -106,7 +455,8 @@ def get_s3_service():
     """
     global s3_service
     
-    if s3_service is None:
-        s3_service = S3Service()
+    with _s3_service_lock:
+        if s3_service is None:
+            s3_service = S3Service()
         
     return s3_service
\ No newline at end of file
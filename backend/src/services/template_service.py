@@ -0,0 +1,503 @@
+import os
+import re
+import ast
+import math
+import threading
+from string import Template
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Prompts matched with a lower confidence than this go to the LLM
+TEMPLATE_MATCH_THRESHOLD = float(os.environ.get("TEMPLATE_MATCH_THRESHOLD", 0.85))
+TEMPLATES_ENABLED = os.environ.get("TEMPLATES_ENABLED", "true").lower() == "true"
+
+# Optional filler in front of the actual request ("please create an animation of ...")
+PREFIX = (
+    r"(?:(?:please|can you|could you|i want to|i'd like to)\s+)?"
+    r"(?:(?:create|make|generate|render)\s+(?:me\s+)?(?:an?\s+)?(?:animation|video|scene)\s+"
+    r"(?:of\s+|that\s+|showing\s+|which\s+)?(?:(?:shows|plots|draws|writes)\s+)?)?"
+)
+
+# Colors a prompt may ask for, mapped to manim color constants
+COLORS = {
+    "blue": "BLUE", "red": "RED", "green": "GREEN", "yellow": "YELLOW", "orange": "ORANGE",
+    "purple": "PURPLE", "pink": "PINK", "teal": "TEAL", "gold": "GOLD", "white": "WHITE",
+    "grey": "GREY", "gray": "GREY"
+}
+COLOR_PATTERN = "|".join(COLORS)
+
+# Functions allowed in plotted expressions: name -> (numpy name in the scene, math function for sampling)
+PLOT_FUNCTIONS = {
+    "sin": ("np.sin", math.sin), "cos": ("np.cos", math.cos), "tan": ("np.tan", math.tan),
+    "exp": ("np.exp", math.exp), "log": ("np.log", math.log), "ln": ("np.log", math.log),
+    "sqrt": ("np.sqrt", math.sqrt), "abs": ("np.abs", abs)
+}
+PLOT_CONSTANTS = {"pi": ("np.pi", math.pi), "e": ("np.e", math.e)}
+
+# LaTeX commands allowed in equations; anything else (\input, \write, ...) is rejected
+LATEX_COMMANDS = {
+    "frac", "dfrac", "sqrt", "int", "iint", "oint", "sum", "prod", "lim", "infty", "partial", "nabla",
+    "cdot", "times", "div", "pm", "mp", "le", "leq", "ge", "geq", "neq", "approx", "equiv", "to",
+    "rightarrow", "leftarrow", "Rightarrow", "iff", "in", "sin", "cos", "tan", "log", "ln", "exp",
+    "left", "right", "quad", "mathrm", "mathbf", "vec", "hat", "bar", "dot", "prime",
+    "alpha", "beta", "gamma", "Gamma", "delta", "Delta", "epsilon", "varepsilon", "theta", "Theta",
+    "lambda", "Lambda", "mu", "nu", "pi", "Pi", "rho", "sigma", "Sigma", "tau", "phi", "Phi",
+    "varphi", "chi", "psi", "Psi", "omega", "Omega", "hbar", "ell"
+}
+LATEX_ALLOWED_CHARACTERS = re.compile(r"^[A-Za-z0-9\s+\-*/=^_(){}\[\].,<>|!'\\]+$")
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "by_template": {}}
+
+
+def _parse_number(value, default):
+    """Parse an optional number slot"""
+    if value is None:
+        return default
+    return float(value)
+
+
+def _parse_color(value):
+    """Parse an optional color slot into a manim color constant"""
+    return COLORS.get((value or "blue").lower(), "BLUE")
+
+
+def parse_expression(text):
+    """
+    Parse a function of x written in a prompt (e.g. "x^2 - 2x", "sin x") into
+    numpy code, accepting only arithmetic, x, numbers and whitelisted functions
+
+    Args:
+        text (str): Expression as written in the prompt
+
+    Returns:
+        tuple: (numpy code, Python function for sampling), or None if the
+               expression is not a plain function of x
+    """
+    text = text.strip().lower()
+    if len(text) > 100:
+        return None
+    text = re.sub(r"^(?:y|f\(x\))\s*=\s*", "", text)
+    text = text.replace("^", "**")
+    text = re.sub(r"\b(" + "|".join(PLOT_FUNCTIONS) + r")\s+(x|\d+(?:\.\d+)?)\b", r"\1(\2)", text)
+    # Implicit multiplication: 2x, 3(x + 1), x(x - 1), )(
+    text = re.sub(r"(\d)\s*([a-z(])", r"\1*\2", text)
+    text = re.sub(r"\bx\s*\(", "x*(", text)
+    text = re.sub(r"\)\s*([a-z(\d])", r")*\1", text)
+
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError:
+        return None
+
+    allowed_operators = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+    uses_x = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in PLOT_FUNCTIONS:
+                return None
+            if len(node.args) != 1 or node.keywords:
+                return None
+        elif isinstance(node, ast.Name):
+            if node.id == "x":
+                uses_x = True
+            elif node.id not in PLOT_FUNCTIONS and node.id not in PLOT_CONSTANTS:
+                return None
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                return None
+        elif isinstance(node, (ast.BinOp, ast.UnaryOp)):
+            if not isinstance(node.op, allowed_operators):
+                return None
+        elif not isinstance(node, (ast.Expression, ast.Load) + allowed_operators):
+            return None
+
+    if not uses_x:
+        return None
+
+    class ToFloat(ast.NodeTransformer):
+        # Float arithmetic overflows instead of building huge integers (9**9**9)
+        def visit_Constant(self, node):
+            return ast.copy_location(ast.Constant(float(node.value)), node)
+
+    tree = ast.fix_missing_locations(ToFloat().visit(tree))
+
+    class ToNumpy(ast.NodeTransformer):
+        def visit_Name(self, node):
+            known = PLOT_FUNCTIONS.get(node.id) or PLOT_CONSTANTS.get(node.id)
+            return ast.parse(known[0], mode="eval").body if known else node
+
+    # The tree only holds arithmetic on x and whitelisted functions, so it is safe to evaluate
+    sampling_names = {name: value[1] for name, value in {**PLOT_FUNCTIONS, **PLOT_CONSTANTS}.items()}
+    compiled = compile(tree, "<expression>", "eval")
+    numpy_code = ast.unparse(ToNumpy().visit(tree))
+
+    def evaluate(x):
+        return eval(compiled, {"__builtins__": {}}, {**sampling_names, "x": x})
+
+    return numpy_code, evaluate
+
+
+def parse_latex(text):
+    """
+    Validate a LaTeX equation from a prompt
+
+    Args:
+        text (str): Equation as written in the prompt
+
+    Returns:
+        str: The equation, or None if it is too long or uses disallowed commands
+    """
+    text = text.strip().strip("$").strip()
+    if not text or len(text) > 200 or not LATEX_ALLOWED_CHARACTERS.match(text):
+        return None
+    if any(command not in LATEX_COMMANDS for command in re.findall(r"\\([A-Za-z]+)", text)):
+        return None
+    if text.count("{") != text.count("}"):
+        return None
+    # An equation is a formula, not a sentence
+    if re.search(r"[a-z]{4,}", re.sub(r"\\[A-Za-z]+", "", text)):
+        return None
+    return text
+
+
+def _plot_slots(match):
+    """Slots of the function plot template"""
+    parsed = parse_expression(match["expression"])
+    if not parsed:
+        return None
+    numpy_code, evaluate = parsed
+
+    x_min = _parse_number(match["x_min"], -5)
+    x_max = _parse_number(match["x_max"], 5)
+    if x_max <= x_min or x_max - x_min > 100:
+        return None
+
+    # Sample the function so the axes fit it; reject functions that aren't
+    # finite over the whole range (manim would draw nonsense or fail)
+    samples = []
+    for step in range(201):
+        x = x_min + (x_max - x_min) * step / 200
+        try:
+            y = float(evaluate(x))
+        except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+            return None
+        if not math.isfinite(y) or abs(y) > 1e6:
+            return None
+        samples.append(y)
+
+    y_min, y_max = min(samples), max(samples)
+    padding = max((y_max - y_min) * 0.1, 1)
+    return {
+        "function": numpy_code,
+        "label": match["expression"].strip(),
+        "x_min": x_min,
+        "x_max": x_max,
+        "x_step": _axis_step(x_max - x_min),
+        "y_min": math.floor(y_min - padding),
+        "y_max": math.ceil(y_max + padding),
+        "y_step": _axis_step(y_max - y_min + 2 * padding),
+        "color": _parse_color(match["color"])
+    }
+
+
+def _axis_step(span):
+    """Tick spacing giving roughly ten ticks over a span"""
+    step = 10 ** math.floor(math.log10(max(span, 1e-9) / 10))
+    for multiplier in (1, 2, 5, 10):
+        if span / (step * multiplier) <= 12:
+            return step * multiplier
+    return step * 10
+
+
+def _equation_slots(match):
+    """Slots of the equation template"""
+    latex = parse_latex(match["equation"])
+    if not latex:
+        return None
+    return {"equation": latex}
+
+
+def _shape_slots(match):
+    """Slots of the geometric shape template"""
+    shape = match["shape"]
+    sides = {"triangle": 3, "square": 4, "pentagon": 5, "hexagon": 6, "octagon": 8}.get(shape)
+    if shape == "polygon":
+        if not match["sides"]:
+            return None
+        sides = int(match["sides"])
+        if not 3 <= sides <= 20:
+            return None
+
+    size = _parse_number(match["size"], 2)
+    if not 0.1 <= size <= 3.5:
+        return None
+
+    if shape == "circle":
+        mobject = f"Circle(radius={size})"
+    elif shape == "square":
+        mobject = f"Square(side_length={size})"
+    else:
+        mobject = f"RegularPolygon(n={sides}, radius={size})"
+
+    return {"mobject": mobject, "color": _parse_color(match["color"]), "name": shape}
+
+
+def _transform_slots(match):
+    """Slots of the shape morphing template"""
+    mobjects = {
+        "circle": "Circle(radius=2)",
+        "square": "Square(side_length=3)",
+        "triangle": "Triangle().scale(2)",
+        "star": "Star(outer_radius=2)",
+        "hexagon": "RegularPolygon(n=6, radius=2)"
+    }
+    if match["source"] == match["target"]:
+        return None
+    return {
+        "source": mobjects[match["source"]],
+        "target": mobjects[match["target"]],
+        "source_color": _parse_color(match["source_color"]),
+        "target_color": _parse_color(match["target_color"] or "red")
+    }
+
+
+# Slots captured verbatim from the prompt rather than from a fixed vocabulary
+FREE_FORM_SLOTS = ("expression", "equation")
+
+SHAPES = r"circle|square|triangle|pentagon|hexagon|octagon|polygon"
+MORPH_SHAPES = r"circle|square|triangle|star|hexagon"
+
+# Each template: regexes that must match the whole (normalized) prompt, a
+# function turning the match into slot values (None when they don't fit the
+# template) and the scene code, filled in with string.Template.
+TEMPLATES = [
+    {
+        "name": "function_plot",
+        "patterns": [
+            PREFIX + r"(?:plot|graph|draw|show|visuali[sz]e)\s+(?:me\s+)?(?:the\s+|a\s+)?(?:graph\s+of\s+)?(?:the\s+)?"
+            r"(?:function\s+)?(?P<expression>.+?)"
+            r"(?:\s+(?:from|for|over|on|between)\s+(?:x\s*=\s*)?(?P<x_min>-?\d+(?:\.\d+)?)\s+(?:to|and)\s+(?P<x_max>-?\d+(?:\.\d+)?))?"
+            r"(?:\s+in\s+(?P<color>" + COLOR_PATTERN + r"))?",
+        ],
+        "slots": _plot_slots,
+        "example": "plot y = x^2 - 2x from -3 to 5",
+        "code": Template('''from manim import *
+import numpy as np
+
+
+class FunctionPlot(Scene):
+    def construct(self):
+        axes = Axes(
+            x_range=[$x_min, $x_max, $x_step],
+            y_range=[$y_min, $y_max, $y_step],
+            x_length=10,
+            y_length=6,
+            axis_config={"include_numbers": True, "font_size": 24},
+        )
+        labels = axes.get_axis_labels(x_label="x", y_label="y")
+        graph = axes.plot(lambda x: $function, x_range=[$x_min, $x_max], color=$color)
+        label = Text($label_literal, font_size=32).to_corner(UL)
+
+        self.play(Create(axes), Write(labels))
+        self.play(Create(graph), run_time=2)
+        self.play(Write(label))
+        self.wait(2)
+'''),
+    },
+    {
+        "name": "equation",
+        "patterns": [
+            PREFIX + r"(?:animate|write|show|display|present|typeset)\s+(?:out\s+)?(?:the\s+)?"
+            r"(?:equation|formula|expression|identity)\s*:?\s*(?P<equation>.+)",
+            PREFIX + r"(?:write|typeset)\s+(?P<equation>.*=.*)",
+        ],
+        "slots": _equation_slots,
+        "example": "animate the equation e^{i\\pi} + 1 = 0",
+        "code": Template('''from manim import *
+
+
+class EquationScene(Scene):
+    def construct(self):
+        equation = MathTex($equation_literal).scale(1.5)
+        box = SurroundingRectangle(equation, color=YELLOW, buff=0.3)
+
+        self.play(Write(equation), run_time=2)
+        self.play(Create(box))
+        self.wait(2)
+'''),
+    },
+    {
+        "name": "shape",
+        "patterns": [
+            PREFIX + r"(?:(?:draw|construct|show|create|animate)\s+)?(?:an?\s+|the\s+)?(?:(?P<color>" + COLOR_PATTERN + r")\s+)?"
+            r"(?:regular\s+)?(?P<shape>" + SHAPES + r")"
+            r"(?:\s+with\s+(?P<sides>\d+)\s+sides)?"
+            r"(?:\s+(?:of|with)\s+(?:radius|side(?:\s+length)?|size)\s+(?P<size>\d+(?:\.\d+)?))?"
+            r"(?:\s+in\s+(?P<color_after>" + COLOR_PATTERN + r"))?",
+        ],
+        "slots": lambda match: _shape_slots({**match, "color": match["color"] or match["color_after"]}),
+        "example": "draw a regular polygon with 7 sides",
+        "code": Template('''from manim import *
+
+
+class ShapeConstruction(Scene):
+    def construct(self):
+        shape = $mobject.set_color($color)
+        shape.set_fill($color, opacity=0.3)
+        center = Dot(ORIGIN)
+        label = Text($name_literal, font_size=36).next_to(shape, DOWN)
+
+        self.play(Create(center))
+        self.play(Create(shape), run_time=2)
+        self.play(Write(label))
+        self.wait(2)
+'''),
+    },
+    {
+        "name": "shape_transform",
+        "patterns": [
+            PREFIX + r"(?:transform|morph|turn|change)\s+(?:an?\s+|the\s+)?(?:(?P<source_color>" + COLOR_PATTERN + r")\s+)?"
+            r"(?P<source>" + MORPH_SHAPES + r")\s+(?:into|to)\s+(?:an?\s+|the\s+)?"
+            r"(?:(?P<target_color>" + COLOR_PATTERN + r")\s+)?(?P<target>" + MORPH_SHAPES + r")",
+        ],
+        "slots": _transform_slots,
+        "example": "transform a blue square into a red circle",
+        "code": Template('''from manim import *
+
+
+class ShapeTransform(Scene):
+    def construct(self):
+        source = $source.set_color($source_color)
+        source.set_fill($source_color, opacity=0.5)
+        target = $target.set_color($target_color)
+        target.set_fill($target_color, opacity=0.5)
+
+        self.play(Create(source))
+        self.wait(0.5)
+        self.play(Transform(source, target), run_time=2)
+        self.wait(2)
+'''),
+    },
+]
+
+for _template in TEMPLATES:
+    _template["compiled"] = [re.compile(pattern) for pattern in _template["patterns"]]
+
+
+def normalize_prompt(prompt):
+    """Lowercase a prompt and strip whitespace and trailing punctuation (equations keep their case)"""
+    return re.sub(r"\s+", " ", prompt).strip().rstrip(".!?").strip()
+
+
+def render_template(template, slots):
+    """
+    Fill in the scene code of a template
+
+    String slots are also available as Python literals (<slot>_literal), which
+    is how user text must be embedded in the code.
+    """
+    values = dict(slots)
+    for key, value in slots.items():
+        if isinstance(value, str):
+            values[f"{key}_literal"] = repr(value)
+    return template["code"].substitute(values)
+
+
+def match_template(prompt, threshold=None):
+    """
+    Map a prompt to a scene template and its parameters
+
+    A template matches when one of its patterns covers the whole prompt
+    (after stripping filler such as "please create an animation of") and the
+    captured slots are valid. Confidence is the share of the prompt the
+    pattern accounts for, excluding free-form slots, so prompts with extra
+    instructions the template can't honour fall through to the LLM.
+
+    Args:
+        prompt (str): User prompt
+        threshold (float): Minimum confidence (defaults to TEMPLATE_MATCH_THRESHOLD)
+
+    Returns:
+        dict: name, slots, confidence and code of the best match, or None
+    """
+    threshold = TEMPLATE_MATCH_THRESHOLD if threshold is None else threshold
+    normalized = normalize_prompt(prompt)
+    if len(normalized) > 300:
+        return None
+    lowered = normalized.lower()
+    best = None
+
+    for template in TEMPLATES:
+        for pattern in template["compiled"]:
+            # Prompts are matched case-insensitively, only free-form slots keep their case
+            match = pattern.fullmatch(lowered)
+            if not match:
+                continue
+
+            groups = {}
+            for name in pattern.groupindex:
+                start, end = match.span(name)
+                source = normalized if name in FREE_FORM_SLOTS else lowered
+                groups[name] = source[start:end] if start >= 0 else None
+
+            slots = template["slots"](groups)
+            if slots is None:
+                continue
+
+            # Long free-form slots mean the prompt is mostly unparsed text
+            free_text = max((len(groups.get(name) or "") for name in FREE_FORM_SLOTS), default=0)
+            confidence = 1.0 - max(0, free_text - 40) / max(len(normalized), 1)
+            if best is None or confidence > best["confidence"]:
+                best = {"name": template["name"], "slots": slots, "confidence": confidence, "template": template}
+
+    if not best or best["confidence"] < threshold:
+        return None
+
+    return {
+        "name": best["name"],
+        "slots": best["slots"],
+        "confidence": best["confidence"],
+        "code": render_template(best["template"], best["slots"])
+    }
+
+
+def generate_from_template(prompt):
+    """
+    Generate manim code from the template library, recording hit statistics
+
+    Args:
+        prompt (str): User prompt
+
+    Returns:
+        str: Scene code, or None if no template matches confidently
+    """
+    if not TEMPLATES_ENABLED:
+        return None
+
+    try:
+        match = match_template(prompt)
+    except Exception as e:
+        # A broken template must never block generation
+        logger.warning(f"Template matching failed: {str(e)}")
+        match = None
+
+    with _stats_lock:
+        if match:
+            _stats["hits"] += 1
+            _stats["by_template"][match["name"]] = _stats["by_template"].get(match["name"], 0) + 1
+        else:
+            _stats["misses"] += 1
+
+    if match:
+        logger.info(f"Prompt matched template {match['name']} ({match['confidence']:.2f}): {match['slots']}")
+        return match["code"]
+
+    return None
+
+
+def get_template_stats():
+    """Template hit/miss counters of this process"""
+    with _stats_lock:
+        return {"hits": _stats["hits"], "misses": _stats["misses"], "by_template": dict(_stats["by_template"])}
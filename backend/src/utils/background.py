@@ -0,0 +1,54 @@
+import threading
+from src.utils.metrics import gauge
+from src.utils.log import get_logger, get_log_context, log_context
+
+logger = get_logger(__name__)
+
+# Background jobs currently running in this process
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+
+JOBS_IN_FLIGHT = gauge("background_jobs_in_flight", "Background jobs running by function", ["job"])
+
+
+def run_in_background(app, target, *args, **kwargs):
+    """
+    Run a function in a background thread inside the Flask application context
+
+    Args:
+        app: Flask application instance (use current_app._get_current_object())
+        target (callable): Function to run
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        threading.Thread: The started thread
+    """
+    # The job logs with the context of the request that started it (video_id, user_id)
+    context = get_log_context()
+    context.pop("attempt", None)
+
+    def run():
+        JOBS_IN_FLIGHT.inc(job=target.__name__)
+        try:
+            with app.app_context(), log_context(**context, job=target.__name__):
+                target(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Background job {target.__name__} failed: {str(e)}", exc_info=True, extra=context)
+        finally:
+            JOBS_IN_FLIGHT.dec(job=target.__name__)
+            with _active_jobs_lock:
+                _active_jobs.discard(thread)
+
+    thread = threading.Thread(target=run, name=f"bg-{target.__name__}", daemon=True)
+    with _active_jobs_lock:
+        _active_jobs.add(thread)
+    thread.start()
+
+    return thread
+
+
+def active_background_jobs():
+    """Get the number of background jobs still running"""
+    with _active_jobs_lock:
+        return len(_active_jobs)
@@ -6,6 +6,10 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# How long an operation waits for a reachable MongoDB server before failing
+# (pymongo's default of 30 seconds would also hold readiness probes)
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000))
+
 def init_db(app):
     """
     Initialize database connection
@@ -22,7 +26,9 @@ def init_db(app):
     # Configure Flask app with MongoDB
     app.config["MONGO_URI"] = mongodb_uri
     
-    # Create PyMongo instance
-    mongo = PyMongo(app)
+    # Create PyMongo instance; the client only connects on the first
+    # operation, so startup doesn't wait on the database and gunicorn workers
+    # don't share connections opened before the fork
+    mongo = PyMongo(app, connect=False, serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS)
     
     return mongo.db
\ No newline at end of file
@@ -0,0 +1,227 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Minimum level of the records written (DEBUG also logs generated code and manim output)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# "json" writes one JSON object per line, "text" a human readable line
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+
+# Longer strings (code, stderr, stdout) are cut in the middle
+LOG_MAX_FIELD_LENGTH = int(os.environ.get("LOG_MAX_FIELD_LENGTH", 2000))
+
+# Records waiting to be written; when the queue is full new records are
+# dropped rather than blocking the thread that logs them
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+# Environment variables whose values never appear in logs
+SECRET_ENV_VARS = (
+    "OPENAI_API_KEY",
+    "JWT_SECRET_KEY",
+    "CLOUDFLARE_R2_SECRET_ACCESS_KEY",
+    "CLOUDFLARE_R2_ACCESS_KEY_ID",
+    "MONGODB_URI",
+)
+
+# Secrets recognizable by their shape
+SECRET_PATTERNS = (
+    (re.compile(r"sk-[A-Za-z0-9_\-]{16,}"), "sk-***"),
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9_\-\.=]+"), r"\1***"),
+    (re.compile(r"(?i)((?:api[_-]?key|password|secret|token)[\"']?\s*[:=]\s*[\"']?)[^\s\"',}]+"), r"\1***"),
+    (re.compile(r"(mongodb(?:\+srv)?://[^:/\s]+:)[^@\s]+@"), r"\1***@"),
+)
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Fields describing the current job (video_id, user_id, attempt, ...)
+_log_context = contextvars.ContextVar("log_context", default={})
+
+_listener = None
+_listener_pid = None
+_setup_lock = threading.Lock()
+_dropped_records = 0
+
+
+def get_logger(name):
+    """Get a logger (records go through the queue set up by setup_logging)"""
+    return logging.getLogger(name)
+
+
+def get_log_context():
+    """Fields added to every record logged from the current request or job"""
+    return dict(_log_context.get())
+
+
+def set_log_context(**fields):
+    """Add fields to the log context for the rest of the current request or job"""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+def clear_log_context():
+    """Drop the log context (at the start of a request, since server threads are reused)"""
+    _log_context.set({})
+
+
+@contextmanager
+def log_context(**fields):
+    """Add fields to the log context for the duration of a block"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def _secret_values():
+    values = []
+    for name in SECRET_ENV_VARS:
+        value = os.environ.get(name)
+        # Short values (e.g. "x" in tests) would redact unrelated text
+        if value and len(value) >= 8:
+            values.append(value)
+    return values
+
+
+def redact(text):
+    """Mask secrets in a string"""
+    for value in _secret_values():
+        text = text.replace(value, "***")
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def truncate(text, limit=None):
+    """Cut the middle of a long string, keeping its start and end"""
+    limit = limit or LOG_MAX_FIELD_LENGTH
+    if len(text) <= limit:
+        return text
+    head = limit * 2 // 3
+    tail = limit - head
+    return f"{text[:head]}...[{len(text) - limit} chars truncated]...{text[-tail:]}"
+
+
+def _clean(value):
+    if isinstance(value, str):
+        return truncate(redact(value))
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_clean(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _clean(item) for key, item in value.items()}
+    return truncate(redact(str(value)))
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+
+    def prepare(self, record):
+        # Resolve the message and traceback now (their arguments may change
+        # later); redaction, truncation and formatting happen in the listener
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.context = get_log_context()
+        return record
+
+    def enqueue(self, record):
+        global _dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped_records += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, context and extra fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _clean(record.getMessage()),
+        }
+        entry.update(_clean(getattr(record, "context", None) or {}))
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != "context":
+                entry[key] = _clean(value)
+        if record.exc_text:
+            entry["exception"] = _clean(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable lines with the context and extra fields appended as key=value"""
+
+    def format(self, record):
+        fields = dict(getattr(record, "context", None) or {})
+        fields.update({key: value for key, value in record.__dict__.items()
+                       if key not in _RECORD_ATTRIBUTES and key != "context"})
+        time_text = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+        line = f"{time_text} {record.levelname:<7} {record.name}: {_clean(record.getMessage())}"
+        if fields:
+            line += " " + " ".join(f"{key}={_clean(value)!r}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + _clean(record.exc_text)
+        return line
+
+
+def setup_logging():
+    """
+    Route every log record through a queue to a single writer thread, so
+    request and render threads never block on log I/O
+
+    Safe to call several times; after a fork (gunicorn workers) it starts the
+    writer thread of the new process.
+    """
+    global _listener, _listener_pid
+
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+
+        records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, _NonBlockingQueueHandler):
+                root.removeHandler(handler)
+        root.addHandler(_NonBlockingQueueHandler(records))
+        root.setLevel(LOG_LEVEL)
+
+        _listener = QueueListener(records, stream_handler)
+        _listener.start()
+        _listener_pid = os.getpid()
+        atexit.register(_stop_listener, _listener, _listener_pid)
+
+
+def _stop_listener(listener, pid):
+    """Write the records still queued at exit"""
+    # Forked workers inherit the exit hooks of the master
+    if pid != os.getpid():
+        return
+    try:
+        listener.stop()
+    except Exception:
+        pass
+    if _dropped_records:
+        sys.stderr.write(f"{_dropped_records} log records were dropped because the log queue was full\n")
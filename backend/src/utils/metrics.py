@@ -0,0 +1,395 @@
+import os
+import json
+import time
+import bisect
+import fcntl
+import threading
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Directory where every worker process publishes its metrics, so whichever
+# worker answers /metrics can report the totals of all of them. Without it
+# /metrics only reports the process that serves the request.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+
+# Seconds between two snapshots of this process written to METRICS_DIR
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+# Snapshot in METRICS_DIR accumulating the counters and histograms of exited
+# workers, so the totals never go down when a worker is recycled
+DEAD_SNAPSHOT = "metrics-dead.json"
+
+# Default histogram buckets
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = (10e3, 100e3, 500e3, 1e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_flush_thread = None
+
+
+class _Metric:
+    """Base class of the metric types: a name, help text, label names and values per label set"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """Values per label set, as JSON-serializable data"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+# How the values of a gauge in several worker processes are combined:
+# "sum" for per-process amounts (jobs in flight), "max"/"min" for values every
+# process shares (a setting, or a measurement inherited from the preloading
+# master), "pid" to report each process with a pid label
+GAUGE_MODES = ("sum", "max", "min", "pid")
+
+
+class Gauge(_Metric):
+    """Value that goes up and down (e.g. jobs in flight)"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode="sum"):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"Unknown multiprocess mode of {name}: {multiprocess_mode}")
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def track(self, **labels):
+        """Context manager incrementing the gauge for the duration of a block"""
+        gauge = self
+
+        class _Tracker:
+            def __enter__(self):
+                gauge.inc(**labels)
+
+            def __exit__(self, *exc_info):
+                gauge.dec(**labels)
+
+        return _Tracker()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            state["counts"][index] += 1
+            state["sum"] += value
+
+    def time(self, **labels):
+        """Context manager observing the duration of a block in seconds"""
+        histogram = self
+
+        class _Timer:
+            def __enter__(self):
+                self.started = time.monotonic()
+                return self
+
+            def __exit__(self, *exc_info):
+                histogram.observe(time.monotonic() - self.started, **labels)
+
+        return _Timer()
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            # Modules may be imported twice (e.g. app and wsgi); keep the first instance
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """Create (or get) a counter"""
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), multiprocess_mode="sum"):
+    """Create (or get) a gauge (see GAUGE_MODES for multiprocess_mode)"""
+    return _register(Gauge(name, documentation, labelnames, multiprocess_mode))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+    """Create (or get) a histogram"""
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def _snapshot():
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f"metrics-{pid}.json")
+
+
+def flush():
+    """Publish the metrics of this process to METRICS_DIR"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(temp_path, path)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge_snapshot(total, snapshot):
+    """
+    Add the counters, histograms and summed gauges of a snapshot to another
+    one. Gauges combined by max, min or pid only describe live processes and
+    are left out.
+    """
+    with _registry_lock:
+        registry = dict(_registry)
+
+    for name, values in snapshot.items():
+        metric = registry.get(name)
+        if isinstance(metric, Gauge) and metric.multiprocess_mode != "sum":
+            continue
+        merged = {tuple(key): value for key, value in total.get(name, [])}
+        for key, value in values:
+            key = tuple(key)
+            current = merged.get(key)
+            if not isinstance(value, dict):
+                merged[key] = (current or 0) + value
+            elif current is None:
+                merged[key] = {"counts": list(value["counts"]), "sum": value["sum"]}
+            elif len(current["counts"]) == len(value["counts"]):
+                current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                current["sum"] += value["sum"]
+        total[name] = [[list(key), value] for key, value in merged.items()]
+
+
+def _mark_processes_dead(paths):
+    """
+    Fold the snapshots of exited workers into DEAD_SNAPSHOT and remove them
+
+    A counter dropping when a worker exits would read as a counter reset to
+    rate() and increase(). Workers serving /metrics at the same time are
+    serialized with a file lock, so a snapshot is only folded in once.
+
+    Args:
+        paths (list): Snapshot files of exited workers
+    """
+    dead_path = os.path.join(METRICS_DIR, DEAD_SNAPSHOT)
+    with open(os.path.join(METRICS_DIR, ".dead.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = _read_snapshot(dead_path) or {}
+        merged = False
+        for path in paths:
+            # None if another worker folded it in meanwhile
+            snapshot = _read_snapshot(path)
+            if snapshot is not None:
+                _merge_snapshot(dead, snapshot)
+                merged = True
+
+        if merged:
+            temp_path = f"{dead_path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(dead, f)
+            os.replace(temp_path, dead_path)
+
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _collect():
+    """
+    (pid, snapshot) of every live process (this one fresh, the others as last
+    flushed), and (None, totals of the exited processes)
+    """
+    snapshots = [(os.getpid(), _snapshot())]
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return snapshots
+
+    dead_paths = []
+    for entry in os.scandir(METRICS_DIR):
+        if not entry.name.startswith("metrics-") or not entry.name.endswith(".json"):
+            continue
+        if entry.name == DEAD_SNAPSHOT:
+            continue
+        pid = int(entry.name[len("metrics-"):-len(".json")])
+        if pid == os.getpid():
+            continue
+        if not _process_alive(pid):
+            dead_paths.append(entry.path)
+            continue
+        snapshot = _read_snapshot(entry.path)
+        if snapshot is not None:
+            snapshots.append((pid, snapshot))
+
+    if dead_paths:
+        _mark_processes_dead(dead_paths)
+    dead = _read_snapshot(os.path.join(METRICS_DIR, DEAD_SNAPSHOT))
+    if dead:
+        snapshots.append((None, dead))
+
+    return snapshots
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """
+    Render the metrics of all worker processes in the Prometheus text format
+
+    Returns:
+        str: Metrics exposition (text/plain; version=0.0.4)
+    """
+    snapshots = _collect()
+    with _registry_lock:
+        metrics = list(_registry.values())
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+
+        # Combine the values of every process per label set
+        totals = {}
+        for pid, snapshot in snapshots:
+            for key, value in snapshot.get(metric.name, []):
+                key = tuple(key)
+                if isinstance(metric, Histogram):
+                    total = totals.setdefault(key, {"counts": [0] * (len(metric.buckets) + 1), "sum": 0.0})
+                    if len(value["counts"]) != len(total["counts"]):
+                        continue
+                    total["counts"] = [a + b for a, b in zip(total["counts"], value["counts"])]
+                    total["sum"] += value["sum"]
+                elif isinstance(metric, Gauge) and metric.multiprocess_mode != "sum":
+                    if metric.multiprocess_mode == "pid":
+                        totals[key + (str(pid),)] = value
+                    elif key not in totals:
+                        totals[key] = value
+                    else:
+                        totals[key] = (max if metric.multiprocess_mode == "max" else min)(totals[key], value)
+                else:
+                    totals[key] = totals.get(key, 0) + value
+
+        labelnames = metric.labelnames
+        if isinstance(metric, Gauge) and metric.multiprocess_mode == "pid":
+            labelnames += ("pid",)
+
+        for key, value in sorted(totals.items()):
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value["counts"]):
+                    cumulative += count
+                    labels = _format_labels(metric.labelnames, key, [("le", _format_number(bound))])
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(metric.labelnames, key)
+                lines.append(f"{metric.name}_sum{labels} {_format_number(value['sum'])}")
+                lines.append(f"{metric.name}_count{labels} {cumulative}")
+            else:
+                lines.append(f"{metric.name}{_format_labels(labelnames, key)} {_format_number(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_flusher():
+    """Periodically publish the metrics of this process (once per process, only with METRICS_DIR)"""
+    global _flush_thread
+
+    if _flush_thread is not None or not METRICS_DIR:
+        return
+
+    def loop():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                flush()
+            except Exception as e:
+                logger.warning(f"Could not publish metrics: {str(e)}")
+
+    _flush_thread = threading.Thread(target=loop, name="metrics-flusher", daemon=True)
+    _flush_thread.start()
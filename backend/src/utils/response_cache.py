@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from src.utils.metrics import counter
+
+# Serialized responses of completed videos kept per process
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+
+# Seconds a cached response is served without checking the video's version in
+# MongoDB. Updates made by this process evict entries right away; updates made
+# by other workers are picked up within this delay.
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 30))
+
+RESPONSE_CACHE_LOOKUPS = counter("response_cache_lookups_total", "Response cache lookups by result", ["result"])
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized API responses, keyed by (kind, video_id) and
+    tagged with the version of the video they were built from
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get an entry checked against MongoDB less than ttl seconds ago
+
+        Returns:
+            dict: The entry (body, etag, last_modified, user_id, version), or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry["checked_at"] > self.ttl:
+                RESPONSE_CACHE_LOOKUPS.inc(result="miss" if entry is None else "stale")
+                return None
+            self._entries.move_to_end(key)
+        RESPONSE_CACHE_LOOKUPS.inc(result="hit")
+        return entry
+
+    def revalidate(self, key, version):
+        """
+        Renew an expired entry if the video is still at the same version
+
+        Returns:
+            dict: The entry, or None if there is none for this version
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["version"] != version:
+                return None
+            entry["checked_at"] = time.monotonic()
+            self._entries.move_to_end(key)
+        RESPONSE_CACHE_LOOKUPS.inc(result="revalidated")
+        return entry
+
+    def put(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = {**entry, "checked_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, video_id):
+        """Drop every cached response of a video"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == video_id]:
+                del self._entries[key]
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Get the response cache of this process
+
+    Returns:
+        ResponseCache: The response cache
+    """
+    global _response_cache
+
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+
+    return _response_cache
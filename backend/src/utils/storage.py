@@ -0,0 +1,89 @@
+import os
+import re
+import hashlib
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Root directory for per-video files (the manim_videos volume in Docker)
+VIDEOS_DIR = os.environ.get("VIDEOS_DIR", os.path.join(os.getcwd(), "videos"))
+
+# Video directories used to live directly under VIDEOS_DIR, named after the video ID
+LEGACY_DIR_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def get_video_dir(video_id, create=False):
+    """
+    Get the directory of a video in the sharded layout (videos/ab/cd/<video_id>)
+
+    The shard names come from a hash of the video ID, so directories are spread
+    evenly no matter how IDs are generated.
+
+    Args:
+        video_id (str): ID of the video
+        create (bool): Create the directory if it doesn't exist
+
+    Returns:
+        str: Absolute path of the video directory
+    """
+    digest = hashlib.sha1(video_id.encode("utf-8")).hexdigest()
+    path = os.path.join(VIDEOS_DIR, digest[:2], digest[2:4], video_id)
+
+    if create:
+        os.makedirs(path, exist_ok=True)
+
+    return path
+
+
+def get_legacy_video_dir(video_id):
+    """Get the directory of a video in the old flat layout (videos/<video_id>)"""
+    return os.path.join(VIDEOS_DIR, video_id)
+
+
+def find_video_dir(video_id):
+    """
+    Find the existing directory of a video in either layout
+
+    Args:
+        video_id (str): ID of the video
+
+    Returns:
+        str: Path of the directory, or None if the video has no local files
+    """
+    for path in (get_video_dir(video_id), get_legacy_video_dir(video_id)):
+        if os.path.isdir(path):
+            return path
+
+    return None
+
+
+def migrate_video_dirs(dry_run=False):
+    """
+    Move video directories from the flat layout into the sharded layout
+
+    Args:
+        dry_run (bool): Only report what would be moved
+
+    Returns:
+        dict: Old path -> new path of every migrated directory
+    """
+    migrated = {}
+    if not os.path.isdir(VIDEOS_DIR):
+        return migrated
+
+    for entry in os.scandir(VIDEOS_DIR):
+        if not entry.is_dir() or not LEGACY_DIR_PATTERN.match(entry.name):
+            continue
+
+        target = get_video_dir(entry.name)
+        if os.path.exists(target):
+            logger.info(f"Skipping {entry.path}: {target} already exists")
+            continue
+
+        if not dry_run:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Same filesystem, so this is a cheap atomic rename
+            os.rename(entry.path, target)
+        migrated[entry.path] = target
+
+    return migrated
@@ -0,0 +1,66 @@
+import os
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Settings that depend on the user's subscription tier (free, basic, premium).
+# Every numeric value can be overridden with an environment variable named
+# <SETTING>_<TIER>, e.g. RENDER_TIMEOUT_FREE=120 or RENDER_MEMORY_LIMIT_PREMIUM=8192.
+# List values are comma separated, e.g. RENDER_QUALITIES_BASIC=low,high
+TIER_SETTINGS = {
+    "free": {
+        "render_timeout": 180,        # Wall-clock seconds allowed per manim process
+        "render_cpu_limit": 240,      # CPU seconds per manim process (RLIMIT_CPU)
+        "render_memory_limit": 2048,  # Address space in MB per manim process (RLIMIT_AS)
+        # Quality ladder: the first entry is published as a fast preview,
+        # the last one is the final quality rendered in the background
+        "render_qualities": ["low", "medium"],
+        # Candidate programs generated per codegen attempt; with more than one,
+        # candidates are dry-run in parallel and the first valid one is rendered
+        "codegen_candidates": 1,
+    },
+    "basic": {
+        "render_timeout": 420,
+        "render_cpu_limit": 600,
+        "render_memory_limit": 3072,
+        "render_qualities": ["low", "high"],
+        "codegen_candidates": 1,
+    },
+    "premium": {
+        "render_timeout": 900,
+        "render_cpu_limit": 1800,
+        "render_memory_limit": 4096,
+        "render_qualities": ["low", "high"],
+        "codegen_candidates": 3,
+    },
+}
+
+DEFAULT_TIER = "free"
+
+
+def get_tier_settings(tier):
+    """
+    Get the settings for a subscription tier, applying environment overrides
+
+    Args:
+        tier (str): Subscription tier name (unknown tiers fall back to free)
+
+    Returns:
+        dict: Settings for the tier
+    """
+    tier = tier if tier in TIER_SETTINGS else DEFAULT_TIER
+    settings = dict(TIER_SETTINGS[tier])
+
+    for key, default in settings.items():
+        env_value = os.environ.get(f"{key.upper()}_{tier.upper()}")
+        if env_value is None:
+            continue
+        try:
+            if isinstance(default, list):
+                settings[key] = [item.strip() for item in env_value.split(",") if item.strip()]
+            else:
+                settings[key] = type(default)(env_value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid value for {key.upper()}_{tier.upper()}: {env_value}")
+
+    return settings
@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+import requests
+from src.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Stages of the generation pipeline reported in a video's timing breakdown.
+# Every other span is only exported as detail.
+STAGES = ("generate", "validate", "render", "retry", "package", "upload")
+
+# Optional export of finished traces: "json" appends one trace per line to
+# TRACE_EXPORT_FILE, "otlp" posts them to an OTLP/HTTP collector
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "").lower()
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE", os.path.join(os.getcwd(), "traces.jsonl"))
+OTLP_ENDPOINT = os.environ.get("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+OTLP_SERVICE_NAME = os.environ.get("OTLP_SERVICE_NAME", "manim-ai-video")
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_export_queue = queue.Queue(maxsize=1000)
+_export_thread = None
+_export_thread_lock = threading.Lock()
+
+
+class Span:
+    """A timed step of a trace"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.span_id = os.urandom(8).hex()
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.started = time.monotonic()
+        self.duration = None
+        # Time spent in the nearest nested stage spans, excluded from this stage
+        self.nested_stage_time = 0.0
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.monotonic() - self.started
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start_time,
+            "duration": round(self.duration or 0.0, 4),
+            "attributes": self.attributes
+        }
+
+
+class Trace:
+    """The spans of one run of a pipeline (a request or a background job)"""
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, attributes=attributes)
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.root.name
+
+    @property
+    def attributes(self):
+        return self.root.attributes
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def stage_timings(self, root=None):
+        """
+        Seconds spent per pipeline stage, plus the total
+
+        A stage nested in another one (e.g. a code regeneration during a
+        render) only counts towards the inner stage.
+
+        Args:
+            root (Span): Only count the spans under this one (defaults to the whole trace)
+
+        Returns:
+            dict: Seconds per stage that occurred, and "total"
+        """
+        root = root or self.root
+        timings = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span.name in STAGES and span.duration is not None and _descends_from(span, root):
+                timings[span.name] = timings.get(span.name, 0.0) + span.duration - span.nested_stage_time
+
+        timings = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+        timings["total"] = round(root.duration or 0.0, 3)
+        return timings
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attributes": self.attributes,
+            "timings": self.stage_timings(),
+            "spans": [span.to_dict() for span in spans]
+        }
+
+
+class NestedRun:
+    """
+    A pipeline run started inside another trace (see start_trace), seen as a
+    trace of its own by on_end callbacks
+    """
+
+    def __init__(self, trace, root):
+        self.trace = trace
+        self.root = root
+
+    @property
+    def name(self):
+        return self.root.name
+
+    @property
+    def attributes(self):
+        return {**self.trace.attributes, **self.root.attributes}
+
+    def stage_timings(self):
+        return self.trace.stage_timings(root=self.root)
+
+
+def _descends_from(span, root):
+    while span is not None:
+        if span is root:
+            return True
+        span = span.parent
+    return False
+
+
+def current_trace():
+    """Get the trace of the current request or job (None outside of a trace)"""
+    return _current_trace.get()
+
+
+def set_trace_attribute(key, value):
+    """Set an attribute (e.g. video_id) on the current trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.root.set_attribute(key, value)
+
+
+def _nearest_stage(span):
+    while span is not None and span.name not in STAGES:
+        span = span.parent
+    return span
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block as a span of the current trace (a no-op outside of a trace)
+
+    Args:
+        name (str): Span name, one of STAGES for pipeline stages
+        **attributes: Span attributes (quality, model, ...)
+
+    Yields:
+        Span: The span, or None outside of a trace
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get() or trace.root
+    current = Span(name, parent, attributes)
+    trace.add_span(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set_attribute("error", type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+        if name in STAGES:
+            outer_stage = _nearest_stage(parent)
+            if outer_stage is not None:
+                outer_stage.nested_stage_time += current.duration
+
+
+@contextmanager
+def start_trace(name, on_end=None, **attributes):
+    """
+    Trace a pipeline run. Inside an existing trace this is a span of that
+    trace, and on_end gets the run's own timings (see NestedRun).
+
+    Args:
+        name (str): Name of the pipeline
+        on_end (callable): Called with the finished trace (e.g. to store its timings)
+        **attributes: Trace attributes (video_id, tier, ...)
+
+    Yields:
+        Trace: The trace
+    """
+    outer = _current_trace.get()
+    if outer is not None:
+        nested = None
+        try:
+            with span(name, **attributes) as nested:
+                yield outer
+        finally:
+            if on_end and nested is not None:
+                _call_on_end(on_end, NestedRun(outer, nested))
+        return
+
+    trace = Trace(name, attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except Exception as e:
+        trace.root.set_attribute("error", type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        trace.root.end()
+        if on_end:
+            _call_on_end(on_end, trace)
+        _export(trace)
+
+
+def _call_on_end(on_end, trace):
+    try:
+        on_end(trace)
+    except Exception as e:
+        logger.warning(f"Could not record trace {trace.name}: {str(e)}")
+
+
+def traced(name, on_end=None):
+    """
+    Decorator tracing every call of a function (see start_trace). A video_id
+    keyword argument, as passed to routes, becomes a trace attribute.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            attributes = {"video_id": kwargs["video_id"]} if "video_id" in kwargs else {}
+            with start_trace(name, on_end=on_end, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _export(trace):
+    """Hand a finished trace to the exporter thread, never blocking the pipeline"""
+    if TRACE_EXPORT not in ("json", "otlp"):
+        return
+
+    _start_exporter()
+    try:
+        _export_queue.put_nowait(trace)
+    except queue.Full:
+        logger.warning(f"Trace export queue is full, dropping trace {trace.name}")
+
+
+def _start_exporter():
+    global _export_thread
+
+    with _export_thread_lock:
+        if _export_thread is not None and _export_thread.is_alive():
+            return
+
+        def loop():
+            while True:
+                trace = _export_queue.get()
+                try:
+                    if TRACE_EXPORT == "json":
+                        _write_json(trace)
+                    else:
+                        _post_otlp(trace)
+                except Exception as e:
+                    logger.warning(f"Could not export trace {trace.name}: {str(e)}")
+
+        _export_thread = threading.Thread(target=loop, name="trace-exporter", daemon=True)
+        _export_thread.start()
+
+
+def _write_json(trace):
+    with open(TRACE_EXPORT_FILE, "a") as f:
+        f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+
+
+def _otlp_attributes(attributes):
+    result = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            result.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            result.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            result.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            result.append({"key": key, "value": {"stringValue": str(value)}})
+    return result
+
+
+def _post_otlp(trace):
+    """Send a trace to an OTLP/HTTP collector in the JSON encoding"""
+    with trace._lock:
+        spans = list(trace.spans)
+
+    otlp_spans = []
+    for item in spans:
+        start_ns = int(item.start_time * 1e9)
+        otlp_spans.append({
+            "traceId": trace.trace_id,
+            "spanId": item.span_id,
+            "parentSpanId": item.parent.span_id if item.parent else "",
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int((item.duration or 0.0) * 1e9)),
+            "attributes": _otlp_attributes(item.attributes)
+        })
+
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({"service.name": OTLP_SERVICE_NAME})},
+        "scopeSpans": [{"scope": {"name": "manim-ai-video"}, "spans": otlp_spans}]
+    }]}
+    response = requests.post(OTLP_ENDPOINT, json=payload, timeout=5)
+    response.raise_for_status()
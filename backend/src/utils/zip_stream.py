@@ -0,0 +1,70 @@
+import io
+import zipfile
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable sink collecting what zipfile writes until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def stream_zip(entries, chunk_size=1024 * 1024):
+    """
+    Yield a zip archive as it is written, without a temporary file
+
+    zipfile writes to an unseekable stream with data descriptors after each
+    member, so only the chunk being written and the central directory are
+    held in memory.
+
+    Args:
+        entries: Iterable of (zipfile.ZipInfo, data), data being bytes/str or an
+                 iterable of byte chunks. Members are read one at a time, as the
+                 archive is consumed.
+        chunk_size (int): Approximate size of the yielded chunks
+
+    Yields:
+        bytes: The next part of the archive
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for info, data in entries:
+            if isinstance(data, (bytes, str)):
+                archive.writestr(info, data)
+            else:
+                # The size of a streamed member isn't known up front
+                with archive.open(info, "w", force_zip64=True) as member:
+                    for chunk in data:
+                        member.write(chunk)
+                        if buffer.size >= chunk_size:
+                            yield buffer.drain()
+            if buffer.size:
+                yield buffer.drain()
+
+    # Central directory
+    yield buffer.drain()
+
+
+def read_file_chunks(path, chunk_size=1024 * 1024):
+    """Yield the content of a file in chunks (opened only when iteration starts)"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
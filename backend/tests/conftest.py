@@ -0,0 +1,99 @@
+import os
+
+# Configuration read at import time; no test talks to a real service
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-of-at-least-32-bytes")
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import mongomock
+import pytest
+from flask_jwt_extended import create_access_token
+from app import app as flask_app
+from src.utils.response_cache import get_response_cache
+
+
+@pytest.fixture
+def app():
+    """The Flask app backed by a fresh in-memory database"""
+    flask_app.config["TESTING"] = True
+    flask_app.mongo_db = mongomock.MongoClient().db
+    get_response_cache()._entries.clear()
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    """Authorization header of a user, by user ID"""
+    def headers(user_id="user-1"):
+        return {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+    return headers
+
+
+FAKE_MANIM = '''
+import hashlib, os, sys
+sys.path.insert(0, {services_dir!r})
+from manim_launcher import PARTIAL_MOVIE_CACHE_ENV, link_cached_file
+
+# Test double of manim: every self.play/self.wait line is an animation, hashed
+# by its text, and looked up in the partial movie directory like manim does
+args = sys.argv[1:]
+code_path, scene = args[0], args[1]
+media_dir = args[args.index("--media_dir") + 1]
+quality = {{"-ql": "480p15", "-qm": "720p30", "-qh": "1080p60", "-qp": "1440p60"}}[args[2]]
+module = os.path.splitext(os.path.basename(code_path))[0]
+quality_dir = os.path.join(media_dir, "videos", module, quality)
+partial_movie_dir = os.path.join(quality_dir, "partial_movie_files", scene)
+os.makedirs(partial_movie_dir, exist_ok=True)
+
+paths = []
+with open(code_path) as f:
+    animations = [line.strip() for line in f if line.strip().startswith(("self.play", "self.wait"))]
+for animation in animations:
+    name = hashlib.sha256(animation.encode()).hexdigest()[:16] + ".mp4"
+    path = os.path.join(partial_movie_dir, name)
+    cache_dir = os.environ.get(PARTIAL_MOVIE_CACHE_ENV)
+    if not (cache_dir and link_cached_file(cache_dir, name, partial_movie_dir)):
+        with open(os.environ["FAKE_MANIM_LOG"], "a") as log:
+            log.write(animation + "\\n")
+        with open(path, "w") as f:
+            f.write(animation)
+    paths.append(path)
+
+with open(os.path.join(partial_movie_dir, "partial_movie_file_list.txt"), "w") as f:
+    f.write("".join(f"file '{{path}}'\\n" for path in paths))
+with open(os.path.join(quality_dir, scene + ".mp4"), "w") as f:
+    f.write("".join(open(path).read() for path in paths))
+'''
+
+
+@pytest.fixture
+def fake_manim(tmp_path, monkeypatch):
+    """
+    Render through a test double of manim backed by an empty partial movie
+    cache; returns a function giving (and resetting) the animations rendered
+    """
+    from src.services import manim_service, render_cache
+
+    launcher = tmp_path / "fake_manim.py"
+    launcher.write_text(FAKE_MANIM.format(services_dir=os.path.dirname(manim_service.__file__)))
+    log = tmp_path / "rendered.txt"
+    monkeypatch.setenv("FAKE_MANIM_LOG", str(log))
+    monkeypatch.setattr(manim_service, "MANIM_LAUNCHER", str(launcher))
+    monkeypatch.setattr(manim_service, "RENDER_SCRATCH_DIR", str(tmp_path / "scratch"))
+    monkeypatch.setattr(render_cache, "TEX_CACHE_ENABLED", False)
+    monkeypatch.setattr(render_cache, "partial_movie_cache", render_cache.SharedRenderCache(
+        str(tmp_path / "cache"), max_bytes=1024 * 1024, name="partial movie"
+    ))
+
+    def rendered():
+        animations = log.read_text().splitlines() if log.exists() else []
+        log.unlink(missing_ok=True)
+        return animations
+
+    return rendered
@@ -0,0 +1,114 @@
+import os
+import pytest
+from datetime import datetime, timedelta
+from src.services import janitor_service
+from src.utils import storage
+
+
+@pytest.fixture
+def videos_dir(app, tmp_path, monkeypatch):
+    path = str(tmp_path / "videos")
+    os.makedirs(path)
+    monkeypatch.setattr(storage, "VIDEOS_DIR", path)
+    monkeypatch.setattr(janitor_service, "VIDEOS_DIR", path)
+    monkeypatch.setattr(janitor_service, "cleanup_stale_scratch_dirs", lambda: 0)
+    monkeypatch.setattr(janitor_service, "_dir_sizes", {})
+    return path
+
+
+def _finished_video(app, video_id, updated_at):
+    app.mongo_db.videos.insert_one({"_id": video_id, "status": "completed", "updated_at": updated_at})
+    video_dir = storage.get_video_dir(video_id, create=True)
+    with open(os.path.join(video_dir, "video.mp4"), "wb") as f:
+        f.write(b"x" * 100)
+    with open(os.path.join(video_dir, "partial.tmp"), "wb") as f:
+        f.write(b"x" * 10)
+    return video_dir
+
+
+def test_pass_only_checks_videos_updated_since_the_previous_pass(app, videos_dir):
+    _finished_video(app, "old", datetime.utcnow() - timedelta(days=1))
+
+    assert janitor_service.run_janitor_pass()["videos_checked"] == 1
+    assert janitor_service.run_janitor_pass()["videos_checked"] == 0
+
+    new_dir = _finished_video(app, "new", datetime.utcnow())
+    result = janitor_service.run_janitor_pass()
+
+    assert result["videos_checked"] == 1
+    assert result["intermediate_bytes"] == 10
+    assert os.listdir(new_dir) == ["video.mp4"]
+
+
+def test_missing_state_file_triggers_a_full_pass(app, videos_dir):
+    _finished_video(app, "old", datetime.utcnow() - timedelta(days=1))
+    janitor_service.run_janitor_pass()
+
+    os.remove(os.path.join(videos_dir, janitor_service.JANITOR_STATE_FILE))
+
+    assert janitor_service.run_janitor_pass()["videos_checked"] == 1
+
+
+def test_disk_usage_follows_changed_directories(app, videos_dir):
+    video_dir = _finished_video(app, "video", datetime.utcnow())
+
+    assert janitor_service._videos_disk_usage() == 110
+
+    os.remove(os.path.join(video_dir, "partial.tmp"))
+    assert janitor_service._videos_disk_usage() == 100
+
+    with open(os.path.join(video_dir, "preview.jpg"), "wb") as f:
+        f.write(b"x" * 5)
+    assert janitor_service._videos_disk_usage() == 105
+
+
+class FakeS3:
+    def key_from_url(self, url):
+        return url.rsplit("/", 1)[-1]
+
+    def object_exists(self, key):
+        return True
+
+
+def _uploaded_video(app, video_id, last_used, updated_at=None):
+    video_dir = _finished_video(app, video_id, updated_at or datetime.utcnow())
+    video_path = os.path.join(video_dir, "video.mp4")
+    os.utime(video_path, (last_used, last_used))
+    app.mongo_db.videos.update_one(
+        {"_id": video_id},
+        {"$set": {"video_path": video_path, "s3_video_url": f"https://r2.example/{video_id}.mp4"}}
+    )
+    return video_path
+
+
+def test_eviction_candidates_only_grow_by_newly_uploaded_videos(app, videos_dir):
+    _uploaded_video(app, "first", 1000, updated_at=datetime.utcnow() - timedelta(days=1))
+    janitor_service.run_janitor_pass()
+    state = janitor_service._read_state()
+    assert state["evictable"] == {"first": 1000}
+
+    # Not updated since the previous pass: not stat'ed again
+    os.utime(os.path.join(storage.get_video_dir("first"), "video.mp4"), (3000, 3000))
+    _uploaded_video(app, "second", 2000)
+    janitor_service.run_janitor_pass()
+
+    assert janitor_service._read_state()["evictable"] == {"first": 1000, "second": 2000}
+
+
+def test_eviction_rechecks_videos_served_since_they_were_recorded(app, videos_dir, monkeypatch):
+    monkeypatch.setattr(janitor_service, "get_s3_service", FakeS3)
+    first = _uploaded_video(app, "first", 1000)
+    second = _uploaded_video(app, "second", 2000)
+    candidates = {"first": 1000, "second": 2000, "deleted": 500}
+
+    # Served after being recorded, so now the most recently used
+    os.utime(first, (3000, 3000))
+
+    with app.app_context():
+        freed = janitor_service.evict_uploaded_videos(150, candidates)
+
+    assert freed == 100
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert candidates == {"first": 3000}
+    assert app.mongo_db.videos.find_one({"_id": "second"})["video_path"] is None
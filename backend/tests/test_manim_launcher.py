@@ -0,0 +1,57 @@
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from src.services.manim_launcher import cached_partial_movie_lookup, cached_tex_file, cached_text_hash
+
+
+def _cached(cache_dir, name, content="cached"):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, name)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def test_partial_movie_lookup_links_the_animation_by_hash(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    _cached(cache_dir, "abc.mp4")
+    writer = SimpleNamespace(partial_movie_directory=tmp_path / "partial")
+
+    lookup = cached_partial_movie_lookup(
+        lambda file_writer, hash_invocation: (file_writer.partial_movie_directory / f"{hash_invocation}.mp4").exists(),
+        cache_dir,
+        {"movie_file_extension": ".mp4"}
+    )
+
+    assert lookup(writer, "abc")
+    assert not lookup(writer, "def")
+
+
+def test_tex_lookup_links_the_svg_named_after_the_tex_source(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    _cached(cache_dir, "0123abcd.svg")
+    tex_dir = tmp_path / "media" / "Tex"
+
+    def generate_tex_file(expression, environment=None, tex_template=None):
+        tex_dir.mkdir(parents=True, exist_ok=True)
+        tex_file = tex_dir / ("0123abcd.tex" if expression == "x^2" else "ffff.tex")
+        tex_file.write_text(expression)
+        return tex_file
+
+    generate = cached_tex_file(generate_tex_file, cache_dir)
+
+    # Same expression from another scene: the SVG is there before manim checks
+    assert generate("x^2").with_suffix(".svg").exists()
+    assert not generate("y^2").with_suffix(".svg").exists()
+
+
+def test_text_lookup_links_the_svg_named_after_the_text_hash(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    _cached(cache_dir, "hello.svg")
+    text_dir = tmp_path / "media" / "texts"
+    config = SimpleNamespace(get_dir=lambda key: Path(text_dir))
+
+    text_hash = cached_text_hash(lambda text, color: text.name, cache_dir, config)
+
+    assert text_hash(SimpleNamespace(name="hello"), "WHITE") == "hello"
+    assert os.listdir(text_dir) == ["hello.svg"]
@@ -0,0 +1,137 @@
+import time
+import threading
+import pytest
+from src.services import manim_service, render_cache
+from src.services.manim_service import RenderTimeout, plan_render_segments, render_video
+
+CODE = "from manim import *\n\nclass Spin(Scene):\n    def construct(self):\n        self.play(Rotate(Square()))\n"
+
+
+@pytest.fixture
+def code_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(manim_service, "RENDER_SCRATCH_DIR", str(tmp_path / "scratch"))
+    path = tmp_path / "animation.py"
+    path.write_text(CODE)
+    return str(path)
+
+
+def test_timeout_is_not_retried_with_regenerated_code(code_file, tmp_path, monkeypatch):
+    runs = []
+
+    def timed_out(*args, **kwargs):
+        runs.append(args)
+        raise RenderTimeout("Rendering exceeded the time limit of 180 seconds")
+
+    def regenerate(*args, **kwargs):
+        pytest.fail("code was regenerated after a timeout")
+
+    monkeypatch.setattr(manim_service, "run_cached_render", timed_out)
+    monkeypatch.setattr(manim_service, "_regenerate_code", regenerate)
+
+    with pytest.raises(RenderTimeout):
+        render_video(code_file, str(tmp_path / "out"), original_prompt="rotate a square", max_retries=3)
+
+    assert len(runs) == 1
+
+
+def test_render_errors_are_retried_with_regenerated_code(code_file, tmp_path, monkeypatch):
+    regenerated = []
+
+    def failed(command, *args, **kwargs):
+        raise RuntimeError("manim crashed")
+
+    def regenerate(prompt, error_message, limits, cause):
+        regenerated.append(cause)
+        return CODE
+
+    monkeypatch.setattr(manim_service, "run_cached_render", failed)
+    monkeypatch.setattr(manim_service, "_regenerate_code", regenerate)
+
+    with pytest.raises(Exception, match="after 3 attempts"):
+        render_video(code_file, str(tmp_path / "out"), original_prompt="rotate a square", max_retries=3)
+
+    assert regenerated == ["render_error", "render_error"]
+
+
+def test_render_failures_count_against_the_model(code_file, tmp_path, monkeypatch):
+    outcomes = []
+
+    def failed(*args, **kwargs):
+        raise RuntimeError("manim crashed")
+
+    monkeypatch.setattr(manim_service, "_report_render_outcome", lambda code, success: outcomes.append(success))
+    monkeypatch.setattr(manim_service, "run_cached_render", failed)
+    monkeypatch.setattr(manim_service, "_regenerate_code", lambda *args: CODE)
+
+    with pytest.raises(Exception):
+        render_video(code_file, str(tmp_path / "out"), original_prompt="rotate a square", max_retries=2)
+
+    assert outcomes == [False, False]
+
+
+def test_programs_sharing_an_animation_reuse_its_partial_movie(fake_manim, tmp_path):
+    first = tmp_path / "first.py"
+    first.write_text(CODE + "        self.wait(1)\n")
+    second = tmp_path / "second.py"
+    second.write_text(CODE.replace("Spin", "Other") + "        self.play(FadeOut(Square()))\n")
+
+    render_video(str(first), str(tmp_path / "out"), max_retries=1, quality="low")
+    assert fake_manim() == ["self.play(Rotate(Square()))", "self.wait(1)"]
+
+    output_path = render_video(str(second), str(tmp_path / "out"), max_retries=1, quality="low")
+    assert fake_manim() == ["self.play(FadeOut(Square()))"]
+    with open(output_path) as f:
+        assert f.read() == "self.play(Rotate(Square()))self.play(FadeOut(Square()))"
+    assert render_cache.get_partial_movie_cache().stats() == {"hits": 1, "misses": 3, "hit_rate": 0.25}
+
+
+def _scene(animations, sections=()):
+    lines = ["from manim import *", "", "class Steps(Scene):", "    def construct(self):"]
+    for index in range(animations):
+        if index in sections:
+            lines.append("        self.next_section()")
+        lines.append(f"        self.play(FadeIn(Text('{index}')))")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("animations,max_segments", [(5, 4), (6, 6), (7, 3), (12, 8)])
+def test_segments_cover_every_animation_once(animations, max_segments, monkeypatch):
+    monkeypatch.setattr(manim_service, "MIN_PARALLEL_ANIMATIONS", 2)
+
+    segments = plan_render_segments(_scene(animations), "Steps", max_segments)
+
+    assert 1 < len(segments) <= max_segments
+    assert segments[0][0] == 0 and segments[-1][1] is None
+    for (first, last), (next_first, _) in zip(segments, segments[1:]):
+        # An upper bound of 0 would be read by manim as no bound at all
+        assert 0 < last and first <= last and next_first == last + 1
+
+
+def test_first_segment_never_ends_at_animation_zero(monkeypatch):
+    monkeypatch.setattr(manim_service, "MIN_PARALLEL_ANIMATIONS", 2)
+
+    assert plan_render_segments(_scene(5), "Steps", 4)[0] != (0, 0)
+    assert plan_render_segments(_scene(2), "Steps", 2) is None
+    assert plan_render_segments(_scene(4, sections=(1, 3)), "Steps", 4) == [(0, 2), (3, None)]
+
+
+def test_segment_timeout_aborts_the_other_segments(tmp_path, monkeypatch):
+    aborted = []
+
+    def run(command, media_dir, *args, cancel_event, **kwargs):
+        if command[-1] == "0,2":
+            raise RenderTimeout("Rendering exceeded the time limit of 180 seconds")
+        aborted.append(cancel_event.wait(timeout=5))
+        raise manim_service.RenderCancelled("Render was cancelled")
+
+    monkeypatch.setattr(manim_service, "run_cached_render", run)
+
+    started = time.monotonic()
+    with pytest.raises(RenderTimeout):
+        manim_service._render_segments(
+            ["manim", "scene.py", "Steps"], [(0, 2), (3, 5), (6, None)], str(tmp_path / "segments"),
+            "scene", "Steps", "low", str(tmp_path / "out.mp4"), {}, "video-1", threading.Event(), None
+        )
+
+    assert aborted == [True, True]
+    assert time.monotonic() - started < 5
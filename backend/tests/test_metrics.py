@@ -0,0 +1,92 @@
+import json
+import os
+import pytest
+from src.utils import metrics
+from src.utils.metrics import Gauge, render_prometheus
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    """An empty registry, with two other live worker processes publishing to METRICS_DIR"""
+    monkeypatch.setattr(metrics, "_registry", {})
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_process_alive", lambda pid: True)
+
+    def publish(pid, snapshot):
+        with open(tmp_path / f"metrics-{pid}.json", "w") as f:
+            json.dump(snapshot, f)
+
+    return publish
+
+
+def _value(exposition, series):
+    for line in exposition.splitlines():
+        if line.startswith(series + " "):
+            return float(line.split()[-1])
+    return None
+
+
+def test_counters_and_default_gauges_are_summed_across_workers(registry):
+    requests = metrics.counter("test_requests_total", "Requests")
+    in_flight = metrics.gauge("test_in_flight", "Jobs in flight")
+    requests.inc(2)
+    in_flight.inc()
+    registry(101, {"test_requests_total": [[[], 3]], "test_in_flight": [[[], 2]]})
+    registry(102, {"test_requests_total": [[[], 5]], "test_in_flight": [[[], 1]]})
+
+    exposition = render_prometheus()
+
+    assert _value(exposition, "test_requests_total") == 10
+    assert _value(exposition, "test_in_flight") == 4
+
+
+def test_shared_gauges_are_not_multiplied_by_the_number_of_workers(registry):
+    startup = metrics.gauge("test_startup_seconds", "Startup", multiprocess_mode="max")
+    # Inherited from the master by every forked worker
+    startup.set(1.5)
+    registry(101, {"test_startup_seconds": [[[], 1.5]]})
+    registry(102, {"test_startup_seconds": [[[], 1.5]]})
+
+    assert _value(render_prometheus(), "test_startup_seconds") == 1.5
+
+
+def test_pid_gauges_report_every_worker(registry):
+    memory = metrics.gauge("test_memory_bytes", "Memory", ["kind"], multiprocess_mode="pid")
+    memory.set(10, kind="rss")
+    registry(101, {"test_memory_bytes": [[["rss"], 20]]})
+
+    exposition = render_prometheus()
+
+    assert _value(exposition, f'test_memory_bytes{{kind="rss",pid="{os.getpid()}"}}') == 10
+    assert _value(exposition, 'test_memory_bytes{kind="rss",pid="101"}') == 20
+
+
+def test_unknown_gauge_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Gauge("test_gauge", "Gauge", multiprocess_mode="average")
+
+
+def test_exited_workers_keep_counting_towards_counters_and_histograms(registry, monkeypatch, tmp_path):
+    requests = metrics.counter("test_requests_total", "Requests")
+    duration = metrics.histogram("test_duration_seconds", "Duration", buckets=(1, 10))
+    startup = metrics.gauge("test_startup_seconds", "Startup", multiprocess_mode="max")
+    requests.inc(2)
+    registry(101, {
+        "test_requests_total": [[[], 3]],
+        "test_duration_seconds": [[[], {"counts": [1, 1, 0], "sum": 5.5}]],
+        "test_startup_seconds": [[[], 9.0]]
+    })
+    registry(102, {"test_requests_total": [[[], 5]]})
+    monkeypatch.setattr(metrics, "_process_alive", lambda pid: pid != 101)
+
+    for _ in range(2):
+        exposition = render_prometheus()
+
+        assert _value(exposition, "test_requests_total") == 10
+        assert _value(exposition, "test_duration_seconds_count") == 2
+        assert _value(exposition, "test_duration_seconds_sum") == 5.5
+        # Only meaningful for live processes
+        assert _value(exposition, "test_startup_seconds") is None
+
+    assert not (tmp_path / "metrics-101.json").exists()
+    assert (tmp_path / "metrics-102.json").exists()
@@ -0,0 +1,50 @@
+import pytest
+from src.services import model_router, openai_service
+from src.services.model_router import ModelRouter, ROUTER_MIN_SAMPLES
+from src.services.openai_service import generate_manim_code
+
+CODE = "from manim import *\n\nclass Spin(Scene):\n    def construct(self):\n        self.play(Rotate(Square()))\n"
+SIMPLE_PROMPT = "rotate a square"
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = ModelRouter(fast_model="fast-model", strong_model="strong-model")
+    monkeypatch.setattr(model_router, "_model_router", router)
+    # No exploration, so choices are deterministic
+    monkeypatch.setattr(model_router, "ROUTER_EXPLORE_RATE", 0)
+    return router
+
+
+def test_complex_prompts_and_retries_use_the_strong_model(router):
+    assert router.choose(SIMPLE_PROMPT)["name"] == "fast-model"
+    assert router.choose(SIMPLE_PROMPT, escalate=True)["name"] == "strong-model"
+    assert router.choose("draw a circle, then morph it into a square")["name"] == "strong-model"
+
+
+def test_unreliable_fast_model_is_dropped_for_simple_prompts(router):
+    for _ in range(ROUTER_MIN_SAMPLES):
+        router.record("fast-model", 1.0, False)
+
+    assert router.choose(SIMPLE_PROMPT)["name"] == "strong-model"
+
+
+def test_render_outcome_is_recorded_against_the_model_that_generated_the_code(router):
+    router.track("fast-model", 1.5, CODE)
+    assert router.model_stats("fast-model")["requests"] == 0
+
+    router.record_outcome(CODE, False)
+    router.record_outcome(CODE, True)  # Already reported
+    router.record_outcome("# template code", True)  # Not generated by a model
+
+    assert router.model_stats("fast-model") == {"requests": 1, "success_rate": 0.0, "p50": 1.5, "p95": 1.5}
+
+
+def test_unvalidated_code_waits_for_its_render(router, monkeypatch):
+    monkeypatch.setattr(openai_service, "_request_completions", lambda *args: [CODE])
+
+    assert generate_manim_code(SIMPLE_PROMPT, use_cache=False) == CODE
+    assert router.model_stats("fast-model")["requests"] == 0
+
+    router.record_outcome(CODE, True)
+    assert router.model_stats("fast-model")["success_rate"] == 1.0
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from src.models.video import Video
+from src.services import prompt_index
+from src.services.prompt_index import PromptIndex, find_similar_code, index_rendered_video
+
+CODE = "from manim import *\n\nclass Spin(Scene):\n    def construct(self):\n        self.play(Rotate(Square()))\n"
+
+
+@pytest.fixture
+def index(app, monkeypatch):
+    index = PromptIndex(threshold=0.5)
+    # Only what this worker indexed itself, no periodic refresh from MongoDB
+    index._last_refresh = time.time()
+    monkeypatch.setattr(prompt_index, "_prompt_index", index)
+    return index
+
+
+def _completed_video(prompt="rotate a blue square", code=CODE, **fields):
+    video = Video(user_id="user-1", prompt=prompt, code=code, status="completed", **fields)
+    return video.save()
+
+
+def test_search_matches_similar_prompts_only():
+    index = PromptIndex(threshold=0.5)
+    index.add("v1", "rotate a blue square", CODE)
+
+    assert index.search("please rotate the blue square")["video_id"] == "v1"
+    assert index.search("rotate a blue square twice") is None
+    assert index.search("plot sin(x) from 0 to 5") is None
+
+
+def test_prompts_with_different_numbers_never_match():
+    index = PromptIndex(threshold=0.1)
+    index.add("v1", "plot sin(x) from 0 to 10", CODE)
+
+    assert index.search("plot sin(x) from 0 to 5") is None
+
+
+def test_remove_drops_the_entry_and_its_postings():
+    index = PromptIndex(threshold=0.5)
+    index.add("v1", "rotate a blue square", CODE)
+    index.remove("v1")
+
+    assert index.search("rotate a blue square") is None
+    assert index.postings == {}
+
+
+def test_oldest_entry_is_evicted_past_max_entries():
+    index = PromptIndex(threshold=0.5, max_entries=2)
+    index.add("v1", "rotate a blue square", CODE)
+    index.add("v2", "rotate a red circle", CODE)
+    index.add("v3", "rotate a green triangle", CODE)
+
+    assert set(index.entries) == {"v2", "v3"}
+
+
+def test_load_indexes_completed_generated_code(app):
+    _completed_video()
+    _completed_video(prompt="rotate a red circle", code_edited=True)
+    Video(user_id="user-1", prompt="rotate a green triangle", code=CODE, status="failed").save()
+
+    index = PromptIndex(threshold=0.5)
+    index.load(app.mongo_db)
+
+    assert len(index.entries) == 1
+    assert index.search("rotate a blue square")["code"] == CODE
+
+
+def test_refresh_picks_up_videos_completed_after_the_last_load(app):
+    video = Video(user_id="user-1", prompt="rotate a blue square", code=CODE, status="processing").save()
+    index = PromptIndex(threshold=0.5)
+    index.load(app.mongo_db)
+    assert index.entries == {}
+
+    # Completed by another worker after the load (created before it)
+    app.mongo_db.videos.update_one(
+        {"_id": video.id},
+        {"$set": {"status": "completed", "updated_at": datetime.utcnow() + timedelta(seconds=1)}}
+    )
+    index.load(app.mongo_db)
+
+    assert video.id in index.entries
+
+
+def test_refresh_drops_videos_edited_elsewhere(app):
+    video = _completed_video()
+    index = PromptIndex(threshold=0.5)
+    index.load(app.mongo_db)
+
+    app.mongo_db.videos.update_one(
+        {"_id": video.id},
+        {"$set": {"code_edited": True, "updated_at": datetime.utcnow() + timedelta(seconds=1)}}
+    )
+    index.load(app.mongo_db)
+
+    assert video.id not in index.entries
+
+
+def test_edited_code_is_never_indexed(index):
+    video = _completed_video(code_edited=True)
+    index_rendered_video(video)
+
+    assert index.entries == {}
+
+
+def test_deleted_video_is_not_reused(index):
+    video = _completed_video()
+    index_rendered_video(video)
+    assert find_similar_code("rotate a blue square") == CODE
+
+    # Deleted by another worker: this worker's index still has the entry
+    video.delete()
+
+    assert find_similar_code("rotate a blue square") is None
+    assert video.id not in index.entries
+
+
+def test_code_replaced_elsewhere_is_not_reused(index):
+    video = _completed_video()
+    index_rendered_video(video)
+
+    # Re-rendered with regenerated code by another worker
+    other = Video.find_by_id(video.id)
+    other.code = CODE.replace("Square", "Circle")
+    other.save(code_change_reason="regenerated")
+
+    assert find_similar_code("rotate a blue square") is None
+    assert video.id not in index.entries
@@ -0,0 +1,59 @@
+import os
+import time
+import pytest
+from src.services import render_cache
+from src.services.render_cache import SharedRenderCache
+from src.services.manim_launcher import link_cached_file
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedRenderCache(str(tmp_path / "cache"), max_bytes=1000, name="test")
+
+
+def _cache_file(cache, namespace, name, size=100, age=0):
+    path = os.path.join(cache.root, namespace, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_link_cached_file_links_by_name_and_marks_the_entry_as_used(cache, tmp_path):
+    path = _cache_file(cache, "480p15", "a.mp4", age=3600)
+    job_dir = str(tmp_path / "job")
+
+    assert link_cached_file(cache.namespace_dir("480p15"), "a.mp4", job_dir)
+    assert not link_cached_file(cache.namespace_dir("480p15"), "evicted.mp4", job_dir)
+
+    assert os.listdir(job_dir) == ["a.mp4"]
+    assert os.path.samefile(os.path.join(job_dir, "a.mp4"), path)
+    assert time.time() - os.stat(path).st_mtime < 60
+
+
+def test_publish_from_skips_linked_files(cache, tmp_path):
+    _cache_file(cache, "480p15", "a.mp4")
+    job_dir = str(tmp_path / "job")
+    link_cached_file(cache.namespace_dir("480p15"), "a.mp4", job_dir)
+    with open(os.path.join(job_dir, "b.mp4"), "wb") as f:
+        f.write(b"rendered")
+
+    linked = cache.cached_names(job_dir, "480p15")
+    assert linked == {"a.mp4"}
+    assert cache.publish_from(job_dir, "480p15", linked) == 1
+    assert sorted(os.listdir(os.path.join(cache.root, "480p15"))) == ["a.mp4", "b.mp4"]
+
+
+def test_evict_removes_least_recently_used_files_outside_the_grace_period(cache, monkeypatch):
+    monkeypatch.setattr(render_cache, "EVICTION_GRACE_PERIOD", 600)
+    oldest = _cache_file(cache, "480p15", "oldest.mp4", size=500, age=7200)
+    older = _cache_file(cache, "480p15", "older.mp4", size=500, age=3600)
+    recent = _cache_file(cache, "480p15", "recent.mp4", size=500, age=60)
+
+    assert cache.evict(force=True) == 2
+    assert not os.path.exists(oldest)
+    assert not os.path.exists(older)
+    # Over budget still, but possibly in use by a running job
+    assert os.path.exists(recent)
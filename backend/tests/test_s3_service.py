@@ -0,0 +1,142 @@
+import time
+import threading
+import pytest
+from src.services.s3_service import S3Service
+
+
+class FakeS3:
+    """In-memory stand-in for the boto3 client"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+        self.fail_uploads = False
+        # Called before an object is deleted, to interleave other operations
+        self.before_delete = None
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        if self.fail_uploads:
+            raise ConnectionError("upload interrupted")
+        self.uploads += 1
+        with open(Filename, "rb") as f:
+            self.objects[Key] = f.read()
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise KeyError(Key)
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        if self.before_delete:
+            self.before_delete()
+        self.objects.pop(Key, None)
+
+
+@pytest.fixture
+def s3(app, monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setenv("CLOUDFLARE_R2_BUCKET_NAME", "test-bucket")
+    monkeypatch.setenv("CLOUDFLARE_R2_PUBLIC_URL", "https://cdn.example.com")
+    monkeypatch.setattr(S3Service, "_create_client", staticmethod(lambda **config: fake))
+    service = S3Service()
+    service.fake = fake
+    return service
+
+
+@pytest.fixture
+def video_file(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"rendered video")
+    return str(path)
+
+
+def _record(app, key):
+    return app.mongo_db.storage_objects.find_one({"_id": key})
+
+
+def test_identical_files_are_uploaded_once_and_reference_counted(app, s3, video_file):
+    first = s3.store_file(video_file)
+    second = s3.store_file(video_file)
+
+    assert first == second
+    assert first["url"] == f"https://cdn.example.com/{first['key']}"
+    assert s3.fake.uploads == 1
+    assert _record(app, first["key"])["refcount"] == 2
+
+
+def test_object_is_deleted_with_its_last_reference(app, s3, video_file):
+    key = s3.store_file(video_file)["key"]
+    s3.store_file(video_file)
+
+    assert s3.release_object(key) is False
+    assert key in s3.fake.objects
+
+    assert s3.release_object(key) is True
+    assert key not in s3.fake.objects
+    assert _record(app, key) is None
+
+
+def test_failed_upload_rolls_back_its_reference(app, s3, video_file):
+    s3.fake.fail_uploads = True
+
+    with pytest.raises(ConnectionError):
+        s3.store_file(video_file)
+
+    assert app.mongo_db.storage_objects.count_documents({}) == 0
+
+
+def test_reference_without_a_finished_upload_is_not_trusted(app, s3, video_file):
+    key = S3Service.key_for_hash(S3Service.hash_file(video_file))
+    # Another writer took a reference and is still uploading (or crashed)
+    app.mongo_db.storage_objects.insert_one({"_id": key, "refcount": 1})
+
+    s3.store_file(video_file)
+
+    assert key in s3.fake.objects
+    assert _record(app, key)["uploaded"] is True
+    assert _record(app, key)["refcount"] == 2
+
+
+def test_directories_are_uploaded_once_per_content_hash(app, s3, tmp_path):
+    hls_dir = tmp_path / "hls"
+    hls_dir.mkdir()
+    (hls_dir / "master.m3u8").write_text("#EXTM3U\n")
+    (hls_dir / "segment0.ts").write_bytes(b"segment")
+
+    stored = s3.store_directory(str(hls_dir), "abc123", {".m3u8": "application/vnd.apple.mpegurl"})
+    s3.store_directory(str(hls_dir), "abc123", {})
+
+    assert stored["key"] == "hls/abc123/"
+    assert sorted(s3.fake.objects) == ["hls/abc123/master.m3u8", "hls/abc123/segment0.ts"]
+    assert s3.fake.uploads == 2
+    assert _record(app, "hls/abc123/")["refcount"] == 2
+
+
+def test_store_during_the_deletion_of_the_last_reference_uploads_again(app, s3, video_file):
+    key = s3.store_file(video_file)["key"]
+    stored = []
+
+    def store_concurrently():
+        with app.app_context():
+            stored.append(s3.store_file(video_file))
+
+    def before_delete():
+        # A new reference is taken while the released object is being deleted
+        thread = threading.Thread(target=store_concurrently)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while _record(app, key)["refcount"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        s3.fake.before_delete = None
+        s3.fake.thread = thread
+
+    s3.fake.before_delete = before_delete
+    assert s3.release_object(key) is True
+    s3.fake.thread.join(timeout=5)
+
+    assert stored and stored[0]["key"] == key
+    assert key in s3.fake.objects
+    assert s3.fake.uploads == 2
+    assert _record(app, key)["refcount"] == 1
+    assert _record(app, key)["uploaded"] is True
+    assert "deleting" not in _record(app, key)
@@ -0,0 +1,45 @@
+import ast
+import pytest
+from src.services.manim_service import check_manim_code
+from src.services.template_service import TEMPLATES, match_template, generate_from_template, get_template_stats
+
+
+@pytest.mark.parametrize("template", TEMPLATES, ids=lambda template: template["name"])
+def test_example_prompt_matches_its_template(template):
+    match = match_template(template["example"])
+
+    assert match is not None
+    assert match["name"] == template["name"]
+    assert check_manim_code(match["code"]) == (True, None)
+
+
+@pytest.mark.parametrize("template", TEMPLATES, ids=lambda template: template["name"])
+def test_generated_scene_only_imports_what_manim_provides(template):
+    code = match_template(template["example"], threshold=0)["code"]
+
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module]
+        else:
+            continue
+        # Scenes run from a scratch directory, outside of the backend package
+        assert all(module.split(".")[0] in ("manim", "numpy") for module in modules)
+
+
+def test_generate_from_template_counts_hits_and_misses():
+    before = get_template_stats()
+
+    assert generate_from_template(TEMPLATES[0]["example"]) is not None
+    assert generate_from_template("explain the french revolution with a timeline of its key events") is None
+
+    after = get_template_stats()
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"] + 1
+
+
+def test_extra_instructions_fall_through_to_the_llm():
+    prompt = "plot y = x^2 - 2x from -3 to 5 and then explain each step of completing the square with narration"
+
+    assert match_template(prompt) is None
@@ -0,0 +1,34 @@
+from src.utils.tracing import span, start_trace
+
+
+def test_nested_run_reports_its_own_stage_timings():
+    finished = []
+
+    with start_trace("render_final", on_end=finished.append, video_id="video-1"):
+        with span("render"):
+            pass
+        with start_trace("publish_hls", on_end=finished.append):
+            with span("package", kind="hls"):
+                pass
+            with span("upload", kind="hls"):
+                pass
+
+    nested, outer = finished
+    assert nested.name == "publish_hls"
+    assert nested.attributes["video_id"] == "video-1"
+    assert set(nested.stage_timings()) == {"package", "upload", "total"}
+    assert outer.name == "render_final"
+    assert set(outer.stage_timings()) == {"render", "package", "upload", "total"}
+
+
+def test_nested_run_is_recorded_when_it_fails():
+    finished = []
+
+    try:
+        with start_trace("render_final"):
+            with start_trace("publish_hls", on_end=finished.append):
+                raise ValueError("packaging failed")
+    except ValueError:
+        pass
+
+    assert [run.name for run in finished] == ["publish_hls"]
@@ -0,0 +1,123 @@
+from src.api import videos
+from src.api.videos import PINNED_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+from src.models.user import User
+from src.models.video import Video
+from src.utils import storage
+
+CODE = "from manim import *\n\nclass Spin(Scene):\n    def construct(self):\n        self.play(Rotate(Square()))\n"
+
+
+def _video(user_id="user-1", status="completed", **fields):
+    video = Video(user_id=user_id, prompt="rotate a blue square", code=CODE, status=status, **fields).save()
+    # With the version the save gave it
+    return Video.find_by_id(video.id)
+
+
+def test_metadata_is_revalidated_with_its_etag(client, auth_headers):
+    video = _video()
+
+    response = client.get(f"/api/videos/{video.id}", headers=auth_headers())
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+
+    response = client.get(f"/api/videos/{video.id}", headers={**auth_headers(), "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_etag_changes_when_the_video_changes(client, auth_headers):
+    video = _video()
+    etag = client.get(f"/api/videos/{video.id}", headers=auth_headers()).headers["ETag"]
+
+    video.update_status("failed")
+    response = client.get(f"/api/videos/{video.id}", headers={**auth_headers(), "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json()["status"] == "failed"
+
+
+def test_cached_response_answers_conditional_requests(client, auth_headers):
+    video = _video()
+    etag = client.get(f"/api/videos/{video.id}", headers=auth_headers()).headers["ETag"]
+
+    # Served from the response cache this time
+    response = client.get(f"/api/videos/{video.id}", headers={**auth_headers(), "If-None-Match": etag})
+
+    assert response.status_code == 304
+
+
+def test_only_the_current_version_of_a_completed_video_is_pinned(client, auth_headers):
+    video = _video()
+    processing = _video(status="processing")
+
+    pinned = client.get(f"/api/videos/{video.id}?version={video.version}", headers=auth_headers())
+    outdated = client.get(f"/api/videos/{video.id}?version={video.version - 1}", headers=auth_headers())
+    unfinished = client.get(f"/api/videos/{processing.id}?version={processing.version}", headers=auth_headers())
+
+    assert pinned.headers["Cache-Control"] == PINNED_CACHE_CONTROL
+    assert outdated.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+    assert unfinished.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+
+
+def test_code_has_its_own_etag(client, auth_headers):
+    video = _video()
+
+    metadata = client.get(f"/api/videos/{video.id}", headers=auth_headers())
+    response = client.get(f"/api/videos/{video.id}/code", headers=auth_headers())
+
+    assert response.status_code == 200
+    assert response.get_json()["code"] == CODE
+    assert response.headers["ETag"] != metadata.headers["ETag"]
+
+    response = client.get(f"/api/videos/{video.id}/code",
+                          headers={**auth_headers(), "If-None-Match": response.headers["ETag"]})
+
+    assert response.status_code == 304
+
+
+def test_conditional_request_of_another_user_is_refused(client, auth_headers):
+    video = _video()
+    etag = client.get(f"/api/videos/{video.id}", headers=auth_headers()).headers["ETag"]
+
+    response = client.get(f"/api/videos/{video.id}", headers={**auth_headers("user-2"), "If-None-Match": etag})
+
+    assert response.status_code == 403
+
+
+def test_video_list_etag_follows_the_videos_on_the_page(client, auth_headers):
+    video = _video()
+    _video()
+
+    response = client.get("/api/videos/", headers=auth_headers())
+    etag = response.headers["ETag"]
+
+    assert len(response.get_json()) == 2
+    assert client.get("/api/videos/", headers={**auth_headers(), "If-None-Match": etag}).status_code == 304
+
+    video.update_status("failed")
+
+    assert client.get("/api/videos/", headers={**auth_headers(), "If-None-Match": etag}).status_code == 200
+
+
+def test_editing_code_only_renders_the_edited_animation(app, client, auth_headers, fake_manim, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "VIDEOS_DIR", str(tmp_path / "videos"))
+    monkeypatch.setattr(videos, "_store_in_s3", lambda path: (None, None))
+    monkeypatch.setattr(videos, "_publish_thumbnails", lambda *args: None)
+    monkeypatch.setattr(videos, "run_in_background", lambda *args: None)
+    User(email="user@example.com", id="user-1").save()
+    video = _video(quality="low")
+    rendered_code = CODE + "        self.play(FadeOut(Square()))\n"
+    edited_code = CODE + "        self.play(FadeOut(Square(), run_time=2))\n"
+
+    response = client.put(f"/api/videos/{video.id}/code", json={"code": rendered_code}, headers=auth_headers())
+    assert response.status_code == 200
+    assert fake_manim() == ["self.play(Rotate(Square()))", "self.play(FadeOut(Square()))"]
+
+    response = client.put(f"/api/videos/{video.id}/code", json={"code": edited_code}, headers=auth_headers())
+    assert response.status_code == 200
+    assert fake_manim() == ["self.play(FadeOut(Square(), run_time=2))"]
+    assert Video.find_by_id(video.id).load_code() == edited_code
@@ -15,6 +15,10 @@ interface Video {
   created_at: string;
   video_path?: string;
   thumbnail_path?: string;
+  preview_url?: string;
+  quality?: string;
+  thumbnail_url?: string;
+  sprite_url?: string;
 }
 
 export default function Dashboard() {
@@ -87,11 +91,6 @@ export default function Dashboard() {
       setVideos([newVideo, ...videos]);
       setCurrentVideo(newVideo);
       setPrompt('');
-      
-      // If the video generation is asynchronous, poll for updates
-      if (newVideo.status === 'pending' || newVideo.status === 'processing') {
-        pollVideoStatus(newVideo.id);
-      }
     } catch (err: any) {
       setError(err.response?.data?.error || 'Failed to generate video. Please try again.');
       console.error(err);
@@ -100,37 +99,54 @@ export default function Dashboard() {
     }
   };
   
-  const pollVideoStatus = async (videoId: string) => {
-    // Poll the video status every 5 seconds
-    const intervalId = setInterval(async () => {
-      try {
-        const videoData = await videoAPI.getVideo(videoId);
-        
-        // Update the video in the videos array
-        setVideos(prevVideos => 
-          prevVideos.map(video => 
-            video.id === videoId ? { ...video, ...videoData } : video
-          )
-        );
-        
-        // Update current video if it's the one being polled
-        if (currentVideo?.id === videoId) {
-          setCurrentVideo(videoData);
-        }
-        
-        // If video is completed or failed, stop polling
-        if (videoData.status === 'completed' || videoData.status === 'failed') {
-          clearInterval(intervalId);
+  // Follow all pending videos with a single long-polling status request
+  // (restarted whenever the set of pending videos changes)
+  const pendingIds = videos
+    .filter(video => video.status === 'pending' || video.status === 'processing')
+    .map(video => video.id)
+    .join(',');
+  
+  useEffect(() => {
+    if (!pendingIds) return;
+    
+    let active = true;
+    let since: string | undefined;
+    
+    const followStatuses = async () => {
+      while (active) {
+        try {
+          const result = await videoAPI.getVideoStatuses(pendingIds.split(','), 25, since);
+          if (!active) break;
+          
+          // Answered without waiting (the server is busy): back off
+          const unchanged = result.fingerprint === since;
+          since = result.fingerprint;
+          
+          setVideos(prevVideos =>
+            prevVideos.map(video =>
+              result.videos[video.id] ? { ...video, ...result.videos[video.id] } : video
+            )
+          );
+          setCurrentVideo(prevVideo =>
+            prevVideo && result.videos[prevVideo.id] ? { ...prevVideo, ...result.videos[prevVideo.id] } : prevVideo
+          );
+          
+          if (unchanged) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+          }
+        } catch (error) {
+          console.error('Error polling video status:', error);
+          await new Promise(resolve => setTimeout(resolve, 5000));
         }
-      } catch (error) {
-        console.error('Error polling video status:', error);
-        clearInterval(intervalId);
       }
-    }, 5000);
+    };
     
-    // Clear interval on component unmount
-    return () => clearInterval(intervalId);
-  };
+    followStatuses();
+    
+    return () => {
+      active = false;
+    };
+  }, [pendingIds]);
   
   const handleViewCode = async () => {
     if (!currentVideo) return;
@@ -272,11 +288,12 @@ export default function Dashboard() {
                 <h2 className="text-xl font-semibold mb-4">Video Preview</h2>
                 
                 <div className="aspect-video bg-black rounded-lg mb-6 overflow-hidden">
-                  {currentVideo.status === 'completed' ? (
+                  {currentVideo.status === 'completed' || currentVideo.preview_url ? (
                     <video 
+                      key={`${currentVideo.id}-${currentVideo.status}`}
                       className="w-full h-full object-contain" 
                       controls
-                      poster={currentVideo.thumbnail_path || '/video-thumbnail.jpg'}
+                      poster={currentVideo.thumbnail_url || '/video-thumbnail.jpg'}
                     >
                       <source 
                         src={`${process.env.NEXT_PUBLIC_API_URL}/api/videos/${currentVideo.id}/file`} 
@@ -53,6 +53,16 @@ export const videoAPI = {
     const response = await api.get(`/api/videos/${videoId}`);
     return response.data;
   },
+  // Status of several videos in one request; with wait, the server holds the
+  // request until one of them changes (compared to the since fingerprint)
+  getVideoStatuses: async (videoIds: string[], wait = 0, since?: string) => {
+    const params = new URLSearchParams({ ids: videoIds.join(','), wait: String(wait) });
+    if (since) {
+      params.set('since', since);
+    }
+    const response = await api.get(`/api/videos/status?${params.toString()}`);
+    return response.data;
+  },
   generateVideo: async (prompt: string) => {
     const response = await api.post('/api/videos/generate', { prompt });
     return response.data;
@@ -61,6 +71,18 @@ export const videoAPI = {
     const response = await api.get(`/api/videos/${videoId}/code`);
     return response.data;
   },
+  updateVideoCode: async (videoId: string, code: string) => {
+    const response = await api.put(`/api/videos/${videoId}/code`, { code });
+    return response.data;
+  },
+  cancelVideo: async (videoId: string) => {
+    const response = await api.post(`/api/videos/${videoId}/cancel`);
+    return response.data;
+  },
+  deleteVideo: async (videoId: string) => {
+    const response = await api.delete(`/api/videos/${videoId}`);
+    return response.data;
+  },
   // Get the appropriate video URL - use S3 URL if available
   getVideoUrl: (video: any): string => {
     if (video.s3_video_url) {